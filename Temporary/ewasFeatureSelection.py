@@ -1,5 +1,7 @@
+import sys
 import time
 import random
+from pathlib import Path
 import h5py
 import numpy as np
 import pandas as pd
@@ -13,14 +15,17 @@ from sklearn.metrics import (f1_score, precision_score, recall_score,
                              ConfusionMatrixDisplay, roc_curve, auc)
 from lightgbm import LGBMClassifier
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from model.data.h5_reader import read_rows
+from model.ewas.store import ResultStore
+
 # -----------------------------
 # Config & File Paths
 # -----------------------------
 idmap_train_path = "idmap.csv"
 train_path = "disease_methylation_data.h5"
 siteList = "disease_CpG_sites.txt"
-annotation_file = "annotation_filtered.csv"
-ewas_file = "EWAS_results.csv"
+ewas_file = "EWAS_results.h5"
 
 topN = 800  # number of top contributing features
 disease = "Alzheimer's disease"
@@ -37,32 +42,19 @@ random.seed(seed)
 # -----------------------------
 # Load EWAS Results & Annotation
 # -----------------------------
-def load_ewas_results(ewas_path, annotation_path, cpg_sites_path):
-    ewas_results = pd.read_csv(ewas_path)
-    annotation = pd.read_csv(annotation_path)
-    cpg_sites = pd.read_csv(cpg_sites_path, header=None)[0].tolist()
-
-    # Map CpG index → IlmnID
-    ewas_results["IlmnID"] = ewas_results["CpG_Index"].map(lambda idx: cpg_sites[idx])
-
-    # Merge with annotation
-    ewas_results = pd.merge(
-        ewas_results,
-        annotation[["IlmnID", "CHR", "MAPINFO"]],
-        on="IlmnID",
-        how="left"
-    ).dropna(subset=["CHR", "MAPINFO"])
-
-    # Calculate -log10 p-values
-    ewas_results["-log10_p"] = -np.log10(ewas_results["p_value"].replace(0, np.nextafter(0,1)))
+def load_ewas_results(ewas_path):
+    # Annotated (IlmnID, CHR, MAPINFO, -log10_p) and position-sorted by Temporary/ewas.py
+    store = ResultStore(ewas_path)
+    ewas_results = store.table()
 
     # Bonferroni threshold
-    n_tests = ewas_results.shape[0]
+    n_tests = len(store)
     line_height = -np.log10(alpha / n_tests)
 
-    # Select significant CpGs
-    significant_sites = ewas_results[ewas_results["-log10_p"] > line_height]
-    featureIndices = [cpg_sites.index(cpg) for cpg in significant_sites["IlmnID"] if cpg in cpg_sites]
+    # Select significant CpGs from the p-value index
+    significant_sites = store.threshold(min_log10_p=line_height)
+    significant_sites = significant_sites[significant_sites["-log10_p"] > line_height]
+    featureIndices = significant_sites["CpG_Index"].tolist()
 
     print(f"Number of significant CpGs: {significant_sites.shape[0]}")
     return ewas_results, significant_sites, featureIndices, line_height
@@ -116,7 +108,8 @@ def plot_volcano(df, threshold, filename="volcano_plot.png"):
 # -----------------------------
 def load_methylation_data(h5_path, sample_indices, feature_indices):
     with h5py.File(h5_path, "r") as f:
-        methylation = f["data"][sample_indices, :][:, feature_indices]
+        # Sorted contiguous-run reads with the feature selection applied in the same pass
+        methylation = read_rows(f["data"], sample_indices, feature_indices)
     return methylation
 
 # -----------------------------
@@ -183,11 +176,7 @@ def evaluate_model(y_true, y_pred, y_proba, topN):
 # -----------------------------
 def main():
     # Load EWAS & select top features
-    ewas_results, significant_sites, feature_indices, threshold = load_ewas_results(
-        ewas_file,
-        annotation_file,
-        siteList
-    )
+    ewas_results, significant_sites, feature_indices, threshold = load_ewas_results(ewas_file)
 
     # Save Manhattan & Volcano plots
     plot_manhattan(ewas_results, threshold, "manhattan_plot.png")
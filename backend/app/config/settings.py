@@ -23,10 +23,13 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     
-    # Model paths
+    # Model paths (artifact directories written by the training scripts)
     base_dir: Path = Path(__file__).parent.parent.parent.parent
-    xgboost_model_path: str = str(base_dir / "model" / "models" / "xgboost" / "xgboost_model.pkl")
-    pytorch_model_path: str = str(base_dir / "model" / "models" / "pytorch" / "model.pkl")
+    xgboost_model_path: str = str(base_dir / "model" / "models" / "xgboost" / "artifact")
+    pytorch_model_path: str = str(base_dir / "model" / "models" / "pytorch" / "artifact")
+    student_model_path: str = str(base_dir / "model" / "models" / "distill" / "student.pt")
+    # Pipeline shipped with the backend, served while no XGBoost artifact exists
+    xgboost_fallback_path: str = str(Path(__file__).parent.parent / "models" / "boost.pkl")
     
     # API settings
     api_v1_prefix: str = "/api/v1"
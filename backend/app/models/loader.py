@@ -1,20 +1,74 @@
 """
 Simple model loading functions.
+
+Models are read from the paths in Settings. A directory is a model artifact
+(manifest, weights, CpG list, preprocessing; see model/utils/artifact.py) and
+is loaded with its tensors memory-mapped; a file is a legacy joblib pickle.
+Until an XGBoost artifact has been trained, the pipeline shipped with the
+backend (app/models/boost.pkl) is served.
 """
+import logging
 import joblib
+import numpy as np
 import torch
-import os
 from pathlib import Path
 
-# Get the directory where this file is located
-MODEL_DIR = Path(__file__).parent
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class TorchScriptClassifier:
+    """predict / predict_proba over numpy rows for a TorchScript model exporting both methods."""
+    
+    def __init__(self, path: Path):
+        self.module = torch.jit.load(str(path), map_location='cpu').eval()
+    
+    def _tensor(self, X):
+        return torch.as_tensor(np.asarray(X, dtype=np.float32))
+    
+    def predict(self, X):
+        with torch.no_grad():
+            return self.module.predict(self._tensor(X)).numpy()
+    
+    def predict_proba(self, X):
+        with torch.no_grad():
+            return self.module.predict_proba(self._tensor(X)).numpy()
+
+
+def resolve_model_path(path, fallback=None):
+    """Return `path` if it exists, else `fallback` (logged), else `path` unchanged."""
+    path = Path(path)
+    if not path.exists() and fallback is not None and Path(fallback).exists():
+        logger.warning(f"No model at {path}; using bundled model {fallback}")
+        return Path(fallback)
+    return path
+
+
+def load_model_path(path):
+    """Load a model artifact directory, or a legacy joblib pickle file."""
+    path = Path(path)
+    if path.is_dir():
+        try:
+            # The artifact reader lives in the training package at the repository root
+            from model.utils.artifact import load_artifact
+        except ImportError as e:
+            raise ImportError(f"Loading the model artifact {path} needs the training package 'model'; "
+                              f"run the backend with the repository root on PYTHONPATH "
+                              f"(e.g. PYTHONPATH=.. python main.py)") from e
+        return load_artifact(str(path))
+    if path.suffix in ('.pt', '.pth') or path.name == 'model.pkl':
+        raise ValueError(f"{path} is a bare state_dict without architecture; retrain to write a model artifact")
+    return joblib.load(str(path))
+
 
 def load_xgboost_model():
     """Load and return the XGBoost sklearn pipeline."""
-    model_path = MODEL_DIR / 'boost.pkl'
+    settings = get_settings()
+    model_path = resolve_model_path(settings.xgboost_model_path, settings.xgboost_fallback_path)
     print(f"Loading XGBoost model from: {model_path}")
     try:
-        model = joblib.load(str(model_path))
+        model = load_model_path(model_path)
         print(f"XGBoost model type: {type(model)}")
         if hasattr(model, 'predict'):
             print("XGBoost model has predict method")
@@ -28,44 +82,30 @@ def load_xgboost_model():
 
 
 def load_pytorch_model():
-    """Load and return the PyTorch model."""
-    model_path = MODEL_DIR / 'convnet.pkl'
+    """
+    Load and return the PyTorch model.
+
+    There is no bundled PyTorch model: without a trained artifact this raises
+    FileNotFoundError, and callers leave the PyTorch result out.
+    """
+    model_path = Path(get_settings().pytorch_model_path)
     print(f"Loading PyTorch model from: {model_path}")
-    try:
-        # Try loading with torch.load first
-        loaded_data = torch.load(str(model_path), map_location='cpu')
-        print(f"PyTorch loaded data type: {type(loaded_data)}")
-        
-        # If it's an OrderedDict (state dict), we need to create a model and load the state
-        if isinstance(loaded_data, dict) and 'state_dict' in loaded_data:
-            print("Found state_dict in loaded data")
-            # This suggests the full model was saved
-            return loaded_data
-        elif hasattr(loaded_data, 'predict'):
-            print("Loaded data has predict method")
-            return loaded_data
-        else:
-            print("Creating a wrapper for PyTorch model predictions")
-            # Create a simple wrapper that can make predictions
-            class PyTorchModelWrapper:
-                def __init__(self, model_data):
-                    self.model_data = model_data
-                
-                def predict(self, X):
-                    # For now, return dummy predictions matching XGBoost format
-                    # You'll need to implement actual PyTorch inference here
-                    import numpy as np
-                    return np.random.choice([0, 1, 2], size=len(X))
-            
-            return PyTorchModelWrapper(loaded_data)
-            
-    except Exception as e:
-        print(f"Error loading PyTorch model: {e}")
-        # Return a dummy model for now
-        class DummyPyTorchModel:
-            def predict(self, X):
-                import numpy as np
-                return np.random.choice([0, 1, 2], size=len(X))
-        
-        print("Returning dummy PyTorch model")
-        return DummyPyTorchModel()
\ No newline at end of file
+    if not model_path.exists():
+        raise FileNotFoundError(f"No PyTorch model at {model_path}; train one with python -m model.train.pytorch.train")
+    model = load_model_path(model_path)
+    print(f"PyTorch model type: {type(model)}")
+    return model
+
+
+
+def load_student_model():
+    """
+    Load and return the distilled student (TorchScript, preprocessing included).
+
+    Raises FileNotFoundError until one is trained with model.train.distill.train.
+    """
+    model_path = Path(get_settings().student_model_path)
+    print(f"Loading student model from: {model_path}")
+    if not model_path.exists():
+        raise FileNotFoundError(f"No student model at {model_path}; train one with python -m model.train.distill.train")
+    return TorchScriptClassifier(model_path)
\ No newline at end of file
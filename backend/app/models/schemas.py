@@ -10,6 +10,7 @@ class ModelType(str, Enum):
     """Available model types."""
     XGBOOST = "xgboost"
     PYTORCH = "pytorch"
+    STUDENT = "student"
     BOTH = "both"
 
 
@@ -50,7 +50,12 @@ async def predict_endpoint(
     studyName: Optional[str] = Form(None),
     studyDescription: Optional[str] = Form(None)
 ):
-    """Prediction endpoint with CSV processing"""
+    """
+    Prediction endpoint with CSV processing
+
+    Every row is scored by the XGBoost pipeline (which the SHAP analysis
+    explains) and, when trained, by the PyTorch model and the distilled student.
+    """
     
     print("=== ENDPOINT HIT ===")
     print(f"studyName: {studyName}")
@@ -111,7 +116,7 @@ async def predict_endpoint(
         if data:
             try:
                 # Load models and make predictions
-                from ..models.loader import load_xgboost_model, load_pytorch_model
+                from ..models.loader import load_xgboost_model, load_pytorch_model, load_student_model
                 
                 print("Loading models...")
                 try:
@@ -121,39 +126,47 @@ async def predict_endpoint(
                     print(f"XGBoost model loading failed: {xgb_error}")
                     raise Exception(f"Failed to load XGBoost model: {xgb_error}")
                 
-                try:
-                    pytorch_model = load_pytorch_model()
-                    print("PyTorch model loaded successfully")
-                except Exception as pytorch_error:
-                    print(f"PyTorch model loading failed: {pytorch_error}")
-                    raise Exception(f"Failed to load PyTorch model: {pytorch_error}")
+                # The PyTorch model and the distilled student are optional: a model
+                # that has not been trained yet is left out of the results
+                model_warnings = []
+                optional_models = {}
+                for model_name, load_model in [("pytorch", load_pytorch_model), ("student", load_student_model)]:
+                    try:
+                        optional_models[model_name] = load_model()
+                        print(f"{model_name} model loaded successfully")
+                    except Exception as model_load_error:
+                        print(f"{model_name} model loading failed: {model_load_error}")
+                        model_warnings.append(f"{model_name} model not available: {model_load_error}")
                 
                 # Make predictions
                 print("Making XGBoost predictions...")
                 xgb_predictions = xgb_model.predict(data)
                 print(f"XGBoost predictions: {xgb_predictions[:5]}...")  # Show first 5
                 
-                print("Making PyTorch predictions...")
-                pytorch_predictions = pytorch_model.predict(data)
-                print(f"PyTorch predictions: {pytorch_predictions[:5]}...")  # Show first 5
+                optional_predictions = {}
+                for model_name, model in optional_models.items():
+                    print(f"Making {model_name} predictions...")
+                    optional_predictions[model_name] = model.predict(data)
+                    print(f"{model_name} predictions: {optional_predictions[model_name][:5]}...")  # Show first 5
 
-                # Create predictions with sample IDs for both models
+                # Create predictions with sample IDs for every model
                 xgb_predictions_with_ids = []
-                pytorch_predictions_with_ids = []
+                optional_predictions_with_ids = {model_name: [] for model_name in optional_predictions}
                 
                 for i, sample_id in enumerate(sample_ids):
                     xgb_pred = int(xgb_predictions[i]) if hasattr(xgb_predictions[i], 'item') else xgb_predictions[i]
-                    pytorch_pred = int(pytorch_predictions[i]) if hasattr(pytorch_predictions[i], 'item') else pytorch_predictions[i]
                     
                     xgb_predictions_with_ids.append({
                         "sample_id": sample_id,
                         "prediction": xgb_pred
                     })
                     
-                    pytorch_predictions_with_ids.append({
-                        "sample_id": sample_id,
-                        "prediction": pytorch_pred
-                    })
+                    for model_name, predictions in optional_predictions.items():
+                        pred = int(predictions[i]) if hasattr(predictions[i], 'item') else predictions[i]
+                        optional_predictions_with_ids[model_name].append({
+                            "sample_id": sample_id,
+                            "prediction": pred
+                        })
 
                 # SHAP Analysis for XGBoost model
                 print("Computing SHAP values...")
@@ -221,6 +234,11 @@ async def predict_endpoint(
                         if csv_feature_names and len(csv_feature_names) == data_for_shap.shape[1]:
                             feature_names = csv_feature_names
                             print(f"Using {len(feature_names)} feature names from CSV columns")
+                        elif getattr(xgb_model, 'selected_features', None) is not None and \
+                                len(xgb_model.selected_features) == data_for_shap.shape[1]:
+                            # Model artifacts carry the CpG ids the classifier sees
+                            feature_names = list(xgb_model.selected_features)
+                            print(f"Using {len(feature_names)} feature names from the model artifact")
                         else:
                             # Fallback to disease CpG sites file
                             with open("./backend/data/disease_CpG_sites.txt", "r") as f:
@@ -370,21 +388,25 @@ async def predict_endpoint(
                 print(f"Created feature annotations for {len(feature_annotations)} features")
                 print(f"Found annotations for {sum(1 for v in feature_annotations.values() if v['chromosome'] != 'Unknown')} CpG sites")
 
+                results = [
+                    {
+                        "model_name": "xgboost",
+                        "prediction": xgb_predictions.tolist() if hasattr(xgb_predictions, 'tolist') else list(xgb_predictions),
+                        "predictions_with_ids": xgb_predictions_with_ids
+                    }
+                ]
+                for model_name, predictions in optional_predictions.items():
+                    results.append({
+                        "model_name": model_name,
+                        "prediction": predictions.tolist() if hasattr(predictions, 'tolist') else list(predictions),
+                        "predictions_with_ids": optional_predictions_with_ids[model_name]
+                    })
+
                 return {
                     "success": True,
                     "message": "Prediction completed successfully",
-                    "results": [
-                        {
-                            "model_name": "xgboost",
-                            "prediction": xgb_predictions.tolist() if hasattr(xgb_predictions, 'tolist') else list(xgb_predictions),
-                            "predictions_with_ids": xgb_predictions_with_ids
-                        },
-                        {
-                            "model_name": "pytorch", 
-                            "prediction": pytorch_predictions.tolist() if hasattr(pytorch_predictions, 'tolist') else list(pytorch_predictions),
-                            "predictions_with_ids": pytorch_predictions_with_ids
-                        }
-                    ],
+                    "results": results,
+                    "warnings": model_warnings or None,
                     "shap_analysis": {
                         "shap_data": shap_data,
                         "top_features": top_features,
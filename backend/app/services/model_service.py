@@ -1,7 +1,6 @@
 """
-Model service for loading and running predictions with pickle models.
+Model service for loading and running predictions with model artifacts.
 """
-import pickle
 import logging
 import numpy as np
 from pathlib import Path
@@ -10,6 +9,7 @@ from threading import Lock
 
 from ..config import get_settings
 from ..models.schemas import ModelType
+from ..models.loader import TorchScriptClassifier, load_model_path, resolve_model_path
 
 logger = logging.getLogger(__name__)
 
@@ -31,16 +31,10 @@ class ModelService:
         
         # Load XGBoost model
         try:
-            xgb_path = Path(self.settings.xgboost_model_path)
+            xgb_path = resolve_model_path(self.settings.xgboost_model_path, self.settings.xgboost_fallback_path)
             if xgb_path.exists():
-                with open(xgb_path, 'rb') as f:
-                    self._models[ModelType.XGBOOST] = pickle.load(f)
-                    self._model_metadata[ModelType.XGBOOST] = {
-                        "path": str(xgb_path),
-                        "loaded": True,
-                        "type": "XGBoost",
-                        "size": xgb_path.stat().st_size
-                    }
+                self._models[ModelType.XGBOOST] = load_model_path(xgb_path)
+                self._model_metadata[ModelType.XGBOOST] = self._path_metadata(xgb_path, self._models[ModelType.XGBOOST], "XGBoost")
                 logger.info(f"XGBoost model loaded from {xgb_path}")
             else:
                 logger.warning(f"XGBoost model not found at {xgb_path}")
@@ -53,14 +47,8 @@ class ModelService:
         try:
             pytorch_path = Path(self.settings.pytorch_model_path)
             if pytorch_path.exists():
-                with open(pytorch_path, 'rb') as f:
-                    self._models[ModelType.PYTORCH] = pickle.load(f)
-                    self._model_metadata[ModelType.PYTORCH] = {
-                        "path": str(pytorch_path),
-                        "loaded": True,
-                        "type": "PyTorch",
-                        "size": pytorch_path.stat().st_size
-                    }
+                self._models[ModelType.PYTORCH] = load_model_path(pytorch_path)
+                self._model_metadata[ModelType.PYTORCH] = self._path_metadata(pytorch_path, self._models[ModelType.PYTORCH], "PyTorch")
                 logger.info(f"PyTorch model loaded from {pytorch_path}")
             else:
                 logger.warning(f"PyTorch model not found at {pytorch_path}")
@@ -69,6 +57,41 @@ class ModelService:
             logger.error(f"Failed to load PyTorch model: {e}")
             self._model_metadata[ModelType.PYTORCH] = {"loaded": False, "error": str(e)}
     
+        # Load distilled student (TorchScript, preprocessing included)
+        try:
+            student_path = Path(self.settings.student_model_path)
+            if student_path.exists():
+                self._models[ModelType.STUDENT] = TorchScriptClassifier(student_path)
+                self._model_metadata[ModelType.STUDENT] = {
+                    "path": str(student_path),
+                    "loaded": True,
+                    "type": "Distilled student (TorchScript)",
+                    "size": student_path.stat().st_size
+                }
+                logger.info(f"Student model loaded from {student_path}")
+            else:
+                logger.warning(f"Student model not found at {student_path}")
+                self._model_metadata[ModelType.STUDENT] = {"loaded": False, "error": "File not found"}
+        except Exception as e:
+            logger.error(f"Failed to load student model: {e}")
+            self._model_metadata[ModelType.STUDENT] = {"loaded": False, "error": str(e)}
+    
+    @staticmethod
+    def _path_metadata(path: Path, model: Any, model_type: str) -> Dict[str, Any]:
+        """Load metadata; artifacts also report their content hash and CpG count."""
+        files = list(path.iterdir()) if path.is_dir() else [path]
+        metadata = {
+            "path": str(path),
+            "loaded": True,
+            "type": model_type,
+            "size": sum(f.stat().st_size for f in files)
+        }
+        manifest = getattr(model, 'manifest', None)
+        if manifest is not None:
+            metadata["content_hash"] = manifest["content_hash"]
+            metadata["n_features"] = len(manifest["features"]) if manifest["features"] is not None else None
+        return metadata
+    
     def is_model_loaded(self, model_type: ModelType) -> bool:
         """Check if a specific model is loaded."""
         return model_type in self._models and self._model_metadata.get(model_type, {}).get("loaded", False)
@@ -140,11 +163,11 @@ class ModelService:
             raise RuntimeError(f"Prediction failed for {model_type.value}: {str(e)}")
     
     def _predict_both(self, data: List[List[float]]) -> Dict[str, Any]:
-        """Make predictions with both models."""
+        """Make predictions with every model: XGBoost, PyTorch and the distilled student."""
         results = {}
         errors = []
         
-        for model_type in [ModelType.XGBOOST, ModelType.PYTORCH]:
+        for model_type in [ModelType.XGBOOST, ModelType.PYTORCH, ModelType.STUDENT]:
             try:
                 if self.is_model_loaded(model_type):
                     result = self._predict_single(data, model_type)
@@ -4,6 +4,7 @@ Utility functions for the application.
 import logging
 import sys
 from pathlib import Path
+from typing import Optional
 
 
 def setup_logging(log_level: str = "INFO") -> None:
@@ -23,17 +24,20 @@ def setup_logging(log_level: str = "INFO") -> None:
     )
 
 
-def validate_model_files(xgboost_path: str, pytorch_path: str) -> dict:
+def validate_model_files(xgboost_path: str, pytorch_path: str, xgboost_fallback_path: Optional[str] = None) -> dict:
     """
     Validate that model files exist.
     
     Args:
-        xgboost_path: Path to XGBoost model file
-        pytorch_path: Path to PyTorch model file
+        xgboost_path: Path to XGBoost model artifact or file
+        pytorch_path: Path to PyTorch model artifact
+        xgboost_fallback_path: Bundled XGBoost model used when xgboost_path is missing
         
     Returns:
         Dictionary with validation results
     """
+    if not Path(xgboost_path).exists() and xgboost_fallback_path is not None:
+        xgboost_path = xgboost_fallback_path
     results = {
         "xgboost": Path(xgboost_path).exists(),
         "pytorch": Path(pytorch_path).exists(),
@@ -37,7 +37,8 @@ async def lifespan(app: FastAPI):
     # Validate model files exist
     model_validation = validate_model_files(
         settings.xgboost_model_path,
-        settings.pytorch_model_path
+        settings.pytorch_model_path,
+        settings.xgboost_fallback_path
     )
     logger.info(f"Model file validation: {model_validation}")
     
@@ -0,0 +1,99 @@
+# Content-hashed on-disk cache of parsed and aligned training matrices
+import os, json, hashlib, shutil
+import numpy as np
+
+CACHE_DIR = './model/data/cache'
+HASH_INDEX = 'source_hashes.json'
+
+
+def file_hash(path: str, cache_dir: str = CACHE_DIR, block_size: int = 1 << 24):
+	"""
+	sha256 of a file's content (or of every file under a .zarr directory).
+	Digests are memoized by path, size and mtime so unchanged inputs are only
+	hashed once.
+	"""
+	path = os.path.abspath(path)
+	files = _walk(path)
+	stamp = [[os.path.relpath(f, path) if f != path else '', os.path.getsize(f), os.stat(f).st_mtime_ns] for f in files]
+
+	index_path = os.path.join(cache_dir, HASH_INDEX)
+	index = {}
+	if os.path.exists(index_path):
+		with open(index_path) as f:
+			index = json.load(f)
+	entry = index.get(path)
+	if entry is not None and entry['stamp'] == stamp:
+		return entry['sha256']
+
+	digest = hashlib.sha256()
+	for (name, _, _), f in zip(stamp, files):
+		digest.update(name.encode())
+		with open(f, 'rb') as fh:
+			for block in iter(lambda: fh.read(block_size), b''):
+				digest.update(block)
+	index[path] = {'stamp': stamp, 'sha256': digest.hexdigest()}
+	os.makedirs(cache_dir, exist_ok=True)
+	_atomic_write_json(index_path, index)
+	return index[path]['sha256']
+
+
+def cache_key(sources, options: dict, cache_dir: str = CACHE_DIR):
+	"""Key from the content hashes of the source files plus the loader options."""
+	payload = {
+		'sources': [file_hash(src, cache_dir=cache_dir) for src in sources],
+		'options': options,
+	}
+	return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def cached_arrays(build, sources, options: dict, cache_dir: str = CACHE_DIR, mmap_mode=None):
+	"""
+	Return the dict of arrays produced by `build()`, loading it from
+	`cache_dir/<key>/<name>.npy` when the same sources and options were seen before.
+
+	Args:
+		build: Zero-argument callable returning {name: np.ndarray}
+		sources: Input files whose content the result depends on
+		options: JSON-serializable loader options (feature indices, NaN policy, step...)
+		cache_dir: Root directory of the cache
+		mmap_mode: Passed to np.load on cache hits (e.g. 'r')
+	"""
+	key = cache_key(sources, options, cache_dir=cache_dir)
+	entry = os.path.join(cache_dir, key)
+	meta_path = os.path.join(entry, 'meta.json')
+
+	if os.path.exists(meta_path):
+		with open(meta_path) as f:
+			names = json.load(f)['arrays']
+		print(f"Loaded cached arrays {key} from {cache_dir}")
+		return {name: np.load(os.path.join(entry, name + '.npy'), mmap_mode=mmap_mode) for name in names}
+
+	arrays = build()
+	tmp = entry + '.tmp'
+	shutil.rmtree(tmp, ignore_errors=True)
+	os.makedirs(tmp)
+	for name, array in arrays.items():
+		np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+	meta = {'arrays': list(arrays), 'sources': [os.path.abspath(s) for s in sources], 'options': options}
+	with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+		json.dump(meta, f, indent=2, default=str)
+	# Publish the entry in one rename so readers never see a partial one
+	shutil.rmtree(entry, ignore_errors=True)
+	os.replace(tmp, entry)
+	return arrays
+
+
+def clear_cache(cache_dir: str = CACHE_DIR):
+	shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _walk(path):
+	if os.path.isdir(path):
+		return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+	return [path]
+
+
+def _atomic_write_json(path, obj):
+	with open(path + '.tmp', 'w') as f:
+		json.dump(obj, f)
+	os.replace(path + '.tmp', path)
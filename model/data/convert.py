@@ -0,0 +1,146 @@
+# Convert methylation.csv (CpG rows x sample columns) into a sample-major, chunked store
+import os, argparse
+from contextlib import contextmanager
+import h5py
+import numpy as np
+import pandas as pd
+
+try:
+	import zarr
+except ImportError:
+	# Zarr output is optional, HDF5 works with the base requirements
+	zarr = None
+
+
+def convert_csv(csv_path: str, out_path: str, cpg_chunk: int = 4096, sample_chunk: int = 256,
+				dtype: str = 'float32', compression_level: int = 4):
+	"""
+	Stream the CSV once, `cpg_chunk` CpG rows at a time, and write each block
+	transposed into a (samples x CpGs) `data` dataset with `cpg_ids` and
+	`sample_ids` alongside. The format follows the output suffix (.h5 / .zarr).
+
+	Args:
+		csv_path: CSV with a CpG id column followed by one column per sample
+		out_path: Target .h5/.hdf5 file or .zarr directory
+		cpg_chunk: CpG rows read per pass, also the column chunk size of `data`
+		sample_chunk: Row chunk size of `data`
+		dtype: Storage dtype of the methylation values
+		compression_level: gzip (HDF5) / codec (Zarr) compression level
+
+	Returns:
+		tuple: (n_samples, n_cpgs) written
+	"""
+	reader = pd.read_csv(csv_path, index_col=0, chunksize=cpg_chunk)
+	writer = None
+	cpg_ids = []
+	n_cpgs = 0
+	try:
+		for block in reader:
+			if writer is None:
+				sample_ids = block.columns.astype(str).tolist()
+				writer = _open_writer(out_path, len(sample_ids), cpg_chunk, sample_chunk, dtype, compression_level)
+				writer.write_ids('sample_ids', sample_ids)
+			values = block.to_numpy(dtype=dtype).T
+			writer.append(values)
+			cpg_ids.extend(block.index.astype(str).tolist())
+			n_cpgs += values.shape[1]
+			print(f"Converted {n_cpgs} CpGs...", end='\r')
+		if writer is None:
+			raise ValueError(f"No CpG rows found in {csv_path}")
+		writer.write_ids('cpg_ids', cpg_ids)
+	finally:
+		if writer is not None:
+			writer.close()
+	print(f"\nWrote {len(sample_ids)} samples x {n_cpgs} CpGs to {out_path}")
+	return len(sample_ids), n_cpgs
+
+
+@contextmanager
+def open_store(path: str):
+	"""Open a converted store read-only. Both backends expose store['data'][rows, cols]."""
+	if _is_zarr(path):
+		if zarr is None:
+			raise ImportError("zarr is required to read .zarr stores")
+		yield zarr.open_group(path, mode='r')
+		return
+	with h5py.File(path, 'r') as h5f:
+		yield h5f
+
+
+def read_ids(store, name: str):
+	"""Return the `cpg_ids` / `sample_ids` of an open store as a numpy str array, or None."""
+	if name not in store:
+		return None
+	dset = store[name]
+	if isinstance(dset, h5py.Dataset):
+		return dset.asstr()[:].astype(str)
+	return np.asarray(dset[:]).astype(str)
+
+
+def is_store(path: str):
+	return os.path.splitext(path.rstrip('/'))[1].lower() in ('.h5', '.hdf5', '.zarr')
+
+
+def _is_zarr(path: str):
+	return path.rstrip('/').lower().endswith('.zarr')
+
+
+class _H5Writer:
+	def __init__(self, path, n_samples, cpg_chunk, sample_chunk, dtype, level):
+		self.file = h5py.File(path, 'w')
+		self.data = self.file.create_dataset(
+			'data', shape=(n_samples, 0), maxshape=(n_samples, None), dtype=dtype,
+			chunks=(min(n_samples, sample_chunk), cpg_chunk),
+			compression='gzip', compression_opts=level, shuffle=True)
+
+	def append(self, values):
+		start = self.data.shape[1]
+		self.data.resize(start + values.shape[1], axis=1)
+		self.data[:, start:] = values
+
+	def write_ids(self, name, ids):
+		self.file.create_dataset(name, data=np.asarray(ids, dtype=object), dtype=h5py.string_dtype())
+
+	def close(self):
+		self.file.close()
+
+
+class _ZarrWriter:
+	def __init__(self, path, n_samples, cpg_chunk, sample_chunk, dtype, level):
+		if zarr is None:
+			raise ImportError("zarr is required to write .zarr stores (pip install zarr)")
+		self.group = zarr.open_group(path, mode='w')
+		self.data = self.group.create_array(
+			'data', shape=(n_samples, 0), chunks=(min(n_samples, sample_chunk), cpg_chunk), dtype=dtype,
+			compressors=zarr.codecs.BloscCodec(cname='zstd', clevel=level, shuffle='bitshuffle'))
+
+	def append(self, values):
+		start = self.data.shape[1]
+		self.data.resize((self.data.shape[0], start + values.shape[1]))
+		self.data[:, start:] = values
+
+	def write_ids(self, name, ids):
+		ids = np.asarray(ids, dtype=str)
+		self.group.create_array(name, shape=ids.shape, dtype=ids.dtype)[:] = ids
+
+	def close(self):
+		pass
+
+
+def _open_writer(path, n_samples, cpg_chunk, sample_chunk, dtype, level):
+	writer_cls = _ZarrWriter if _is_zarr(path) else _H5Writer
+	return writer_cls(path, n_samples, cpg_chunk, sample_chunk, dtype, level)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Convert a CpG x sample methylation CSV into a chunked sample-major HDF5/Zarr store.")
+	parser.add_argument('csv_path', help='Input methylation CSV (CpG rows x sample columns)')
+	parser.add_argument('out_path', help='Output .h5 file or .zarr directory')
+	parser.add_argument('--cpg-chunk', type=int, default=4096, help='CpG rows streamed per pass / column chunk size')
+	parser.add_argument('--sample-chunk', type=int, default=256, help='Sample rows per chunk')
+	parser.add_argument('--dtype', default='float32', help='Storage dtype')
+	parser.add_argument('--level', type=int, default=4, help='Compression level')
+	args = parser.parse_args()
+
+	convert_csv(args.csv_path, args.out_path, cpg_chunk=args.cpg_chunk, sample_chunk=args.sample_chunk,
+				dtype=args.dtype, compression_level=args.level)
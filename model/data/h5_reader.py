@@ -0,0 +1,76 @@
+# Fast row gathering from chunked HDF5 (or Zarr) matrices for scattered sample subsets
+import numpy as np
+
+from model.data.convert import open_store
+
+
+def index_runs(sorted_indices, max_gap: int = 0):
+	"""
+	Split sorted unique indices into [start, stop) runs of (nearly) consecutive values.
+	Gaps of up to `max_gap` missing indices are read through rather than split.
+
+	Returns:
+		list of (start, stop, first_pos, last_pos) with positions into `sorted_indices`
+	"""
+	if len(sorted_indices) == 0:
+		return []
+	breaks = np.flatnonzero(np.diff(sorted_indices) > max_gap + 1) + 1
+	firsts = np.concatenate([[0], breaks])
+	lasts = np.concatenate([breaks, [len(sorted_indices)]])
+	return [(int(sorted_indices[f]), int(sorted_indices[l - 1]) + 1, int(f), int(l)) for f, l in zip(firsts, lasts)]
+
+
+def read_rows(dset, row_indices, col_indices=None, max_gap: int = 0, block_rows: int = 256):
+	"""
+	Read `dset[row_indices][:, col_indices]` without h5py point selection.
+
+	Rows are sorted and deduplicated, grouped into contiguous runs, and each run
+	is read as one hyperslab (split every `block_rows` rows to bound memory).
+	Columns are cut from the bounding column range of each block in the same
+	pass, and rows are scattered back into the requested order at the end.
+
+	Args:
+		dset: h5py Dataset (or any array supporting 2-D slicing)
+		row_indices: Requested rows, any order, duplicates allowed
+		col_indices: Optional column indices/mask kept from every row
+		max_gap: Read through gaps of up to this many unrequested rows
+		block_rows: Upper bound on rows fetched per hyperslab read
+
+	Returns:
+		np.ndarray: (len(row_indices), n_selected_cols)
+	"""
+	rows = np.asarray(row_indices, dtype=np.int64)
+	unique_rows, inverse = np.unique(rows, return_inverse=True)
+
+	if col_indices is None:
+		cols = None
+		col_lo, col_hi = 0, dset.shape[1]
+		n_cols = dset.shape[1]
+	else:
+		cols = np.asarray(col_indices)
+		if cols.dtype == bool:
+			cols = np.flatnonzero(cols)
+		cols = cols.astype(np.int64)
+		n_cols = len(cols)
+		col_lo, col_hi = (int(cols.min()), int(cols.max()) + 1) if n_cols else (0, 0)
+		cols = cols - col_lo
+
+	out = np.empty((len(unique_rows), n_cols), dtype=dset.dtype)
+	for start, stop, first, last in index_runs(unique_rows, max_gap=max_gap):
+		for block_start in range(start, stop, block_rows):
+			block_stop = min(block_start + block_rows, stop)
+			block = dset[block_start:block_stop, col_lo:col_hi]
+			# Keep only requested rows of the run (max_gap may have read extra ones)
+			wanted = unique_rows[first:last]
+			wanted = wanted[(wanted >= block_start) & (wanted < block_stop)]
+			pos = np.searchsorted(unique_rows, wanted)
+			block = block[wanted - block_start]
+			out[pos] = block if cols is None else block[:, cols]
+
+	return out[inverse]
+
+
+def read_h5_rows(h5_path: str, row_indices, col_indices=None, dataset: str = 'data', **kwargs):
+	"""Open a store and gather rows with read_rows."""
+	with open_store(h5_path) as store:
+		return read_rows(store[dataset], row_indices, col_indices, **kwargs)
@@ -1,22 +1,29 @@
 # Custom PyTorch Dataset for methylation data and Alzheimer's disease label
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, DataLoader, Sampler
 import pandas as pd
 import h5py
 import numpy as np
 import os, warnings
+from model.data.convert import open_store, read_ids, is_store
+from model.data.cache import cached_arrays
 warnings.filterwarnings("ignore")
 
 class MethylationAlzheimerDataset(Dataset):
 
 	def __init__(self, cpg_path, mapping_path, step=15000):
 
-		# Load methylation data from CSV
+		# Load methylation data from a converted store (only the first `step` CpGs) or CSV
 		mapping_df = pd.read_csv(mapping_path)
-		cpg_df = pd.read_csv(cpg_path)
-		print(len(cpg_df.columns), len(mapping_df.index))
-		# Fool-proof matching of samples
-		cpg_df = cpg_df.set_index('CpG Sites').T
+		if is_store(cpg_path):
+			with open_store(cpg_path) as store:
+				cpg_df = pd.DataFrame(store['data'][:, :step], index=read_ids(store, 'sample_ids'),
+									  columns=read_ids(store, 'cpg_ids')[:step])
+		else:
+			cpg_df = pd.read_csv(cpg_path)
+			print(len(cpg_df.columns), len(mapping_df.index))
+			# Fool-proof matching of samples
+			cpg_df = cpg_df.set_index('CpG Sites').T
 		mapping_df = mapping_df.set_index('sample_id')
 		mapping_df = mapping_df.loc[cpg_df.index]
 		# Merge data and labels
@@ -38,6 +45,175 @@ class MethylationAlzheimerDataset(Dataset):
 		y = torch.tensor(self.labels[idx], dtype=torch.long)
 		return x, y
 
+class MethylationTensorDataset(Dataset):
+	"""
+	Same samples as MethylationAlzheimerDataset, held as one contiguous float32
+	tensor so a batch is a single slice/gather instead of per-row tensor builds.
+	Indexing accepts an int, a slice or an index tensor/array.
+	"""
+
+	def __init__(self, data, labels):
+		self.data = torch.from_numpy(np.ascontiguousarray(data, dtype=np.float32))
+		self.labels = torch.as_tensor(np.asarray(labels, dtype=np.int64))
+
+	@classmethod
+	def from_files(cls, cpg_path, mapping_path, step=15000, cache_dir=None):
+		if cache_dir is None:
+			return cls.from_dataset(MethylationAlzheimerDataset(cpg_path, mapping_path, step=step))
+
+		def build():
+			source = MethylationAlzheimerDataset(cpg_path, mapping_path, step=step)
+			return {'data': np.asarray(source.data, dtype=np.float32), 'labels': np.asarray(source.labels, dtype=np.int64)}
+		# Parsed, merged and label-mapped arrays keyed by source hashes + step
+		arrays = cached_arrays(build, sources=[cpg_path, mapping_path],
+							   options={'loader': 'MethylationAlzheimerDataset', 'step': step}, cache_dir=cache_dir)
+		return cls(arrays['data'], arrays['labels'])
+
+	@classmethod
+	def from_dataset(cls, dataset):
+		return cls(dataset.data, dataset.labels)
+
+	def subset(self, indices):
+		"""Gather rows into a new contiguous dataset (e.g. one CV fold)."""
+		indices = torch.as_tensor(indices, dtype=torch.long)
+		subset = MethylationTensorDataset.__new__(MethylationTensorDataset)
+		subset.data = self.data[indices]
+		subset.labels = self.labels[indices]
+		return subset
+
+	def select_columns(self, columns):
+		"""New contiguous dataset holding only the given CpG columns (e.g. a fitted CpGSelector's selection)."""
+		return MethylationTensorDataset(self.data[:, torch.as_tensor(columns, dtype=torch.long)].numpy(), self.labels.numpy())
+
+	def __len__(self):
+		return len(self.data)
+
+	def __getitem__(self, idx):
+		if isinstance(idx, np.ndarray):
+			idx = torch.from_numpy(idx)
+		return self.data[idx], self.labels[idx]
+
+class MethylationMemmapDataset(Dataset):
+	"""
+	Aligned float32 matrix kept in a read-only memory-mapped .npy file. Pickling
+	only carries the file paths, so DataLoader workers and CV fold processes map
+	the same pages instead of copying the matrix. Built once from the source
+	files and reused while it is newer than them.
+	"""
+
+	def __init__(self, data_path, labels_path, indices=None):
+		self.data_path = data_path
+		self.labels_path = labels_path
+		self.indices = None if indices is None else np.asarray(indices, dtype=np.int64)
+		self._open()
+
+	@classmethod
+	def from_files(cls, cpg_path, mapping_path, step=15000, cache_prefix=None):
+		prefix = cache_prefix or f"{os.path.splitext(cpg_path.rstrip('/'))[0]}.step{step}"
+		data_path, labels_path = prefix + '.data.npy', prefix + '.labels.npy'
+		if not cls._is_fresh(data_path, (cpg_path, mapping_path)):
+			source = MethylationAlzheimerDataset(cpg_path, mapping_path, step=step)
+			np.save(labels_path, np.asarray(source.labels, dtype=np.int64))
+			out = np.lib.format.open_memmap(data_path + '.tmp', mode='w+', dtype=np.float32, shape=source.data.shape)
+			out[:] = source.data
+			out.flush()
+			del out, source
+			# Rename last so a half-written file is never picked up as fresh
+			os.replace(data_path + '.tmp', data_path)
+		return cls(data_path, labels_path)
+
+	@staticmethod
+	def _is_fresh(path, sources):
+		if not os.path.exists(path):
+			return False
+		return all(os.path.getmtime(path) >= os.path.getmtime(src) for src in sources)
+
+	def _open(self):
+		self.data = np.load(self.data_path, mmap_mode='r')
+		self.labels = np.load(self.labels_path)
+
+	def subset(self, indices):
+		"""View of a subset of rows (no copy), e.g. one CV fold."""
+		indices = np.asarray(indices, dtype=np.int64)
+		if self.indices is not None:
+			indices = self.indices[indices]
+		return MethylationMemmapDataset(self.data_path, self.labels_path, indices=indices)
+
+	def select_columns(self, columns):
+		"""In-memory MethylationTensorDataset of only the given CpG columns; rows follow this view."""
+		data = self.data[:, np.asarray(columns, dtype=np.int64)]
+		labels = self.labels
+		if self.indices is not None:
+			data, labels = data[self.indices], labels[self.indices]
+		return MethylationTensorDataset(data, labels)
+
+	def __getstate__(self):
+		return {'data_path': self.data_path, 'labels_path': self.labels_path, 'indices': self.indices}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._open()
+
+	def __len__(self):
+		return len(self.data) if self.indices is None else len(self.indices)
+
+	def __getitem__(self, idx):
+		if isinstance(idx, torch.Tensor):
+			idx = idx.numpy()
+		if self.indices is not None:
+			idx = self.indices[idx]
+		if isinstance(idx, np.ndarray):
+			# Gather scattered rows in file order, then restore the requested order
+			order = np.argsort(idx, kind='stable')
+			rows = np.empty((len(idx), self.data.shape[1]), dtype=np.float32)
+			rows[order] = self.data[idx[order]]
+		else:
+			rows = np.array(self.data[idx], dtype=np.float32)
+		return torch.from_numpy(rows), torch.as_tensor(self.labels[idx], dtype=torch.long)
+
+class BatchSliceSampler(Sampler):
+	"""
+	Yields whole batches of indices: a slice per batch when not shuffling (a view
+	of the tensor), otherwise chunks of one random permutation (a single gather).
+	Use with DataLoader(batch_size=None) so nothing is collated row by row.
+	"""
+
+	def __init__(self, num_samples, batch_size, shuffle=False, drop_last=False, generator=None):
+		self.num_samples = num_samples
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+		self.drop_last = drop_last
+		self.generator = generator
+
+	def __iter__(self):
+		stop = len(self) * self.batch_size if self.drop_last else self.num_samples
+		if self.shuffle:
+			order = torch.randperm(self.num_samples, generator=self.generator)
+			for start in range(0, stop, self.batch_size):
+				yield order[start:start + self.batch_size]
+		else:
+			for start in range(0, stop, self.batch_size):
+				yield slice(start, min(start + self.batch_size, self.num_samples))
+
+	def __len__(self):
+		if self.drop_last:
+			return self.num_samples // self.batch_size
+		return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+def batch_loader(dataset, batch_size, shuffle=False, drop_last=False, generator=None, **kwargs):
+	"""DataLoader over a MethylationTensorDataset / MethylationMemmapDataset that fetches each batch in one indexing call."""
+	sampler = BatchSliceSampler(len(dataset), batch_size, shuffle=shuffle, drop_last=drop_last, generator=generator)
+	return DataLoader(dataset, sampler=sampler, batch_size=None, **kwargs)
+
+def load_feature_ids(cpg_path, step=15000):
+	"""Ordered CpG ids of the `step` columns MethylationAlzheimerDataset reads from the same file."""
+	if is_store(cpg_path):
+		with open_store(cpg_path) as store:
+			cpg_ids = read_ids(store, 'cpg_ids')
+		return None if cpg_ids is None else cpg_ids[:step]
+	# CSV rows are CpGs, the first column holds their ids
+	return pd.read_csv(cpg_path, usecols=[0]).iloc[:step, 0].astype(str).values
+
 if __name__ == "__main__":
     # Example usage
     dataset = MethylationAlzheimerDataset(
@@ -2,14 +2,31 @@ import pandas as pd
 import numpy as np
 import h5py
 
-def load_data(cpg_path: str, mapping_path: str, indices: tuple[int,int]=[1000,5000]):
+from model.data.stats import load_column_stats, subset_stats, feature_mask
+from model.data.convert import open_store, read_ids, is_store
+from model.data.h5_reader import read_rows
+from model.data.cache import cached_arrays
 
-    # Load methylation data from CSV
+def load_data(cpg_path: str, mapping_path: str, indices: tuple[int,int]=[1000,5000], cache_dir: str=None):
+
+	# Reuse the parsed/merged arrays when the same files and options were loaded before
+	if cache_dir is not None:
+		arrays = cached_arrays(
+			lambda: dict(zip(('data', 'labels'), load_data(cpg_path, mapping_path, indices))),
+			sources=[cpg_path, mapping_path], options={'loader': 'load_data', 'indices': indices}, cache_dir=cache_dir)
+		return arrays['data'], arrays['labels']
+
+	# Load methylation data from CSV
 	mapping_df = pd.read_csv(mapping_path)
-	cpg_df = pd.read_csv(cpg_path)
-	print(len(cpg_df.columns), len(mapping_df.index))
-	# Fool-proof matching of samples
-	cpg_df = cpg_df.set_index(cpg_df.columns.values[0]).T
+	if is_store(cpg_path):
+		# Converted stores are already sample-major, no transpose needed
+		with open_store(cpg_path) as store:
+			cpg_df = pd.DataFrame(store['data'][:], index=read_ids(store, 'sample_ids'), columns=read_ids(store, 'cpg_ids'))
+	else:
+		cpg_df = pd.read_csv(cpg_path)
+		print(len(cpg_df.columns), len(mapping_df.index))
+		# Fool-proof matching of samples
+		cpg_df = cpg_df.set_index(cpg_df.columns.values[0]).T
 	mapping_df = mapping_df.set_index('sample_id')
 	mapping_df = mapping_df.loc[cpg_df.index]
 	# Merge data and labels
@@ -27,25 +44,59 @@ def load_data(cpg_path: str, mapping_path: str, indices: tuple[int,int]=[1000,50
 	i_spl, i_ft = min(i_spl, data.shape[0]), min(i_ft, data.shape[1])
 	return data[:, :i_ft], labels[:i_spl]
 
-def load_data_h5(h5_path: str, mapping_path: str, indices: tuple[int,int]=[1000,5000]):
+def load_data_h5(h5_path: str, mapping_path: str, indices: tuple[int,int]=[1000,5000], return_stats: bool=False,
+				 max_nan: int=0, cache_dir: str=None):
 
-	# Load methylation data from H5
-	mapping_df = pd.read_csv(mapping_path)
-	with h5py.File(h5_path, 'r') as h5f:
-		data = h5f['data'][:]
+	# NaN counts come from the per-CpG stats sidecar instead of scanning the whole matrix
+	stats = load_column_stats(h5_path)
+	if cache_dir is not None:
+		arrays = cached_arrays(
+			lambda: dict(zip(('data', 'labels', 'columns'), _read_h5(h5_path, mapping_path, indices, stats, max_nan))),
+			sources=[h5_path, mapping_path], options={'loader': 'load_data_h5', 'indices': indices, 'max_nan': max_nan},
+			cache_dir=cache_dir)
+		data, labels, columns = arrays['data'], arrays['labels'], arrays['columns']
+	else:
+		data, labels, columns = _read_h5(h5_path, mapping_path, indices, stats, max_nan)
 	# print(f"Loaded dataset with {data.shape[0]} samples and {data.shape[1]} features.")
-	labels = mapping_df['disease_state'].map({'control': 0, 'MCI': 1, "Alzheimer's": 2}).values
-	# Iterate through the rows of data and get each row that has a NaN valued cell
-	nan_rows = np.any(np.isnan(data), axis=0)
-	# Remove rows with NaN values and labels
-	data = data[:, ~nan_rows]
-	# Return full data if no indices provided
-	if indices is None: 
-		return data, labels
+	if return_stats:
+		return data, labels, subset_stats(stats, columns)
+	return data, labels
+
+def load_labels_h5(h5_path: str, mapping_path: str):
+	"""Class labels aligned to the rows of an HDF5 / zarr store."""
+	mapping_df = pd.read_csv(mapping_path)
+	with open_store(h5_path) as store:
+		sample_ids = read_ids(store, 'sample_ids')
+	# Converted stores carry sample ids, older files are assumed to follow idmap order
+	if sample_ids is not None:
+		mapping_df = mapping_df.set_index('sample_id').loc[sample_ids]
+	return mapping_df['disease_state'].map({'control': 0, 'MCI': 1, "Alzheimer's": 2}).values
+
+def load_feature_ids_h5(h5_path: str, indices: tuple[int,int]=[1000,5000], max_nan: int=0):
+	"""Ordered CpG ids of the columns load_data_h5 returns for the same options (None if the store has no ids)."""
+	columns = _feature_columns(load_column_stats(h5_path), indices, max_nan)
+	with open_store(h5_path) as store:
+		cpg_ids = read_ids(store, 'cpg_ids')
+	return None if cpg_ids is None else cpg_ids[columns]
+
+def _feature_columns(stats, indices, max_nan):
+	columns = np.flatnonzero(feature_mask(stats, max_nan=max_nan))
+	if indices is not None:
+		columns = columns[:min(indices[1], len(columns))]
+	return columns
+
+def _read_h5(h5_path, mapping_path, indices, stats, max_nan):
+
+	# Load methylation data from H5
+	labels = load_labels_h5(h5_path, mapping_path)
+	columns = _feature_columns(stats, indices, max_nan)
 	# Slice data if indices provided
-	i_spl, i_ft = indices
-	i_spl, i_ft = min(i_spl, data.shape[0]), min(i_ft, data.shape[1])
-	return data[:i_spl, :i_ft], labels[:i_spl]
+	i_spl = len(labels)
+	if indices is not None:
+		i_spl = min(indices[0], int(stats['n_rows']))
+	with open_store(h5_path) as store:
+		data = read_rows(store['data'], np.arange(i_spl), columns)
+	return data, labels[:i_spl], columns
 
 if __name__ == "__main__":
 	# Example usage
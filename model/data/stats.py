@@ -0,0 +1,135 @@
+# Per-CpG column statistics computed in a single streaming pass over the HDF5 matrix
+import os
+import numpy as np
+
+from model.data.convert import open_store
+from model.data.h5_reader import read_rows
+
+STATS_FIELDS = ('nan_count', 'mean', 'var', 'min', 'max')
+
+
+def stats_path_for(h5_path: str) -> str:
+	"""Sidecar path next to the HDF5 file, e.g. methylation.h5 -> methylation.stats.npz"""
+	root, _ = os.path.splitext(h5_path)
+	return root + '.stats.npz'
+
+
+def compute_column_stats(h5_path: str, dataset: str = 'data', chunk_rows: int = 256, rows=None, columns=None):
+	"""
+	Stream the (samples x CpGs) matrix once, block of rows at a time, and compute
+	NaN count, mean, variance, min and max for every CpG column.
+
+	Block moments are merged with Chan's parallel update so the result matches a
+	full-matrix nanmean / nanvar without ever holding more than `chunk_rows` rows.
+
+	Args:
+		h5_path: Path to the HDF5 file (or converted .zarr store)
+		dataset: Name of the samples x CpGs dataset
+		chunk_rows: Number of sample rows read per block
+		rows: Only these store rows (e.g. a training split; default: all)
+		columns: Only these CpG column indices (default: all)
+
+	Returns:
+		dict: Arrays keyed by STATS_FIELDS plus 'n_rows'
+	"""
+	with open_store(h5_path) as store:
+		dset = store[dataset]
+		if rows is None and columns is None:
+			n_rows, n_cols = dset.shape
+			read_block = lambda start: dset[start:start + chunk_rows]
+		else:
+			rows = np.sort(np.asarray(rows)) if rows is not None else np.arange(dset.shape[0])
+			n_rows = len(rows)
+			n_cols = len(np.arange(dset.shape[1])[columns]) if columns is not None else dset.shape[1]
+			read_block = lambda start: read_rows(dset, rows[start:start + chunk_rows], columns)
+		count = np.zeros(n_cols, dtype=np.int64)
+		mean = np.zeros(n_cols, dtype=np.float64)
+		m2 = np.zeros(n_cols, dtype=np.float64)
+		col_min = np.full(n_cols, np.inf)
+		col_max = np.full(n_cols, -np.inf)
+
+		for start in range(0, n_rows, chunk_rows):
+			block = np.asarray(read_block(start), dtype=np.float64)
+			valid = ~np.isnan(block)
+			b_count = valid.sum(axis=0)
+			filled = np.where(valid, block, 0.0)
+			b_sum = filled.sum(axis=0)
+			with np.errstate(invalid='ignore', divide='ignore'):
+				b_mean = np.where(b_count > 0, b_sum / b_count, 0.0)
+			b_m2 = (np.where(valid, block - b_mean, 0.0) ** 2).sum(axis=0)
+
+			# Merge block moments into the running totals
+			total = count + b_count
+			delta = b_mean - mean
+			with np.errstate(invalid='ignore', divide='ignore'):
+				ratio = np.where(total > 0, b_count / total, 0.0)
+			mean += delta * ratio
+			m2 += b_m2 + delta ** 2 * count * ratio
+			count = total
+
+			col_min = np.fmin(col_min, np.where(valid, block, np.inf).min(axis=0))
+			col_max = np.fmax(col_max, np.where(valid, block, -np.inf).max(axis=0))
+
+	empty = count == 0
+	with np.errstate(invalid='ignore', divide='ignore'):
+		var = np.where(empty, np.nan, m2 / np.maximum(count, 1))
+	mean[empty] = np.nan
+	col_min[empty] = np.nan
+	col_max[empty] = np.nan
+
+	return {
+		'nan_count': (n_rows - count).astype(np.int64),
+		'mean': mean,
+		'var': var,
+		'min': col_min,
+		'max': col_max,
+		'n_rows': np.int64(n_rows),
+	}
+
+
+def save_column_stats(stats: dict, path: str, source_path: str = None):
+	"""Write stats to an .npz sidecar, stamped with the source file's size and mtime."""
+	stamp = _source_stamp(source_path) if source_path is not None else np.zeros(2, dtype=np.int64)
+	np.savez(path, source_stamp=stamp, **stats)
+
+
+def load_column_stats(h5_path: str, dataset: str = 'data', chunk_rows: int = 256, rebuild: bool = False):
+	"""
+	Return the per-CpG stats for an HDF5 file, reading the sidecar when it is
+	up to date and rebuilding (then persisting) it otherwise.
+	"""
+	sidecar = stats_path_for(h5_path)
+	if not rebuild and os.path.exists(sidecar):
+		with np.load(sidecar) as npz:
+			if np.array_equal(npz['source_stamp'], _source_stamp(h5_path)):
+				return {key: npz[key] for key in STATS_FIELDS + ('n_rows',)}
+
+	stats = compute_column_stats(h5_path, dataset=dataset, chunk_rows=chunk_rows)
+	save_column_stats(stats, sidecar, source_path=h5_path)
+	return stats
+
+
+def subset_stats(stats: dict, columns):
+	"""Restrict stats to a column mask or index array, keeping 'n_rows' as is."""
+	return {key: (value if key == 'n_rows' else value[columns]) for key, value in stats.items()}
+
+
+def feature_mask(stats: dict, max_nan: int = 0, min_var: float = 0.0):
+	"""Boolean mask of CpGs with at most `max_nan` missing values and variance above `min_var`."""
+	mask = stats['nan_count'] <= max_nan
+	if min_var > 0:
+		mask &= np.nan_to_num(stats['var'], nan=0.0) > min_var
+	return mask
+
+
+def _source_stamp(path: str):
+	st = os.stat(path)
+	return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+if __name__ == "__main__":
+	# Example usage
+	h5_path = './model/data/train/methylation.h5'
+	stats = load_column_stats(h5_path, rebuild=True)
+	print(f"Wrote {stats_path_for(h5_path)} for {len(stats['mean'])} CpGs over {stats['n_rows']} samples.")
+	print(f"CpGs with missing values: {(stats['nan_count'] > 0).sum()}")
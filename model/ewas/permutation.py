@@ -0,0 +1,149 @@
+# Permutation FDR for the Mann-Whitney EWAS: ranks computed once per block, every label permutation one matrix product
+import numpy as np
+from scipy.special import ndtr
+
+from model.ewas.mannwhitney import rank_columns
+
+# Null statistics are binned on the z scale; bins are merged across blocks by summing
+Z_BIN_WIDTH = 0.01
+Z_MAX = 40.0
+
+
+def permutation_matrix(group, n_perm=1000, seed=0):
+    """
+    Label permutations as a (samples, n_perm) 0/1 matrix, one shuffled copy of `group` per column
+
+    The same matrix must be used for every block of a run, so that each
+    permutation relabels all CpGs jointly and keeps their correlation.
+    """
+    group = np.asarray(group).astype(bool)
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.permutation(group) for _ in range(n_perm)], axis=1).astype(np.float64)
+
+
+def _z_statistics(rank_sum, n1, n_valid, tie_term, alternative, use_continuity):
+    # Same normal approximation as mannwhitneyu_columns, on the z scale so every
+    # CpG's statistic maps to its p-value by one monotone function
+    n2 = n_valid - n1
+    n = n_valid
+    U1 = rank_sum - n1 * (n1 + 1) / 2
+    if alternative == 'greater':
+        U = U1
+    elif alternative == 'less':
+        U = n1 * n2 - U1
+    else:
+        U = np.maximum(U1, n1 * n2 - U1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        z = (U - n1 * n2 / 2 - (0.5 if use_continuity else 0.0)) / sigma
+    z[(n1 == 0) | (n2 == 0)] = np.nan
+    return z
+
+
+def mannwhitney_permutation_test(block, group, permutations, alternative='two-sided', use_continuity=True,
+                                 nan_policy='propagate', perm_batch=256):
+    """
+    Block test of run_ewas: Mann-Whitney U of `group` vs. the rest, plus the
+    permutation null reduced on the fly
+
+    The block is ranked once, and the observed test (as mannwhitneyu_columns)
+    and the rank sums of every permutation, ranks^T @ permutations, come from
+    those ranks: a single matrix product per batch of permutations instead of
+    one test per CpG and permutation. Only two reductions of the
+    null are kept: the maximum statistic of each permutation (for max-T
+    adjusted p-values) and a histogram of all null statistics (for empirical
+    q-values). Both merge across blocks, see runner.collect_results.
+
+    Args:
+        block: (samples, CpGs) array
+        group: Boolean mask of the first sample's rows
+        permutations: (samples, n_perm) matrix from permutation_matrix
+        nan_policy: As in mannwhitneyu_columns; with 'propagate', CpGs with
+                    missing values are left out of the null
+        perm_batch: Permutations per matrix product (bounds memory to CpGs x perm_batch)
+
+    Returns:
+        dict: statistic, p_value and z per CpG; null_max (n_perm,) and null_hist (bins,)
+    """
+    if alternative not in ('two-sided', 'greater', 'less'):
+        raise ValueError(f"Unknown alternative: {alternative}")
+    if nan_policy not in ('propagate', 'omit'):
+        raise ValueError(f"Unknown nan_policy: {nan_policy}")
+    ranks, tie_term = rank_columns(block)
+    valid = ~np.isnan(ranks)
+    ranks = np.where(valid, ranks, 0.0)
+    n_valid = valid.sum(axis=0).astype(np.float64)
+    testable = n_valid == ranks.shape[0] if nan_policy == 'propagate' else np.ones(ranks.shape[1], dtype=bool)
+
+    # Observed test: U of the first sample and its p-value, as in mannwhitneyu_columns
+    group = np.asarray(group).astype(np.float64)[:, None]
+    rank_sum, n1 = (ranks.T @ group)[:, 0], (valid.T @ group)[:, 0]
+    z = _z_statistics(rank_sum, n1, n_valid, tie_term, alternative, use_continuity)
+    z[~testable] = np.nan
+    untested = (n1 == 0) | (n1 == n_valid) | ~testable
+    statistic = np.where(untested, np.nan, rank_sum - n1 * (n1 + 1) / 2)
+    p = ndtr(-z)
+    if alternative == 'two-sided':
+        p = 2 * p
+    p = np.clip(p, 0, 1)
+
+    permutations = np.asarray(permutations, dtype=np.float64)
+    n_perm = permutations.shape[1]
+    null_max = np.full(n_perm, -np.inf)
+    null_hist = np.zeros(int(Z_MAX / Z_BIN_WIDTH) + 1, dtype=np.int64)
+    ranks_t, tie_t, n_t = ranks[:, testable].T, tie_term[testable, None], n_valid[testable, None]
+    # Columns with missing values have a per-permutation group size
+    partial_t = np.flatnonzero(n_valid[testable] < ranks.shape[0])
+    valid_t = valid[:, testable][:, partial_t].T.astype(np.float64)
+    for start in range(0, n_perm, perm_batch):
+        P = permutations[:, start:start + perm_batch]
+        n1 = np.broadcast_to(P.sum(axis=0), (ranks_t.shape[0], P.shape[1])).copy()
+        if len(partial_t):
+            n1[partial_t] = valid_t @ P
+        null_z = _z_statistics(ranks_t @ P, n1, n_t, tie_t, alternative, use_continuity)
+        with np.errstate(invalid='ignore'):
+            null_max[start:start + P.shape[1]] = np.fmax(null_max[start:start + P.shape[1]],
+                                                          np.nanmax(null_z, axis=0, initial=-np.inf))
+        null_hist += _z_histogram(null_z)
+    return {'statistic': statistic, 'p_value': p, 'z': z, 'null_max': null_max, 'null_hist': null_hist}
+
+
+def _z_histogram(z):
+    z = z[np.isfinite(z)]
+    bins = np.clip(np.floor(z / Z_BIN_WIDTH), 0, Z_MAX / Z_BIN_WIDTH).astype(np.int64)
+    return np.bincount(bins, minlength=int(Z_MAX / Z_BIN_WIDTH) + 1)
+
+
+def maxt_pvalues(z, null_max):
+    """
+    Single-step max-T adjusted p-values (Westfall & Young): the share of
+    permutations whose largest statistic over all CpGs reaches each observed one
+    """
+    null_max = np.sort(np.asarray(null_max, dtype=np.float64))
+    exceed = len(null_max) - np.searchsorted(null_max, z, side='left')
+    p = (1 + exceed) / (len(null_max) + 1)
+    return np.where(np.isfinite(z), p, np.nan)
+
+
+def empirical_qvalues(z, null_hist, n_perm):
+    """
+    Empirical q-values from the binned permutation null
+
+    At each observed statistic, FDR = (mean null count per permutation at or
+    above it) / (observed count at or above it), made monotone by taking the
+    minimum over all lower thresholds. Counting the null from the floor of the
+    statistic's bin keeps the estimate conservative.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    q = np.full(z.shape, np.nan)
+    finite = np.flatnonzero(np.isfinite(z))
+    if not len(finite):
+        return q
+    null_above = np.cumsum(np.asarray(null_hist)[::-1])[::-1] / n_perm
+    order = finite[np.argsort(-z[finite], kind='stable')]
+    # Ties in z share the count of every statistic at or above them
+    observed_above = len(order) - np.searchsorted(z[order][::-1], z[order], side='left')
+    bins = np.clip(np.floor(z[order] / Z_BIN_WIDTH), 0, len(null_above) - 1).astype(np.int64)
+    fdr = np.minimum(null_above[bins] / observed_above, 1.0)
+    q[order] = np.minimum.accumulate(fdr[::-1])[::-1]
+    return q
@@ -0,0 +1,197 @@
+# Covariate-adjusted EWAS: one OLS design factored once, every CpG of a block solved by matrix multiplies
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+from scipy.special import stdtr
+
+
+def design_matrix(samples, status, covariates=('age', 'sex'), batch='series_id'):
+    """
+    OLS design for a covariate-adjusted EWAS
+
+    Columns: intercept, disease status, numeric covariates as is, categorical
+    covariates and the batch as dummies (first level dropped). Dummies that are
+    constant over the selected samples are dropped too.
+
+    Args:
+        samples: idmap rows of the tested samples (DataFrame, same order as the data rows)
+        status: Boolean mask (or 0/1) of case samples
+        covariates: idmap columns adjusted for
+        batch: idmap column of the processing batch / series (None: no batch term)
+
+    Returns:
+        tuple: (design float64 array (samples, terms), term names); 'status' is column 1
+    """
+    terms = {'intercept': np.ones(len(samples)), 'status': np.asarray(status, dtype=np.float64)}
+    terms.update(_covariate_terms(samples, covariates, batch))
+    return np.column_stack(list(terms.values())), list(terms)
+
+
+def state_design_matrix(samples, reference='control', covariates=('age', 'sex'), batch='series_id'):
+    """
+    OLS design with one indicator per disease state other than `reference`
+    (terms 'state_<level>'), plus the covariates of design_matrix. Any pairwise
+    contrast of states is then a linear combination of the fitted
+    coefficients (contrast_matrix), so all contrasts share one fit.
+    """
+    states = samples['disease_state'].astype(str).to_numpy()
+    if reference not in states:
+        raise ValueError(f"Reference state '{reference}' has no samples")
+    terms = {'intercept': np.ones(len(samples))}
+    for level in sorted(set(states) - {reference}):
+        terms[f"state_{level}"] = (states == level).astype(np.float64)
+    terms.update(_covariate_terms(samples, covariates, batch))
+    return np.column_stack(list(terms.values())), list(terms)
+
+
+def contrast_matrix(names, contrasts, reference='control'):
+    """
+    Rows L with L @ coef = mean(case) - mean(control), adjusted, for each
+    (case, control) pair of states of a state_design_matrix.
+    """
+    L = np.zeros((len(contrasts), len(names)))
+    for i, (case, control) in enumerate(contrasts):
+        for level, sign in ((case, 1.0), (control, -1.0)):
+            if level == reference:
+                continue
+            if f"state_{level}" not in names:
+                raise ValueError(f"State '{level}' is not a term of the design {names}")
+            L[i, names.index(f"state_{level}")] += sign
+    return L
+
+
+def _covariate_terms(samples, covariates, batch):
+    terms = {}
+    factors = list(covariates) + ([batch] if batch else [])
+    missing = [name for name in factors if name not in samples.columns]
+    if missing:
+        raise ValueError(f"Covariates not in the sample table: {missing}")
+    for name in factors:
+        values = samples[name]
+        if values.isna().any():
+            raise ValueError(f"Covariate '{name}' has missing values; drop or impute those samples first")
+        if name != batch and pd.api.types.is_numeric_dtype(values):
+            terms[name] = values.to_numpy(dtype=np.float64)
+            continue
+        dummies = pd.get_dummies(values.astype(str), prefix=name, drop_first=True, dtype=np.float64)
+        for column in dummies.columns:
+            if dummies[column].nunique() > 1:
+                terms[column] = dummies[column].to_numpy()
+    return terms
+
+
+class LinearModel:
+    """
+    Ordinary least squares of every CpG on one design, with the design QR-factored once
+
+    For a block Y (samples x CpGs): coef = R^-1 Q^T Y, residuals Y - Q Q^T Y,
+    and standard errors from diag((X^T X)^-1) = row sums of R^-1 squared, so a
+    block costs two matrix multiplies instead of one model fit per CpG. Linear
+    contrasts L @ coef come from the same fit, with diag(L (X^T X)^-1 L^T)
+    = row sums of (L R^-1) squared. CpGs with missing values are refit on their
+    observed samples, one QR per distinct missingness pattern.
+
+    Args:
+        design: (samples, terms) design matrix, e.g. from design_matrix
+        names: Term names (default: x0, x1, ...)
+        term: Term whose coefficient is tested (default: 'status' or column 1)
+    """
+    def __init__(self, design, names=None, term=None):
+        self.design = np.asarray(design, dtype=np.float64)
+        self.names = list(names) if names is not None else [f"x{i}" for i in range(self.design.shape[1])]
+        if term is None:
+            term = 'status' if 'status' in self.names else self.names[1]
+        self.term = self.names.index(term)
+        self._factors = self._factor(self.design)
+        if self._factors is None:
+            raise ValueError(f"Design is rank deficient or has no residual degrees of freedom "
+                             f"({self.design.shape[0]} samples, terms {self.names})")
+
+    @staticmethod
+    def _factor(design):
+        n, p = design.shape
+        if n <= p:
+            return None
+        Q, R = np.linalg.qr(design)
+        diag = np.abs(np.diag(R))
+        if diag.min() <= diag.max() * max(n, p) * np.finfo(np.float64).eps:
+            return None
+        R_inv = solve_triangular(R, np.eye(p))
+        return Q, R_inv, n - p
+
+    def fit(self, Y, contrasts=None):
+        """
+        Args:
+            Y: (samples, CpGs) block
+            contrasts: Optional (k, terms) matrix L; estimates L @ coef instead of each term
+
+        Returns:
+            tuple: (coef, se, t, p) arrays shaped (terms or k, CpGs); NaN for
+            CpGs whose observed samples leave the design rank deficient
+        """
+        Y = np.asarray(Y, dtype=np.float64)
+        L = np.eye(self.design.shape[1]) if contrasts is None else np.atleast_2d(np.asarray(contrasts, dtype=np.float64))
+        out = [np.full((L.shape[0], Y.shape[1]), np.nan) for _ in range(4)]
+        nan_mask = np.isnan(Y)
+        complete = ~nan_mask.any(axis=0)
+        self._solve(self._factors, L, Y[:, complete], out, complete)
+        if not complete.all():
+            # One refit per distinct missingness pattern, shared by every CpG that has it
+            incomplete = np.flatnonzero(~complete)
+            patterns, inverse = np.unique(nan_mask[:, incomplete].T, axis=0, return_inverse=True)
+            for k, pattern in enumerate(patterns):
+                columns = incomplete[inverse.ravel() == k]
+                observed = ~pattern
+                factors = self._factor(self.design[observed])
+                if factors is not None:
+                    self._solve(factors, L, Y[np.ix_(observed, columns)], out, columns)
+        return tuple(out)
+
+    @staticmethod
+    def _solve(factors, L, Y, out, columns):
+        Q, R_inv, df = factors
+        LR = L @ R_inv
+        unscaled = (LR ** 2).sum(axis=1)
+        QtY = Q.T @ Y
+        coef = LR @ QtY
+        residuals = Y - Q @ QtY
+        sigma2 = (residuals ** 2).sum(axis=0) / df
+        se = np.sqrt(unscaled[:, None] * sigma2[None, :])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = coef / se
+        for array, values in zip(out, (coef, se, t, 2 * stdtr(df, -np.abs(t)))):
+            array[:, columns] = values
+
+
+def linear_test(block, model, all_terms=False):
+    """
+    Block test for model.ewas.runner.run_ewas: coefficient, standard error,
+    t statistic and p-value of the model's tested term for every CpG. With
+    all_terms, coef_/t_/p_ columns of every design term are added.
+    """
+    coef, se, t, p = model.fit(block)
+    i = model.term
+    result = {'coef': coef[i], 'se': se[i], 'statistic': t[i], 'p_value': p[i]}
+    if all_terms:
+        for j, name in enumerate(model.names):
+            result.update({f"coef_{name}": coef[j], f"t_{name}": t[j], f"p_{name}": p[j]})
+    return result
+
+
+def linear_contrasts_test(block, model, contrasts, names):
+    """
+    Block test for run_ewas over several contrasts from one fit: adjusted
+    difference, standard error, t statistic and p-value per contrast, keyed
+    '<name>::<field>' so run_ewas returns one table per contrast.
+
+    Args:
+        model: LinearModel over a state_design_matrix
+        contrasts: (k, terms) matrix from contrast_matrix
+        names: Contrast names, one per row of `contrasts`
+    """
+    coef, se, t, p = model.fit(block, contrasts=contrasts)
+    result = {}
+    for i, name in enumerate(names):
+        result.update({f"{name}::coef": coef[i], f"{name}::se": se[i], f"{name}::statistic": t[i],
+                       f"{name}::p_value": p[i]})
+    return result
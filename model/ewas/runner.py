@@ -0,0 +1,376 @@
+# Out-of-core EWAS: CpG column blocks of an HDF5 / Zarr store tested in a process pool, checkpointed per block
+import os, json, time, hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import joblib
+from statsmodels.stats.multitest import multipletests
+from threadpoolctl import threadpool_limits
+
+from model.data.convert import open_store, read_ids
+from model.data.h5_reader import read_rows
+from model.ewas.mannwhitney import mannwhitneyu_columns, mannwhitneyu_contrasts
+from model.ewas.permutation import mannwhitney_permutation_test, permutation_matrix, maxt_pvalues, empirical_qvalues
+from model.utils.parallel import partition_threads
+
+
+def mannwhitney_test(block, group, **kwargs):
+    """Block test of run_ewas: Mann-Whitney U of `group` rows vs. the rest."""
+    statistic, p = mannwhitneyu_columns(block, group, **kwargs)
+    return {'statistic': statistic, 'p_value': p}
+
+
+def mannwhitney_contrasts_test(block, contrasts, names, **kwargs):
+    """
+    Block test of run_ewas over several contrasts: the block is sorted once and
+    each (case_mask, control_mask) pair ranked from that order. Keys are
+    '<name>::<field>', so run_ewas returns one table per contrast.
+    """
+    result = {}
+    for name, (statistic, p) in zip(names, mannwhitneyu_contrasts(block, contrasts, **kwargs)):
+        result.update({f"{name}::statistic": statistic, f"{name}::p_value": p})
+    return result
+
+
+# Store and test handed to each worker once by the pool initializer
+_job = None
+_thread_limits = None
+
+
+def _init_worker(job, n_threads=None):
+    # Caps BLAS/OpenMP threads so workers * threads stays within the core budget
+    global _job, _thread_limits
+    _job = job
+    if _thread_limits is not None:
+        _thread_limits.restore_original_limits()
+        _thread_limits = None
+    if n_threads is not None:
+        _thread_limits = threadpool_limits(limits=n_threads)
+
+
+def _run_block(index, columns):
+    """Read one column block for the selected samples, test it, and write its result file atomically."""
+    job = _job
+    with open_store(job['store_path']) as store:
+        block = read_rows(store[job['dataset']], job['rows'], columns)
+    result = job['test'](block, **job['test_kwargs'])
+    path = _block_path(job['out_dir'], index)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, columns=columns, **result)
+    os.replace(tmp, path)
+    return index
+
+
+def column_blocks(n_columns, block_cols, chunk_cols=None, columns=None):
+    """
+    Partition CpG columns into blocks for run_ewas
+
+    Without a column subset, blocks are whole multiples of the store's column
+    chunk so no chunk is decompressed by two workers.
+
+    Returns:
+        list of int64 column index arrays
+    """
+    if columns is None:
+        columns = np.arange(n_columns, dtype=np.int64)
+        if chunk_cols:
+            block_cols = max(chunk_cols, block_cols // chunk_cols * chunk_cols)
+    columns = np.asarray(columns, dtype=np.int64)
+    return [columns[start:start + block_cols] for start in range(0, len(columns), block_cols)]
+
+
+def run_ewas(store_path, group, rows=None, columns=None, out_dir='./model/data/ewas/run', block_cols=8192,
+             n_jobs=None, test=mannwhitney_test, test_kwargs=None, fdr_alpha=0.05, fdr_method='fdr_bh',
+             dataset='data', resume=True):
+    """
+    Run an EWAS over a sample x CpG store without loading the matrix
+
+    CpG columns are split into blocks (column_blocks); each block is read for
+    the selected samples, tested by `test(block, group=group, **test_kwargs)` in a
+    process pool and written to `out_dir/blocks` as its own .npz. A finished
+    block file is the checkpoint: rerunning with the same arguments skips the
+    blocks already on disk, so an interrupted run resumes where it stopped.
+    Once every block is done, the per-block results are concatenated and the
+    FDR correction is applied once across all CpGs. Tests of several contrasts
+    (mannwhitney_contrasts_test, regression.linear_contrasts_test) read each
+    block once for all of them and key their arrays '<contrast>::<field>'.
+
+    Args:
+        store_path: HDF5 / Zarr store with a samples x CpGs `dataset`
+        group: Boolean mask (or 0/1 labels) over `rows`, the first test group;
+               None for tests that take their design from test_kwargs (e.g. regression.linear_test)
+        rows: Sample rows to test (default: all)
+        columns: CpG column subset (default: all)
+        out_dir: Run directory holding run.json and the block results
+        block_cols: CpGs per block (rounded to the store's column chunking)
+        n_jobs: Cores to use, split between worker processes and their BLAS threads (default: all)
+        test: Picklable block test returning a dict of per-CpG arrays with a 'p_value' entry
+        test_kwargs: Extra keyword arguments for `test`
+        resume: Reuse finished blocks of a previous run with the same arguments
+
+    Returns:
+        pd.DataFrame: CpG_Index, IlmnID (when the store has CpG ids), the test's
+        arrays, q_value and significant, one row per tested CpG; for contrast
+        tests a dict of such tables keyed by contrast name, FDR applied per contrast
+    """
+    test_kwargs = dict(test_kwargs or {})
+    with open_store(store_path) as store:
+        dset = store[dataset]
+        n_rows, n_columns = dset.shape
+        chunk_cols = dset.chunks[1] if getattr(dset, 'chunks', None) else None
+        cpg_ids = read_ids(store, 'cpg_ids')
+    rows = np.arange(n_rows, dtype=np.int64) if rows is None else np.asarray(rows, dtype=np.int64)
+    if group is not None:
+        group = np.asarray(group).astype(bool)
+        if len(group) != len(rows):
+            raise ValueError(f"group has {len(group)} entries for {len(rows)} rows")
+    blocks = column_blocks(n_columns, block_cols, chunk_cols, columns)
+
+    config = {
+        'store': os.path.abspath(store_path),
+        'stamp': _source_stamp(store_path),
+        'dataset': dataset,
+        'rows': _digest(rows),
+        'group': _digest(group) if group is not None else None,
+        'columns': _digest(np.concatenate(blocks)) if blocks else None,
+        'blocks': len(blocks),
+        'block_cols': int(max((len(b) for b in blocks), default=0)),
+        'test': f"{test.__module__}.{test.__qualname__}",
+        'test_kwargs': {name: joblib.hash(value) for name, value in test_kwargs.items()},
+    }
+    _prepare_run(out_dir, config, resume)
+    pending = [i for i in range(len(blocks)) if not os.path.exists(_block_path(out_dir, i))]
+    print(f"EWAS: {len(blocks)} blocks of up to {config['block_cols']} CpGs, "
+          f"{len(blocks) - len(pending)} already done")
+
+    job = {'store_path': store_path, 'dataset': dataset, 'rows': rows, 'out_dir': out_dir,
+           'test': test, 'test_kwargs': test_kwargs if group is None else {'group': group, **test_kwargs}}
+    n_workers, n_threads = partition_threads(len(pending), n_jobs)
+    start = time.perf_counter()
+    if pending and n_workers == 1:
+        _init_worker(job, n_threads)
+        try:
+            for done, i in enumerate(pending, 1):
+                _run_block(i, blocks[i])
+                _report(done, len(pending), start)
+        finally:
+            _init_worker(None)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(job, n_threads)) as pool:
+            futures = [pool.submit(_run_block, i, blocks[i]) for i in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                _report(done, len(pending), start)
+
+    return collect_results(out_dir, len(blocks), cpg_ids=cpg_ids, fdr_alpha=fdr_alpha, fdr_method=fdr_method)
+
+
+def collect_results(out_dir, n_blocks, cpg_ids=None, fdr_alpha=0.05, fdr_method='fdr_bh'):
+    """
+    Concatenate the block results of a finished run and apply the FDR correction across all CpGs
+
+    Arrays keyed '<contrast>::<field>' are split into one table per contrast,
+    each corrected on its own p-values. Permutation nulls reduced per block
+    (null_max, null_hist from permutation.mannwhitney_permutation_test) are
+    merged across blocks into max-T adjusted p-values (p_maxT) and empirical
+    q-values (q_perm, significant_perm).
+    """
+    parts = {}
+    for i in range(n_blocks):
+        with np.load(_block_path(out_dir, i)) as block:
+            for name in block.files:
+                parts.setdefault(name, []).append(block[name])
+    arrays = {}
+    for name, values in parts.items():
+        field = name.rpartition('::')[2]
+        if field == 'null_max':
+            arrays[name] = np.max(values, axis=0)
+        elif field == 'null_hist':
+            arrays[name] = np.sum(values, axis=0)
+        else:
+            arrays[name] = np.concatenate(values)
+    columns = arrays.pop('columns')
+
+    tables = {}
+    for key, values in arrays.items():
+        contrast, _, field = key.rpartition('::')
+        tables.setdefault(contrast, {})[field] = values
+    results = {}
+    for contrast, fields in tables.items():
+        null_max, null_hist = fields.pop('null_max', None), fields.pop('null_hist', None)
+        table = pd.DataFrame({'CpG_Index': columns})
+        if cpg_ids is not None:
+            table['IlmnID'] = cpg_ids[columns]
+        for name, values in fields.items():
+            table[name] = values
+        table['q_value'], table['significant'] = fdr(fields['p_value'], alpha=fdr_alpha, method=fdr_method)
+        if null_max is not None:
+            table['p_maxT'] = maxt_pvalues(fields['z'], null_max)
+            table['q_perm'] = empirical_qvalues(fields['z'], null_hist, len(null_max))
+            table['significant_perm'] = table['q_perm'].to_numpy() <= fdr_alpha
+        results[contrast] = table
+    # Single-test runs keep returning one table
+    return results if '' not in results else results['']
+
+
+def fdr(p_values, alpha=0.05, method='fdr_bh'):
+    """multipletests over the finite p-values; untestable CpGs (NaN) get q = NaN and are never significant."""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q = np.full(p_values.shape, np.nan)
+    reject = np.zeros(p_values.shape, dtype=bool)
+    finite = np.isfinite(p_values)
+    if finite.any():
+        reject[finite], q[finite], _, _ = multipletests(p_values[finite], alpha=alpha, method=method)
+    return q, reject
+
+
+def _prepare_run(out_dir, config, resume):
+    # Blocks from a run with different inputs must never be mixed into this one
+    os.makedirs(os.path.join(out_dir, 'blocks'), exist_ok=True)
+    config_path = os.path.join(out_dir, 'run.json')
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            previous = json.load(f)
+        if resume and previous != json.loads(json.dumps(config)):
+            raise ValueError(f"{out_dir} holds an EWAS run with different inputs; "
+                             f"use another out_dir or resume=False to start over")
+    if not resume:
+        for name in os.listdir(os.path.join(out_dir, 'blocks')):
+            os.remove(os.path.join(out_dir, 'blocks', name))
+    with open(config_path + '.tmp', 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(config_path + '.tmp', config_path)
+
+
+def _report(done, total, start):
+    if done == total or done % max(1, total // 20) == 0:
+        elapsed = time.perf_counter() - start
+        print(f"EWAS: {done}/{total} blocks ({elapsed:.1f}s, ~{elapsed / done * (total - done):.0f}s left)")
+
+
+def _block_path(out_dir, index):
+    return os.path.join(out_dir, 'blocks', f"block_{index:06d}.npz")
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _digest(array):
+    return hashlib.sha1(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def sample_table(store_path, mapping_path):
+    """idmap rows (sample_id, disease_state, covariates) aligned to the rows of a store."""
+    mapping_df = pd.read_csv(mapping_path)
+    with open_store(store_path) as store:
+        sample_ids = read_ids(store, 'sample_ids')
+    # Converted stores carry sample ids, older files are assumed to follow idmap order
+    if sample_ids is not None:
+        mapping_df = mapping_df.set_index('sample_id').loc[sample_ids].reset_index()
+    return mapping_df
+
+
+def contrast_rows(samples, case, control):
+    """Rows of the `case` and `control` samples in a sample table, and the case mask over them."""
+    rows, ((group, _),), _ = contrast_masks(samples, [(case, control)])
+    return rows, group
+
+
+def contrast_masks(samples, contrasts):
+    """
+    Rows of every sample in any of the (case, control) disease state pairs, and
+    per pair the (case_mask, control_mask) over those rows
+
+    Returns:
+        tuple: (rows, list of mask pairs, contrast names '<case>_vs_<control>')
+    """
+    states = samples['disease_state'].to_numpy()
+    levels = [level for pair in contrasts for level in pair]
+    rows = np.flatnonzero(np.isin(states, levels))
+    masks = [(states[rows] == case, states[rows] == control) for case, control in contrasts]
+    names = [f"{case}_vs_{control}" for case, control in contrasts]
+    return rows, masks, names
+
+
+if __name__ == "__main__":
+    import argparse, re
+    from model.ewas.store import write_result_store
+    from model.ewas.regression import (LinearModel, design_matrix, linear_test, state_design_matrix, contrast_matrix,
+                                       linear_contrasts_test)
+
+    parser = argparse.ArgumentParser(description="Out-of-core, resumable EWAS of disease states vs. control.")
+    parser.add_argument('store', help='HDF5 / Zarr store from model.data.convert')
+    parser.add_argument('idmap', help='CSV with sample_id, disease_state and covariate columns')
+    parser.add_argument('--case', default="Alzheimer's")
+    parser.add_argument('--control', default='control')
+    parser.add_argument('--contrasts', nargs='*', default=None, metavar='CASE:CONTROL',
+                        help="Several contrasts in one pass over the store, e.g. MCI:control \"Alzheimer's:MCI\" "
+                             "(overrides --case / --control)")
+    parser.add_argument('--test', choices=['mannwhitney', 'linear'], default='mannwhitney',
+                        help='Rank test, or OLS adjusted for --covariates and --batch')
+    parser.add_argument('--covariates', nargs='*', default=['age', 'sex'])
+    parser.add_argument('--batch', default='series_id', help="Batch column for dummies ('' for none)")
+    parser.add_argument('--permutations', type=int, default=0,
+                        help='Label permutations for max-T p-values and empirical q-values (Mann-Whitney, one contrast)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the label permutations')
+    parser.add_argument('--annotation', default=None,
+                        help='CSV with IlmnID, CHR, MAPINFO (e.g. backend/data/annotation_filtered.csv); also writes '
+                             'each table as a position-sorted, queryable results .h5 store')
+    parser.add_argument('--out-dir', default='./model/data/ewas/run')
+    parser.add_argument('--block-cols', type=int, default=8192)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--restart', action='store_true', help='Discard finished blocks instead of resuming')
+    args = parser.parse_args()
+    if args.permutations and (args.contrasts or args.test != 'mannwhitney'):
+        parser.error('--permutations needs --test mannwhitney and a single --case / --control contrast')
+
+    samples = sample_table(args.store, args.idmap)
+    kwargs = dict(out_dir=args.out_dir, block_cols=args.block_cols, n_jobs=args.n_jobs, resume=not args.restart)
+    covariates = dict(covariates=args.covariates, batch=args.batch or None)
+    if args.contrasts:
+        pairs = [tuple(contrast.split(':', 1)) for contrast in args.contrasts]
+        rows, masks, names = contrast_masks(samples, pairs)
+        for name, (case, control) in zip(names, masks):
+            print(f"EWAS {name}: {case.sum()} vs. {control.sum()} samples")
+        if args.test == 'linear':
+            design, terms = state_design_matrix(samples.iloc[rows], reference=args.control, **covariates)
+            print(f"Design terms: {terms}")
+            test_kwargs = {'model': LinearModel(design, terms), 'contrasts': contrast_matrix(terms, pairs, args.control),
+                           'names': names}
+            results = run_ewas(args.store, None, rows=rows, test=linear_contrasts_test, test_kwargs=test_kwargs, **kwargs)
+        else:
+            results = run_ewas(args.store, None, rows=rows, test=mannwhitney_contrasts_test,
+                               test_kwargs={'contrasts': masks, 'names': names}, **kwargs)
+    else:
+        rows, group = contrast_rows(samples, args.case, args.control)
+        print(f"EWAS: {group.sum()} {args.case} vs. {(~group).sum()} {args.control} samples")
+        if args.test == 'linear':
+            design, terms = design_matrix(samples.iloc[rows], group, **covariates)
+            print(f"Design terms: {terms}")
+            results = run_ewas(args.store, None, rows=rows, test=linear_test,
+                               test_kwargs={'model': LinearModel(design, terms)}, **kwargs)
+        elif args.permutations:
+            print(f"Permutation null: {args.permutations} label permutations (seed {args.seed})")
+            results = run_ewas(args.store, group, rows=rows, test=mannwhitney_permutation_test,
+                               test_kwargs={'permutations': permutation_matrix(group, args.permutations, args.seed)},
+                               **kwargs)
+        else:
+            results = run_ewas(args.store, group, rows=rows, **kwargs)
+        results = {None: results}
+
+    for name, table in results.items():
+        # Contrast names come from disease states, which may hold quotes or spaces
+        filename = 'results.csv' if name is None else f"results_{re.sub(r'[^0-9A-Za-z_.-]+', '', name)}.csv"
+        table.to_csv(os.path.join(args.out_dir, filename), index=False)
+        print(f"{int(table['significant'].sum())} CpGs significant at FDR 0.05"
+              f"{'' if name is None else ' for ' + name}; results saved to {os.path.join(args.out_dir, filename)}")
+        if args.annotation:
+            store_path = os.path.splitext(os.path.join(args.out_dir, filename))[0] + '.h5'
+            n_rows = write_result_store(store_path, table, args.annotation)
+            print(f"{n_rows} annotated CpGs saved to {store_path}")
+        if 'q_perm' in table:
+            print(f"Permutation null: {int(table['significant_perm'].sum())} CpGs at empirical FDR 0.05, "
+                  f"{int((table['p_maxT'] <= 0.05).sum())} at max-T p 0.05")
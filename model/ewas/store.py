@@ -0,0 +1,262 @@
+# Columnar EWAS result store: annotated, position-sorted columns with p-value and locus indexes for partial reads
+import os, json, shutil
+import h5py
+import numpy as np
+import pandas as pd
+
+from model.data.convert import open_store
+
+try:
+    import zarr
+except ImportError:
+    # Zarr output is optional, as for model.data.convert
+    zarr = None
+
+# Rows per column chunk; also the spacing of the in-memory fences of each index
+CHUNK_ROWS = 16384
+
+
+def chromosome_order(chromosomes):
+    """Natural chromosome order: numbered chromosomes ascending, then the rest (X, Y, MT, ...) by name."""
+    names = sorted(set(str(c) for c in chromosomes))
+    numbered = sorted((n for n in names if n.isdigit()), key=int)
+    return numbered + [n for n in names if not n.isdigit()]
+
+
+def annotate_results(results, annotation, cpg_ids=None):
+    """
+    Add IlmnID, CHR, MAPINFO and -log10_p to run_ewas results and sort them by genomic position
+
+    CpGs without a position in the annotation are dropped, as in the
+    Manhattan plot input.
+
+    Args:
+        results: run_ewas table with CpG_Index and p_value (and IlmnID when the store has CpG ids)
+        annotation: DataFrame or CSV path with IlmnID, CHR and MAPINFO (e.g. annotation_filtered.csv)
+        cpg_ids: CpG id per column index, used when results has no IlmnID
+
+    Returns:
+        pd.DataFrame: position-sorted results with CHR as str and MAPINFO as int64
+    """
+    if not isinstance(annotation, pd.DataFrame):
+        annotation = pd.read_csv(annotation, usecols=['IlmnID', 'CHR', 'MAPINFO'])
+    results = results.copy()
+    if 'IlmnID' not in results:
+        if cpg_ids is None:
+            raise ValueError("results have no IlmnID column; pass the store's cpg_ids")
+        results['IlmnID'] = np.asarray(cpg_ids).astype(str)[results['CpG_Index'].to_numpy()]
+    annotation = annotation[['IlmnID', 'CHR', 'MAPINFO']].dropna(subset=['CHR', 'MAPINFO'])
+    results = results.merge(annotation.drop_duplicates('IlmnID'), on='IlmnID', how='inner')
+    # Annotation CHR columns mix ints and strings ('1', 1.0, 'X'); normalize before ordering
+    chromosomes = results['CHR'].astype(str).str.replace(r'\.0$', '', regex=True)
+    results['CHR'] = chromosomes
+    results['MAPINFO'] = results['MAPINFO'].astype(np.int64)
+    rank = {name: i for i, name in enumerate(chromosome_order(chromosomes))}
+    results['_rank'] = chromosomes.map(rank).to_numpy()
+    results = results.sort_values(['_rank', 'MAPINFO'], kind='stable').drop(columns='_rank').reset_index(drop=True)
+    p = results['p_value'].to_numpy(dtype=np.float64)
+    results['-log10_p'] = -np.log10(np.where(p == 0, np.nextafter(0, 1), p))
+    return results
+
+
+def write_result_store(path, results, annotation=None, cpg_ids=None, chunk_rows=CHUNK_ROWS, compression_level=4):
+    """
+    Write EWAS results as a columnar store (.h5 / .zarr) that ResultStore queries without full scans
+
+    Rows are sorted by (chromosome, MAPINFO); each result column is its own
+    chunked dataset under `columns/`, with a second copy in p-value order
+    under `by_p/` so significance queries read a prefix rather than chunks
+    scattered over the genome. `index/` holds a monotone locus key per row with
+    per-chromosome row offsets (range queries), the sorted -log10_p
+    (threshold queries) and each by_p row's position row. The file is written to a temporary path and moved into
+    place, so readers never see a partial store.
+
+    Args:
+        path: Target .h5/.hdf5 file or .zarr directory
+        results: run_ewas table, or an annotate_results table when annotation is None
+        annotation: DataFrame or CSV path with IlmnID, CHR, MAPINFO
+        cpg_ids: CpG id per column index, when results has no IlmnID
+        chunk_rows: Rows per chunk of every column
+
+    Returns:
+        int: rows written
+    """
+    if annotation is not None:
+        results = annotate_results(results, annotation, cpg_ids=cpg_ids)
+    n = len(results)
+    chromosomes = results['CHR'].astype(str).to_numpy()
+    order = chromosome_order(chromosomes)
+    rank = pd.Series(np.arange(len(order)), index=order)[chromosomes].to_numpy(dtype=np.int64)
+    locus = (rank << 32) | results['MAPINFO'].to_numpy(dtype=np.int64)
+    if n and np.any(np.diff(locus) < 0):
+        raise ValueError("results must be sorted by chromosome and MAPINFO (see annotate_results)")
+    chrom_offsets = np.searchsorted(rank, np.arange(len(order) + 1))
+    # NaN p-values sort last and never match a threshold
+    by_p = np.argsort(results['p_value'].to_numpy(dtype=np.float64), kind='stable')
+    neg_log10_p = -results['-log10_p'].to_numpy(dtype=np.float64)[by_p]
+
+    index = {'locus': locus, 'chrom_offsets': chrom_offsets, 'chromosomes': np.asarray(order, dtype=str),
+             'by_p': by_p.astype(np.int64), 'neg_log10_p': neg_log10_p}
+    tmp = path.rstrip('/') + '.tmp' + ('.zarr' if _is_zarr(path) else '')
+    writer = _open_writer(tmp, chunk_rows, compression_level)
+    try:
+        for name in results.columns:
+            values = _column_values(results[name])
+            writer.write(f"columns/{name}", values)
+            writer.write(f"by_p/{name}", values[by_p])
+        for name, values in index.items():
+            writer.write(f"index/{name}", values)
+        writer.attrs({'n_rows': n, 'chunk_rows': chunk_rows, 'columns': list(results.columns)})
+    finally:
+        writer.close()
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return n
+
+
+def _column_values(series):
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        return np.asarray(series.astype(str).to_numpy(), dtype=str)
+    return series.to_numpy()
+
+
+class _H5Writer:
+    def __init__(self, path, chunk_rows, level):
+        self.file = h5py.File(path, 'w')
+        self.chunk_rows = chunk_rows
+        self.level = level
+
+    def write(self, name, values):
+        chunks = (max(1, min(self.chunk_rows, len(values))),)
+        if values.dtype.kind == 'U':
+            self.file.create_dataset(name, data=values.astype(object), dtype=h5py.string_dtype(), chunks=chunks,
+                                     compression='gzip', compression_opts=self.level)
+        else:
+            self.file.create_dataset(name, data=values, chunks=chunks, compression='gzip',
+                                     compression_opts=self.level, shuffle=True)
+
+    def attrs(self, attrs):
+        self.file.attrs['manifest'] = json.dumps(attrs)
+
+    def close(self):
+        self.file.close()
+
+
+class _ZarrWriter:
+    def __init__(self, path, chunk_rows, level):
+        if zarr is None:
+            raise ImportError("zarr is required to write .zarr stores (pip install zarr)")
+        self.group = zarr.open_group(path, mode='w')
+        self.chunk_rows = chunk_rows
+        self.level = level
+
+    def write(self, name, values):
+        chunks = (max(1, min(self.chunk_rows, len(values))),)
+        compressors = zarr.codecs.BloscCodec(cname='zstd', clevel=self.level, shuffle='bitshuffle') \
+            if values.dtype.kind != 'U' else 'auto'
+        self.group.create_array(name, shape=values.shape, chunks=chunks, dtype=values.dtype,
+                                compressors=compressors)[:] = values
+
+    def attrs(self, attrs):
+        self.group.attrs['manifest'] = json.dumps(attrs)
+
+    def close(self):
+        pass
+
+
+def _is_zarr(path):
+    return path.rstrip('/').lower().endswith('.zarr')
+
+
+def _open_writer(path, chunk_rows, level):
+    writer_cls = _ZarrWriter if _is_zarr(path) else _H5Writer
+    return writer_cls(path, chunk_rows, level)
+
+
+class ResultStore:
+    """
+    Read-only queries over a store from write_result_store
+
+    Only the small per-chunk fences of the sorted indexes are held in memory.
+    A query binary-searches the fences, reads the one chunk that holds each
+    boundary, and then reads one contiguous slice of the requested columns:
+    a chromosome range from the position-ordered columns, top-k / threshold
+    results from the leading rows of the p-ordered copy.
+
+    Args:
+        path: .h5 / .zarr result store
+    """
+    def __init__(self, path):
+        self.path = path
+        with open_store(path) as store:
+            manifest = json.loads(store.attrs['manifest'])
+            self.n_rows = manifest['n_rows']
+            self.chunk_rows = manifest['chunk_rows']
+            self.columns = manifest['columns']
+            self.chromosomes = list(_read(store['index/chromosomes']))
+            self.chrom_offsets = np.asarray(store['index/chrom_offsets'][:])
+            self._locus_fences = np.asarray(store['index/locus'][::self.chunk_rows])
+            self._p_fences = np.asarray(store['index/neg_log10_p'][::self.chunk_rows])
+
+    def __len__(self):
+        return self.n_rows
+
+    def table(self, columns=None):
+        """Every row, in position order."""
+        return self._rows(slice(0, self.n_rows), columns)
+
+    def top_k(self, k, columns=None):
+        """The k CpGs with the smallest p-values, most significant first."""
+        return self._rows(slice(0, min(k, self.n_rows)), columns, group='by_p')
+
+    def threshold(self, max_p=None, min_log10_p=None, columns=None):
+        """
+        CpGs with p <= max_p (or -log10_p >= min_log10_p), most significant first
+
+        e.g. a Bonferroni cut: threshold(max_p=alpha / len(store))
+        """
+        if (max_p is None) == (min_log10_p is None):
+            raise ValueError("Pass exactly one of max_p, min_log10_p")
+        if min_log10_p is None:
+            min_log10_p = -np.log10(max(max_p, np.nextafter(0, 1)))
+        with open_store(self.path) as store:
+            n = self._search(store['index/neg_log10_p'], self._p_fences, -min_log10_p, 'right')
+        return self._rows(slice(0, n), columns, group='by_p')
+
+    def region(self, chrom, start=None, end=None, columns=None):
+        """CpGs on `chrom` with start <= MAPINFO <= end (either bound optional), in position order."""
+        chrom = str(chrom)
+        if chrom not in self.chromosomes:
+            return self._rows(slice(0, 0), columns)
+        i = self.chromosomes.index(chrom)
+        lo, hi = int(self.chrom_offsets[i]), int(self.chrom_offsets[i + 1])
+        with open_store(self.path) as store:
+            locus = store['index/locus']
+            if start is not None:
+                lo = max(lo, self._search(locus, self._locus_fences, (i << 32) | int(start), 'left'))
+            if end is not None:
+                hi = min(hi, self._search(locus, self._locus_fences, (i << 32) | int(end), 'right'))
+        return self._rows(slice(lo, max(lo, hi)), columns)
+
+    def _search(self, dset, fences, value, side):
+        # The fences are every chunk_rows-th entry, so the position lies in one chunk
+        i = int(np.searchsorted(fences, value, side=side))
+        if i == 0:
+            return 0
+        start = (i - 1) * self.chunk_rows
+        chunk = np.asarray(dset[start:min(start + self.chunk_rows, self.n_rows)])
+        return start + int(np.searchsorted(chunk, value, side=side))
+
+    def _rows(self, rows, columns, group='columns'):
+        # Rows are indexed by their position order, also for the p-ordered copy
+        with open_store(self.path) as store:
+            data = {name: _read(store[f"{group}/{name}"], rows) for name in columns or self.columns}
+            index = np.arange(rows.start, rows.stop) if group == 'columns' else _read(store['index/by_p'], rows)
+        return pd.DataFrame(data, index=pd.Index(index, name='row'))
+
+
+def _read(dset, selection=slice(None)):
+    if isinstance(dset, h5py.Dataset) and h5py.check_string_dtype(dset.dtype) is not None:
+        return dset.asstr()[selection].astype(str)
+    return np.asarray(dset[selection])
@@ -0,0 +1,28 @@
+# Reduced-footprint ConvNet: strided convolutions + adaptive pooling keep fc1 independent of input_dim
+import torch
+import torch.nn as nn
+
+class CompactConvNet(nn.Module):
+	"""
+	ConvNet variant whose parameter count does not grow with the number of CpGs.
+	Two strided convolutions shrink the sequence 16x, then AdaptiveAvgPool1d
+	reduces it to `pool_size` positions per channel (pool_size=1: global pooling).
+	"""
+	def __init__(self, input_dim, hidden_dim=128, output_dim=3, channels=32, pool_size=16):
+		super(CompactConvNet, self).__init__()
+		self.conv1 = nn.Conv1d(in_channels=1, out_channels=channels // 2, kernel_size=7, stride=4, padding=3)
+		self.conv2 = nn.Conv1d(in_channels=channels // 2, out_channels=channels, kernel_size=5, stride=4, padding=2)
+		self.pool = nn.AdaptiveAvgPool1d(pool_size)
+		self.relu = nn.ReLU()
+		self.fc1 = nn.Linear(channels * pool_size, hidden_dim)
+		self.fc2 = nn.Linear(hidden_dim, output_dim)
+
+	def forward(self, x):
+		x = x.unsqueeze(1)          # (batch_size, 1, input_dim)
+		x = self.relu(self.conv1(x))  # (batch_size, channels/2, input_dim/4)
+		x = self.relu(self.conv2(x))  # (batch_size, channels, input_dim/16)
+		x = self.pool(x)            # (batch_size, channels, pool_size)
+		x = x.flatten(1)
+		x = self.relu(self.fc1(x))
+		x = self.fc2(x)
+		return x
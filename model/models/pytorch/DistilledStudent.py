@@ -0,0 +1,35 @@
+# Compact student distilled from the XGBoost pipeline, servable as a single TorchScript file
+import torch
+import torch.nn as nn
+
+from model.models.pytorch.SimpleMLP import SimpleMLP
+
+class DistilledStudent(nn.Module):
+    """
+    SimpleMLP over a fixed CpG selection with the preprocessing baked in as
+    buffers, so it takes the same raw rows as the XGBoost pipeline: select the
+    student's columns, mean-impute NaNs, standardize, then classify.
+    """
+    def __init__(self, columns, mean, scale, hidden_dims=[64, 32], output_dim=3, dropout_rate=0.1):
+        super(DistilledStudent, self).__init__()
+        self.register_buffer('columns', torch.as_tensor(columns, dtype=torch.long))
+        self.register_buffer('mean', torch.as_tensor(mean, dtype=torch.float32))
+        self.register_buffer('scale', torch.as_tensor(scale, dtype=torch.float32))
+        self.network = SimpleMLP(len(columns), hidden_dims=list(hidden_dims), output_dim=output_dim,
+                                 dropout_rate=dropout_rate)
+
+    def preprocess(self, x):
+        x = x.index_select(1, self.columns)
+        x = torch.where(torch.isnan(x), self.mean, x)
+        return (x - self.mean) / self.scale
+
+    def forward(self, x):
+        return self.network(self.preprocess(x))
+
+    @torch.jit.export
+    def predict_proba(self, x):
+        return torch.softmax(self.forward(x), dim=1)
+
+    @torch.jit.export
+    def predict(self, x):
+        return torch.argmax(self.forward(x), dim=1)
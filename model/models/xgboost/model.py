@@ -2,13 +2,98 @@ from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.model_selection import GridSearchCV
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.model_selection import train_test_split
 from xgboost import XGBClassifier
 from sklearn.metrics import accuracy_score
+import numpy as np
 import joblib, os
 
+from model.utils.telemetry import NULL_TIMER
+
+class StatsStandardizer(BaseEstimator, TransformerMixin):
+    """
+    Mean imputation + standard scaling from precomputed per-CpG stats
+    (see model.data.stats), so fitting does not rescan the training matrix.
+    Equivalent to SimpleImputer(strategy='mean') -> StandardScaler fit on the
+    rows the stats were computed from.
+
+    The sidecar describes every row of the store, so it is only used when fit
+    sees that many rows. Any other X (a CV fold, the first rows of the store)
+    is fit on its own rows, as the imputer and scaler would be, so validation
+    rows and rows never loaded cannot leak into the fit.
+    """
+    def __init__(self, column_stats):
+        self.column_stats = column_stats
+
+    def fit(self, X, y=None):
+        stats = self.column_stats
+        if X is not None and X.shape[1] != stats['mean'].shape[0]:
+            raise ValueError(f"column_stats describe {stats['mean'].shape[0]} features, got {X.shape[1]}")
+        if X is not None and X.shape[0] != int(stats['n_rows']):
+            X = np.asarray(X, dtype=np.float64)
+            valid = ~np.isnan(X)
+            count = valid.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(valid, X, 0.0).sum(axis=0) / count
+                var = (np.where(valid, X - mean, 0.0) ** 2).sum(axis=0) / count
+            stats = {'n_rows': X.shape[0], 'nan_count': X.shape[0] - count, 'mean': mean, 'var': var}
+        n_rows = float(stats['n_rows'])
+        self.mean_ = np.nan_to_num(stats['mean'], nan=0.0)
+        # Imputed cells sit on the mean, so they shrink the variance StandardScaler would see
+        observed = (n_rows - stats['nan_count']) / n_rows
+        var = np.nan_to_num(stats['var'], nan=0.0) * observed
+        self.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+        return self
+
+    def transform(self, X):
+        X = np.where(np.isnan(X), self.mean_, X)
+        return (X - self.mean_) / self.scale_
+
+def fit_pipeline(pipeline, X_train, y_train, X_val=None, y_val=None, eval_fraction=0.1, random_state=42, timer=None):
+    """
+    Fit the preprocessor -> classifier pipeline. When the classifier has
+    `early_stopping_rounds`, boosting is monitored on (X_val, y_val), or on a
+    stratified `eval_fraction` hold-out of the training rows if none is given.
+    The eval set goes through the preprocessor fitted on the training rows.
+    With a model.utils.telemetry.StageTimer, time is split into 'preprocess' and 'fit'.
+
+    Returns:
+        dict: trees_built / best_iteration / trees_saved, or None without early stopping
+    """
+    timer = timer or NULL_TIMER
+    preprocessor = pipeline.named_steps['preprocessor']
+    classifier = pipeline.named_steps['classifier']
+    if classifier.get_params().get('early_stopping_rounds') is None:
+        # Same steps as pipeline.fit, kept separate so each can be timed
+        with timer.stage('preprocess'):
+            X_train_t = preprocessor.fit_transform(X_train, y_train)
+        with timer.stage('fit'):
+            classifier.fit(X_train_t, y_train)
+        return None
+
+    if X_val is None:
+        X_train, X_val, y_train, y_val = train_test_split(
+            X_train, y_train, test_size=eval_fraction, stratify=y_train, random_state=random_state)
+    with timer.stage('preprocess'):
+        X_train_t = preprocessor.fit_transform(X_train, y_train)
+        X_val_t = preprocessor.transform(X_val)
+    with timer.stage('fit'):
+        classifier.fit(X_train_t, y_train, eval_set=[(X_val_t, y_val)], verbose=False)
+
+    return early_stopping_info(classifier)
+
+def early_stopping_info(classifier):
+    """Trees built / saved by a classifier fit with early stopping."""
+    trees_built = classifier.get_booster().num_boosted_rounds()
+    return {
+        'trees_built': trees_built,
+        'best_iteration': int(classifier.best_iteration),
+        'trees_saved': classifier.get_params()['n_estimators'] - trees_built,
+    }
+
 class XGBoostModel:
-    def __init__(self, params=None):
+    def __init__(self, params=None, column_stats=None, selector=None):
         if params is None:
             params = {
                 'objective': 'binary:logistic',
@@ -20,11 +105,27 @@ class XGBoostModel:
             }
         self.params = params
 
+        self.column_stats = column_stats
+        self.selector = selector
+
         # Define preprocessing for numerical and categorical features
-        preprocessor = Pipeline(steps=[
-            ('imputer', SimpleImputer(strategy='mean')),
-            ('scaler', StandardScaler())
-        ])
+        if selector is not None:
+            # CpG pre-filter fit per training fold; imputation/scaling then only touch the selected columns
+            preprocessor = Pipeline(steps=[
+                ('selector', clone(selector)),
+                ('imputer', SimpleImputer(strategy='mean')),
+                ('scaler', StandardScaler())
+            ])
+        elif column_stats is not None:
+            # Reuse the stats sidecar instead of recomputing means/variances on every fit
+            preprocessor = Pipeline(steps=[
+                ('standardizer', StatsStandardizer(column_stats))
+            ])
+        else:
+            preprocessor = Pipeline(steps=[
+                ('imputer', SimpleImputer(strategy='mean')),
+                ('scaler', StandardScaler())
+            ])
 
         # Define Final Model Pipeline
         self.model = Pipeline(steps=[
@@ -32,8 +133,33 @@ class XGBoostModel:
             ('classifier', XGBClassifier(**self.params))
         ])
 
-    def train(self, X_train, y_train):
-        self.model.fit(X_train, y_train)
+    def train(self, X_train, y_train, X_val=None, y_val=None):
+        # With early_stopping_rounds in params, boosting stops once the eval loss plateaus
+        self.early_stopping_info = fit_pipeline(self.model, X_train, y_train, X_val, y_val)
+        if self.early_stopping_info is not None:
+            info = self.early_stopping_info
+            print(f"Early stopping: best iteration {info['best_iteration']}, built {info['trees_built']} trees "
+                  f"({info['trees_saved']} saved)")
+
+    def train_external(self, store_path, labels, rows=None, columns=None, **kwargs):
+        """
+        Train on an HDF5 / zarr store streamed in row blocks instead of an
+        in-memory matrix (QuantileDMatrix / external memory, `hist` trees);
+        see model.utils.xgboost.external.train_external for the options.
+        Afterwards predict() and save_model() work as after train().
+        """
+        # Imported here: the external trainer builds on the standardizer defined in this file
+        from model.utils.xgboost.external import train_external
+
+        if self.selector is not None:
+            raise ValueError("train_external streams raw columns; pass the selected CpGs as `columns` instead of a selector")
+        self.model, self.early_stopping_info = train_external(
+            self.params, store_path, labels, rows=rows, columns=columns, column_stats=self.column_stats, **kwargs)
+        self.column_stats = self.model.named_steps['preprocessor'].named_steps['standardizer'].column_stats
+        if self.early_stopping_info is not None:
+            info = self.early_stopping_info
+            print(f"Early stopping: best iteration {info['best_iteration']}, built {info['trees_built']} trees "
+                  f"({info['trees_saved']} saved)")
 
     def predict(self, X):
         return self.model.predict(X)
@@ -43,10 +169,44 @@ class XGBoostModel:
         accuracy = accuracy_score(y_test, y_pred)
         return accuracy
     
-    def search_cv(self, params, X_train, y_train):
-        grid_search = GridSearchCV(self.model, params, cv=5, scoring='recall_weighted')
-        grid_search.fit(X_train, y_train)
-        return grid_search.best_estimator_
+    def search_cv(self, params, X_train, y_train, n_jobs=None, trial_log=None, **search_kwargs):
+        """
+        Successive-halving search over `params` (pipeline parameter names, e.g.
+        'classifier__max_depth'); see model.utils.xgboost.search.
+
+        Returns:
+            XGBoostModel: new unfitted model built with the best parameters
+        """
+        # Imported here: the search module builds on fit helpers defined in this file
+        from model.utils.xgboost.search import SuccessiveHalvingSearch
+
+        search = SuccessiveHalvingSearch(self.model, params, n_jobs=n_jobs, trial_log=trial_log, **search_kwargs)
+        search.fit(X_train, y_train)
+
+        best_params = dict(self.params)
+        other_params = {}
+        for name, value in search.best_params_.items():
+            if name.startswith('classifier__'):
+                best_params[name[len('classifier__'):]] = value
+            else:
+                other_params[name] = value
+        best_model = XGBoostModel(params=best_params, column_stats=self.column_stats, selector=self.selector)
+        best_model.model.set_params(**other_params)
+        best_model.search_results = search.results_
+        return best_model
     
-    def save_model(self, path):
-        joblib.dump(self.model, os.path.join(path, 'xgboost_model.pkl'))
\ No newline at end of file
+    def save_model(self, path, features=None):
+        """
+        Save the fitted pipeline as `xgboost_model.pkl` (training-side checkpoint) and
+        as the self-describing serving artifact in `<path>/artifact`
+
+        Args:
+            features: Ordered CpG ids of the input columns, recorded in the artifact manifest
+        """
+        from model.utils.artifact import save_xgboost_artifact
+
+        joblib.dump(self.model, os.path.join(path, 'xgboost_model.pkl'))
+        preprocessor = self.model.named_steps['preprocessor']
+        if 'selector' in preprocessor.named_steps:
+            preprocessor.named_steps['selector'].save(os.path.join(path, 'selected_features.json'))
+        save_xgboost_artifact(os.path.join(path, 'artifact'), self.model, features=features)
\ No newline at end of file
@@ -0,0 +1,51 @@
+import os, argparse, json
+import joblib
+
+from model.data.loaders.loader_xgboost import load_data_h5
+from model.data.cache import CACHE_DIR
+from model.utils.feature_selection import CpGSelector
+from model.utils.pytorch.distill import distill, export_student
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the trained XGBoost pipeline into a compact MLP student.")
+    parser.add_argument('--teacher', default='./model/models/xgboost/xgboost_model.pkl', help='Fitted XGBoost pipeline')
+    parser.add_argument('--select-k', type=int, default=0,
+                        help="CpGs for the student when the teacher has no selector (EWAS-ranked, 0: all)")
+    parser.add_argument('--hidden-dims', nargs='+', type=int, default=[64, 32])
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help='Weight of the soft-label loss vs. the hard labels')
+    parser.add_argument('--no-refit-teacher', action='store_true',
+                        help='Distill the loaded teacher as is; its reported metrics are then in-sample')
+    parser.add_argument('--out', default='./model/models/distill/student.pt')
+    args = parser.parse_args()
+
+    # Same training cohort / feature layout the teacher was trained on
+    data_train_h5 = './model/data/train/methylation.h5'
+    idmap_train_path = './model/data/train/idmap.csv'
+    X_train, y_train = load_data_h5(data_train_h5, idmap_train_path, cache_dir=CACHE_DIR)
+    print(f"Train data shape: {X_train.shape}, Train label shape: {y_train.shape}")
+
+    teacher = joblib.load(args.teacher)
+    # The student reads the teacher's selected CpGs when it has a selector stage, else its own EWAS top-k;
+    # both are fit without the report's hold-out rows
+    selector = CpGSelector(k=args.select_k, method='ewas') if args.select_k else None
+    student, report = distill(teacher, X_train, y_train, selector=selector, refit_teacher=not args.no_refit_teacher,
+                              hidden_dims=args.hidden_dims, epochs=args.epochs, alpha=args.alpha,
+                              temperature=args.temperature)
+
+    if report['evaluation'] == 'held_out':
+        print("Distillation Results (held-out rows; teacher refit without them):")
+    else:
+        print("Distillation Results (teacher metrics are IN-SAMPLE: the teacher was trained on these rows):")
+    print(f"Teacher Accuracy: {report['teacher_accuracy']:.4f}, Student Accuracy: {report['student_accuracy']:.4f} "
+          f"(delta {report['accuracy_delta']:+.4f})")
+    print(f"Agreement: {report['agreement']:.4f}")
+    print(f"Single-sample latency: teacher {report['teacher_latency_ms']:.2f} ms, "
+          f"student {report['student_latency_ms']:.2f} ms")
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    export_student(student, args.out)
+    with open(os.path.splitext(args.out)[0] + '_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Student saved to {args.out}")
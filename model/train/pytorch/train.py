@@ -2,40 +2,68 @@ import torch
 import torch.optim as optim
 import torch.nn as nn
 from torch.utils.data import DataLoader
-import os
+import os, argparse
 
 # Helpers
 from model.utils.pytorch.train_loop import train_loop
 from model.utils.pytorch.test_loop import test_loop
 from model.utils.pytorch.cross_validate import cross_validate_model
+from model.utils.pytorch.early_stopping import train_with_early_stopping
 
 # Import custom Dataset
-from model.data.loaders.loader_pytorch import MethylationAlzheimerDataset
+from model.data.loaders.loader_pytorch import MethylationTensorDataset, batch_loader, load_feature_ids
+from model.data.cache import CACHE_DIR
+from model.utils.feature_selection import CpGSelector
+from model.utils.telemetry import Telemetry
+from model.utils.artifact import save_pytorch_artifact
 # Models
 from model.models.pytorch.ConvNet  import ConvNet
 from model.models.pytorch.RegularizedMLP import RegularizedMLP
 from model.models.pytorch.SimpleMLP import SimpleMLP
 
 if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Train the PyTorch model with k-fold CV.")
+	parser.add_argument('--select-k', type=int, default=0, help='Keep only the top-k CpGs, ranked per training fold (0: all)')
+	parser.add_argument('--select-method', choices=['variance', 'ewas'], default='ewas', help='CpG ranking for --select-k')
+	parser.add_argument('--telemetry', default=None, help='Append per-epoch timing of the final fit to this run log (.jsonl or .csv)')
+	parser.add_argument('--profile-epochs', nargs='*', type=int, default=[], help='Final-fit epochs to capture with torch.profiler')
+	args = parser.parse_args()
+	selector = CpGSelector(k=args.select_k, method=args.select_method) if args.select_k else None
+
 	h5_path = "./model/data/train/methylation.csv"
 	mapping_csv_path = "./model/data/train/idmap.csv"
 	
 	# Run cross validation
-	results = cross_validate_model(h5_path, mapping_csv_path, batch_size=32, epochs=20, lr=1e-3, k=5)
+	results = cross_validate_model(h5_path, mapping_csv_path, batch_size=32, epochs=20, lr=1e-3, k=5, cache_dir=CACHE_DIR,
+								   patience=3, selector=selector)
 	
-	# Train final model on full dataset
-	dataset = MethylationAlzheimerDataset(h5_path, mapping_csv_path)
+	# Train final model on the full dataset (parsed arrays come from the cache filled by CV)
+	dataset = MethylationTensorDataset.from_files(h5_path, mapping_csv_path, cache_dir=CACHE_DIR)
 	input_dim = dataset.data.shape[1]
-	dataloader = DataLoader(dataset, batch_size=32, shuffle=True)
+	# Hold out 10% of the samples to monitor the loss for early stopping
+	order = torch.randperm(len(dataset))
+	n_monitor = max(1, len(dataset) // 10)
+	if selector is not None:
+		# Rank on the training rows only (not the monitor hold-out), then keep the selected columns
+		X_fit, y_fit = dataset[order[n_monitor:]]
+		selector.fit(X_fit.numpy(), y_fit.numpy())
+		dataset = dataset.select_columns(selector.selected_)
+		input_dim = len(selector.selected_)
+		selector.save("./model/models/pytorch/selected_features.json")
+	dataloader = batch_loader(dataset.subset(order[n_monitor:]), batch_size=32, shuffle=True)
+	monitor_loader = batch_loader(dataset.subset(order[:n_monitor]), batch_size=32)
 	
 	model = ConvNet(input_dim)
 	criterion = nn.CrossEntropyLoss()
 	optimizer = optim.Adam(model.parameters(), lr=1e-3)
 	
+	telemetry = Telemetry(args.telemetry, profile_epochs=args.profile_epochs) if args.telemetry or args.profile_epochs else None
 	print("\nTraining final model on full dataset...")
-	for epoch in range(3):
-		print(f"Epoch {epoch + 1}/3")
-		model = train_loop(dataloader, model, criterion, optimizer, batch_size=32)
+	model, stopper = train_with_early_stopping(dataloader, monitor_loader, model, criterion, optimizer, batch_size=32,
+											   max_epochs=20, patience=3, telemetry=telemetry)
 	
-	torch.save(model.state_dict(), "./model/models/pytorch/model.pkl")
-	print("Model saved to ./model/models/pytorch/model.pkl")
\ No newline at end of file
+	# Weights, CpG ids, selected columns and architecture in one mmap-loadable artifact
+	artifact_path = "./model/models/pytorch/artifact"
+	save_pytorch_artifact(artifact_path, model, {'input_dim': input_dim}, features=load_feature_ids(h5_path),
+						  preprocessing={'columns': selector.selected_} if selector is not None else None)
+	print(f"Model saved to {artifact_path}")
\ No newline at end of file
@@ -1,6 +1,8 @@
 from model.models.xgboost.model import XGBoostModel
+from model.utils.xgboost.parallel import run_folds
+from model.utils.xgboost.preprocess_cache import PreprocessCache
 from sklearn.model_selection import train_test_split, KFold
-from sklearn.metrics import precision_score, recall_score, accuracy_score, f1_score
+from model.utils.metrics import confusion, classification_metrics
 
 import pandas as pd
 import numpy as np
@@ -9,26 +11,44 @@ import time, os, argparse
 import sys
 sys.path.append('./model')
 
-from data.loaders.loader_xgboost import load_data, load_data_h5
+from data.loaders.loader_xgboost import load_data, load_data_h5, load_labels_h5, load_feature_ids_h5
+from model.data.convert import open_store, read_ids
+from model.data.cache import CACHE_DIR
+from model.utils.feature_selection import CpGSelector
+from model.utils.telemetry import RunLog
 
-def kfold_cv(model, X, y, k=5):
+def kfold_cv(model, X, y, k=5, n_jobs=None, preprocess_dir=None, run_log=None):
     """
     Perform K-Fold Cross Validation
+
+    Folds are fit concurrently on clones of the model pipeline, with `n_jobs`
+    cores split between fold processes and XGBoost threads. With
+    `preprocess_dir`, the preprocessor fitted on each fold is kept on disk and
+    reused by later runs on the same data, so only the classifier is refit.
+    With a model.utils.telemetry.RunLog, each fold's stage timing, throughput,
+    peak RSS and scores are appended to it.
     """
     kf = KFold(n_splits=k, shuffle=True, random_state=42)
+    folds = list(kf.split(X))
     precision_list, recall_list, accuracy_list, f1_list = [], [], [], []
 
-    for train_index, val_index in kf.split(X):
-        X_train, X_val = X[train_index], X[val_index]
-        y_train, y_val = y[train_index], y[val_index]
+    cache = PreprocessCache(X, cache_dir=preprocess_dir) if preprocess_dir is not None else None
+    fold_results = run_folds(model.model, X, y, folds, n_jobs=n_jobs, cache=cache)
 
-        model.train(X_train, y_train)
-        y_pred = model.predict(X_val)
+    for fold, ((train_index, val_index), (y_pred, info, timings)) in enumerate(zip(folds, fold_results)):
+        if info is not None:
+            print(f"Fold early stopping: {info['trees_built']} trees built, {info['trees_saved']} saved")
+        # One confusion matrix per fold, every metric derived from it
+        scores = classification_metrics(confusion(y[val_index], y_pred, num_classes=int(y.max()) + 1))
 
-        precision_list.append(precision_score(y_val, y_pred, average='weighted'))
-        recall_list.append(recall_score(y_val, y_pred, average='weighted'))
-        accuracy_list.append(accuracy_score(y_val, y_pred))
-        f1_list.append(f1_score(y_val, y_pred, average='weighted'))
+        precision_list.append(scores['precision_weighted'])
+        recall_list.append(scores['recall_weighted'])
+        accuracy_list.append(scores['accuracy'])
+        f1_list.append(scores['f1_weighted'])
+        if run_log is not None:
+            run_log.log(stage='xgboost_fold', fold=fold + 1, train_samples=len(train_index), **timings,
+                        accuracy=scores['accuracy'], recall_weighted=scores['recall_weighted'],
+                        trees_built=info['trees_built'] if info is not None else None)
     
     return precision_list, recall_list, accuracy_list, f1_list
 
@@ -37,6 +57,17 @@ def kfold_cv(model, X, y, k=5):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train XGBoost model with optional grid search.")
     parser.add_argument('--grid-search', action='store_true', help='Run grid search for hyperparameters')
+    parser.add_argument('--n-jobs', type=int, default=None, help='Cores shared by parallel CV folds (default: all)')
+    parser.add_argument('--trial-log', default='./model/models/xgboost/search_trials.jsonl',
+                        help='JSONL log of finished search trials; an interrupted search resumes from it')
+    parser.add_argument('--select-k', type=int, default=0, help='Keep only the top-k CpGs, ranked per training fold (0: all)')
+    parser.add_argument('--select-method', choices=['variance', 'ewas'], default='ewas', help='CpG ranking for --select-k')
+    parser.add_argument('--external', action='store_true',
+                        help='Train on every CpG and sample by streaming HDF5 blocks into XGBoost (no CV)')
+    parser.add_argument('--external-memory', action='store_true',
+                        help='With --external, page the quantised matrix to disk instead of holding it in RAM')
+    parser.add_argument('--telemetry', default=None, help='Append per-fold stage timing to this run log (.jsonl or .csv)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-parse the training data instead of using the dataset cache')
     args = parser.parse_args()
 
     # Train Options (Settings)
@@ -52,6 +83,7 @@ if __name__ == "__main__":
         "colsample_bytree": 1,
         "reg_alpha": 0,
         "reg_lambda": 1,
+        "early_stopping_rounds": 10,
         "random_state": int(time.time()),
     }
 
@@ -65,38 +97,58 @@ if __name__ == "__main__":
 
     # Load Train Data
     # X_train, y_train = load_data(data_train_path, idmap_train_path)
-    X_train, y_train = load_data_h5(data_train_h5, idmap_train_path)
+    cache_dir = None if args.no_cache else CACHE_DIR
+    preprocess_dir = None if args.no_cache else os.path.join(CACHE_DIR, 'preprocess')
+    if args.external:
+        # Memory is bounded by the block size, so no feature/sample cap applies
+        y_train = load_labels_h5(data_train_h5, idmap_train_path)
+        model = XGBoostModel(params=params)
+        model.train_external(data_train_h5, y_train, external_memory=args.external_memory)
+        save_path = './model/models/xgboost/'
+        os.makedirs(save_path, exist_ok=True)
+        with open_store(data_train_h5) as store:
+            model.save_model(save_path, features=read_ids(store, 'cpg_ids'))
+        sys.exit(0)
+
+    X_train, y_train, column_stats = load_data_h5(data_train_h5, idmap_train_path, return_stats=True, cache_dir=cache_dir)
     print(f"Train data shape: {X_train.shape}, Train label shape: {y_train.shape}")
+    # CpG ids of the loaded columns, recorded in the saved artifact
+    features = load_feature_ids_h5(data_train_h5)
 
-    model = XGBoostModel(params=params)
+    selector = CpGSelector(k=args.select_k, method=args.select_method) if args.select_k else None
+    model = XGBoostModel(params=params, column_stats=column_stats, selector=selector)
 
     if args.grid_search:
         # Run Search for Best Model HPs
         search_params = {
-            # "max_depth": [3,5,7,10],
-            # "n_estimators": [50, 100, 200],
-            # "learning_rate": [0.01, 0.1, 0.3],
-            # "reg_alpha": [0, 0.01, 0.05, 0.1],
-            # "reg_lambda": [0, 0.01, 0.05, 0.1],
-            "classifier__solver": ['liblinear', 'lbfgs'],
-            "classifier__C": [0.1, 1, 10]
+            "classifier__max_depth": [3, 5, 7, 10],
+            "classifier__learning_rate": [0.01, 0.1, 0.3],
+            "classifier__reg_alpha": [0, 0.01, 0.1],
+            "classifier__reg_lambda": [0.1, 1],
         }
-        best_model = model.search_cv(search_params, X_train, y_train)
+        # n_estimators is the halving budget: candidates grow from few trees on a
+        # subsample to params["n_estimators"] trees on all rows
+        best_model = model.search_cv(search_params, X_train, y_train, n_jobs=args.n_jobs, trial_log=args.trial_log,
+                                      cache_dir=preprocess_dir)
         best_model.train(X_train, y_train)
         # Save Model
         save_path = './model/models/xgboost/'
         os.makedirs(save_path, exist_ok=True)
-        best_model.save_model(save_path)
+        best_model.save_model(save_path, features=features)
     else:
         # Standard training
-        precision_list, recall_list, accuracy_list, f1_list = kfold_cv(model, X_train, y_train)
+        precision_list, recall_list, accuracy_list, f1_list = kfold_cv(model, X_train, y_train, n_jobs=args.n_jobs,
+                                                                          preprocess_dir=preprocess_dir,
+                                                                          run_log=RunLog(args.telemetry) if args.telemetry else None)
         # Print results
         print(f"K-Fold CV Results (k=5):")
         print(f"Precision: {np.mean(precision_list):.4f} ± {np.std(precision_list):.4f}")
         print(f"Recall: {np.mean(recall_list):.4f} ± {np.std(recall_list):.4f}")
         print(f"Accuracy: {np.mean(accuracy_list):.4f} ± {np.std(accuracy_list):.4f}")
         print(f"F1 Score: {np.mean(f1_list):.4f} ± {np.std(f1_list):.4f}")
+        # CV folds train clones, so fit the saved model on the full training set
+        model.train(X_train, y_train)
         # Save Model
         save_path = './model/models/xgboost/'
         os.makedirs(save_path, exist_ok=True)
-        model.save_model(save_path)
\ No newline at end of file
+        model.save_model(save_path, features=features)
\ No newline at end of file
@@ -0,0 +1,226 @@
+# Self-describing model artifact: one directory holding weights, feature list, preprocessing and a content hash
+import os, json, time, shutil, hashlib, importlib
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+MANIFEST = 'manifest.json'
+FORMAT = 'methylation-artifact'
+VERSION = 1
+PREPROCESSING_FIELDS = ('columns', 'fill', 'mean', 'scale')
+
+
+class ColumnStandardizer(BaseEstimator, TransformerMixin):
+    """
+    Fitted-from-arrays preprocessing restored from an artifact: keep `columns`,
+    replace NaNs with `fill`, then standardize with `mean` / `scale`. Any of the
+    arrays may be None to skip that step.
+
+    With dtype=None the input float dtype is kept and the statistics are cast to
+    it, as SimpleImputer / StandardScaler do; StatsStandardizer computes in
+    float64. Matching the original arithmetic keeps tree splits bit-identical.
+    """
+    def __init__(self, columns=None, fill=None, mean=None, scale=None, dtype=None):
+        self.columns = columns
+        self.fill = fill
+        self.mean = mean
+        self.scale = scale
+        self.dtype = dtype
+
+    def fit(self, X=None, y=None):
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X)
+        dtype = self.dtype or (X.dtype if np.issubdtype(X.dtype, np.floating) else np.float64)
+        if self.columns is not None:
+            X = X[:, self.columns]
+        X = X.astype(dtype, copy=True)
+        if self.fill is not None:
+            mask = np.isnan(X)
+            X[mask] = np.broadcast_to(np.asarray(self.fill, dtype=dtype), X.shape)[mask]
+        if self.mean is not None:
+            X -= np.asarray(self.mean, dtype=dtype)
+            X /= np.asarray(self.scale, dtype=dtype)
+        return X
+
+
+class TorchClassifier:
+    """predict / predict_proba over numpy rows for a restored PyTorch module."""
+    def __init__(self, module, preprocessor=None):
+        self.module = module.eval()
+        self.preprocessor = preprocessor
+
+    def _forward(self, X):
+        import torch
+        if self.preprocessor is not None:
+            X = self.preprocessor.transform(X)
+        with torch.no_grad():
+            return self.module(torch.as_tensor(np.asarray(X, dtype=np.float32)))
+
+    def predict_proba(self, X):
+        import torch
+        return torch.softmax(self._forward(X), dim=1).numpy()
+
+    def predict(self, X):
+        return self._forward(X).argmax(dim=1).numpy()
+
+
+def pipeline_preprocessing(pipeline):
+    """
+    Flatten a fitted XGBoostModel preprocessor (selector / imputer / scaler, or
+    StatsStandardizer) into the arrays ColumnStandardizer applies.
+    """
+    steps = pipeline.named_steps['preprocessor'].named_steps
+    arrays = {}
+    if 'selector' in steps:
+        arrays['columns'] = np.asarray(steps['selector'].selected_, dtype=np.int64)
+    if 'standardizer' in steps:
+        arrays['fill'] = steps['standardizer'].mean_
+        arrays['mean'] = steps['standardizer'].mean_
+        arrays['scale'] = steps['standardizer'].scale_
+    if 'imputer' in steps:
+        arrays['fill'] = steps['imputer'].statistics_
+    if 'scaler' in steps:
+        arrays['mean'] = steps['scaler'].mean_
+        arrays['scale'] = steps['scaler'].scale_
+    return arrays
+
+
+def save_xgboost_artifact(path, pipeline, features=None, metadata=None):
+    """Write a fitted preprocessor -> XGBClassifier pipeline as an artifact directory."""
+    classifier = pipeline.named_steps['classifier']
+
+    def write(tmp):
+        classifier.get_booster().save_model(os.path.join(tmp, 'booster.ubj'))
+        # StatsStandardizer promotes to float64, imputer / scaler keep the input dtype
+        float64 = 'standardizer' in pipeline.named_steps['preprocessor'].named_steps
+        return {'weights': 'booster.ubj', 'classes': np.asarray(classifier.classes_).tolist(),
+                'preprocessing_dtype': 'float64' if float64 else None,
+                'params': {k: v for k, v in classifier.get_params().items() if _jsonable(v)}}
+
+    return _write_artifact(path, 'xgboost', write, features, pipeline_preprocessing(pipeline), metadata)
+
+
+def save_pytorch_artifact(path, model, architecture_kwargs, features=None, preprocessing=None, metadata=None):
+    """
+    Write a PyTorch module as an artifact directory. The class is recorded by
+    import path and rebuilt with `architecture_kwargs` on load.
+    """
+    import torch
+
+    def write(tmp):
+        state = {name: t.detach().cpu().contiguous() for name, t in model.state_dict().items()}
+        torch.save(state, os.path.join(tmp, 'weights.pt'))
+        return {'weights': 'weights.pt',
+                'architecture': {'module': type(model).__module__, 'class': type(model).__name__,
+                                 'kwargs': architecture_kwargs}}
+
+    return _write_artifact(path, 'pytorch', write, features, preprocessing or {}, metadata)
+
+
+def load_artifact(path, verify=False):
+    """
+    Load an artifact directory as a servable classifier
+
+    Weights are memory-mapped: torch.load(mmap=True) with assign=True keeps the
+    tensors backed by the file, and preprocessing arrays use np.load(mmap_mode='r'),
+    so processes loading the same artifact share pages instead of copying.
+
+    Returns:
+        XGBoost: preprocessor -> XGBClassifier Pipeline; PyTorch: TorchClassifier.
+        Either carries `.manifest`, `.features` (input CpG ids) and
+        `.selected_features` (CpG ids after column selection, i.e. what the
+        classifier sees).
+    """
+    manifest = read_manifest(path)
+    if verify:
+        verify_artifact(path, manifest)
+    arrays = {name: np.load(os.path.join(path, fname), mmap_mode='r')
+              for name, fname in manifest['preprocessing'].items()}
+    preprocessor = ColumnStandardizer(**arrays, dtype=manifest.get('preprocessing_dtype')) if arrays else None
+
+    if manifest['kind'] == 'xgboost':
+        from xgboost import XGBClassifier
+        classifier = XGBClassifier(**manifest['params'])
+        classifier.load_model(os.path.join(path, manifest['weights']))
+        model = Pipeline(steps=[('preprocessor', preprocessor or ColumnStandardizer()), ('classifier', classifier)])
+    elif manifest['kind'] == 'pytorch':
+        import torch
+        arch = manifest['architecture']
+        module = getattr(importlib.import_module(arch['module']), arch['class'])(**arch['kwargs'])
+        state = torch.load(os.path.join(path, manifest['weights']), map_location='cpu', mmap=True, weights_only=True)
+        module.load_state_dict(state, assign=True)
+        model = TorchClassifier(module, preprocessor)
+    else:
+        raise ValueError(f"Unknown artifact kind: {manifest['kind']}")
+    model.manifest = manifest
+    model.features = manifest['features']
+    model.selected_features = model.features
+    if model.features is not None and 'columns' in arrays:
+        model.selected_features = [model.features[i] for i in arrays['columns']]
+    return model
+
+
+def read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No {MANIFEST} in {path}; not a model artifact")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT or manifest.get('version', 0) > VERSION:
+        raise ValueError(f"Unsupported artifact format in {path}: {manifest.get('format')} v{manifest.get('version')}")
+    return manifest
+
+
+def verify_artifact(path, manifest=None):
+    """Recompute the content hash and compare it with the manifest."""
+    manifest = manifest or read_manifest(path)
+    digest = _content_hash(path, manifest['files'])
+    if digest != manifest['content_hash']:
+        raise ValueError(f"Artifact {path} content hash mismatch: {digest} != {manifest['content_hash']}")
+    return digest
+
+
+def _write_artifact(path, kind, write_weights, features, preprocessing, metadata):
+    tmp = path.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    manifest = {'format': FORMAT, 'version': VERSION, 'kind': kind}
+    manifest.update(write_weights(tmp))
+
+    manifest['preprocessing'] = {}
+    for name in PREPROCESSING_FIELDS:
+        if preprocessing.get(name) is not None:
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(preprocessing[name]))
+            manifest['preprocessing'][name] = name + '.npy'
+
+    manifest['features'] = None if features is None else [str(f) for f in features]
+    manifest['files'] = sorted(f for f in os.listdir(tmp))
+    manifest['content_hash'] = _content_hash(tmp, manifest['files'])
+    manifest['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    manifest['metadata'] = metadata or {}
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    # Publish in one rename so a loader never sees a half-written artifact
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def _content_hash(path, files):
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(name.encode())
+        with open(os.path.join(path, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+        return True
+    except TypeError:
+        return False
@@ -0,0 +1,70 @@
+import json
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from model.ewas.mannwhitney import mannwhitneyu_columns
+
+
+class CpGSelector(BaseEstimator, TransformerMixin):
+    """
+    Keeps the `k` most informative CpG columns, ranked on the training rows only
+
+    method='variance' ranks by NaN-aware variance; method='ewas' ranks by the
+    two-sided Mann-Whitney U p-value of control (label 0) vs. disease (label > 0),
+    the test used by the EWAS scripts. Missing values are mean-imputed for the
+    test. Used as the first pipeline step, so each CV fold fits its own
+    selection and the fitted `selected_` indices travel with the saved model.
+
+    Args:
+        k: Number of CpGs to keep
+        method: 'variance' or 'ewas'
+    """
+    def __init__(self, k=1000, method='variance'):
+        self.k = k
+        self.method = method
+
+    def fit(self, X, y=None):
+        X = np.asarray(X, dtype=np.float64)
+        if self.method == 'variance':
+            with np.errstate(invalid='ignore'):
+                scores = np.nan_to_num(np.nanvar(X, axis=0), nan=-np.inf)
+        elif self.method == 'ewas':
+            if y is None:
+                raise ValueError("method='ewas' needs labels")
+            scores = -ewas_pvalues(X, y)
+        else:
+            raise ValueError(f"Unknown selection method: {self.method}")
+        self.n_features_in_ = X.shape[1]
+        self.scores_ = scores
+        k = min(self.k, X.shape[1])
+        # Stable sort so ties keep column order; stored sorted for contiguous reads
+        self.selected_ = np.sort(np.argsort(-scores, kind='stable')[:k])
+        return self
+
+    def transform(self, X):
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"CpGSelector was fit on {self.n_features_in_} features, got {X.shape[1]}")
+        return X[:, self.selected_]
+
+    def save(self, path):
+        """Write the selected column indices next to a saved model."""
+        with open(path, 'w') as f:
+            json.dump({'method': self.method, 'k': self.k, 'n_features_in': int(self.n_features_in_),
+                       'selected': self.selected_.tolist()}, f)
+
+
+def ewas_pvalues(X, y):
+    """Per-column Mann-Whitney U p-values, control (y == 0) vs. disease (y > 0)."""
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    with np.errstate(invalid='ignore'):
+        col_mean = np.nan_to_num(np.nanmean(X, axis=0))
+    X = np.where(np.isnan(X), col_mean, X)
+    _, p = mannwhitneyu_columns(X, y > 0)
+    return np.nan_to_num(p, nan=1.0)
+
+
+def load_selected(path):
+    """Selected column indices written by CpGSelector.save."""
+    with open(path) as f:
+        return np.asarray(json.load(f)['selected'], dtype=np.int64)
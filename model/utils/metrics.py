@@ -0,0 +1,91 @@
+import numpy as np
+import torch
+
+
+class ConfusionAccumulator:
+    """
+    Streaming confusion matrix: each update is a single bincount of
+    true * num_classes + pred added into a preallocated buffer
+
+    Accepts numpy arrays or torch tensors; tensors stay in torch (no per-batch
+    host copies) until compute() is called.
+    """
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self._counts = None
+
+    def update(self, y_true, y_pred):
+        k = self.num_classes
+        if torch.is_tensor(y_true):
+            flat = y_true.reshape(-1).long() * k + y_pred.reshape(-1).long()
+            counts = torch.bincount(flat, minlength=k * k)
+            if self._counts is None:
+                self._counts = torch.zeros(k * k, dtype=torch.long, device=counts.device)
+        else:
+            flat = np.asarray(y_true, dtype=np.int64).ravel() * k + np.asarray(y_pred, dtype=np.int64).ravel()
+            counts = np.bincount(flat, minlength=k * k)
+            if self._counts is None:
+                self._counts = np.zeros(k * k, dtype=np.int64)
+        self._counts += counts
+        return self
+
+    @property
+    def matrix(self):
+        k = self.num_classes
+        if self._counts is None:
+            return np.zeros((k, k), dtype=np.int64)
+        counts = self._counts.cpu().numpy() if torch.is_tensor(self._counts) else self._counts
+        return counts.reshape(k, k)
+
+    def compute(self):
+        return classification_metrics(self.matrix)
+
+
+def confusion(y_true, y_pred, num_classes):
+    """Confusion matrix (rows: true, cols: predicted) from one bincount."""
+    return ConfusionAccumulator(num_classes).update(y_true, y_pred).matrix
+
+
+def classification_metrics(conf_matrix):
+    """
+    Every metric the trainers report, derived from the confusion matrix in one step
+
+    Follows sklearn with zero_division=0: per-class values cover all classes,
+    macro averages cover the classes present in targets or predictions, and
+    weighted averages use class support.
+
+    Returns:
+        dict: accuracy, *_per_class, support_per_class, *_macro, *_weighted, confusion_matrix
+    """
+    cm = np.asarray(conf_matrix, dtype=np.int64)
+    tp = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    total = cm.sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        denom = support + predicted
+        f1 = np.where(denom > 0, 2 * tp / denom, 0.0)
+
+    present = (support > 0) | (predicted > 0)
+    weights = support / total if total > 0 else np.zeros_like(tp)
+
+    def macro(values):
+        return float(values[present].mean()) if present.any() else 0.0
+
+    return {
+        'accuracy': float(tp.sum() / total) if total > 0 else 0.0,
+        'precision_per_class': precision,
+        'recall_per_class': recall,
+        'f1_per_class': f1,
+        'support_per_class': support,
+        'precision_macro': macro(precision),
+        'recall_macro': macro(recall),
+        'f1_macro': macro(f1),
+        'precision_weighted': float((precision * weights).sum()),
+        'recall_weighted': float((recall * weights).sum()),
+        'f1_weighted': float((f1 * weights).sum()),
+        'confusion_matrix': cm,
+    }
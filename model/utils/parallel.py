@@ -0,0 +1,18 @@
+import os
+
+
+def partition_threads(n_tasks, n_jobs=None):
+    """
+    Split a core budget between task-level processes and per-worker threads
+    so that workers * threads never exceeds the budget.
+
+    Args:
+        n_tasks: Number of independent fits (e.g. CV folds)
+        n_jobs: Total cores to use (default: all)
+
+    Returns:
+        tuple: (n_workers, threads_per_worker)
+    """
+    budget = n_jobs if n_jobs and n_jobs > 0 else os.cpu_count() or 1
+    n_workers = max(1, min(n_tasks, budget))
+    return n_workers, max(1, budget // n_workers)
@@ -0,0 +1,182 @@
+# Architecture benchmark: parameter count, training throughput, inference latency and peak memory
+import argparse, csv, resource, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from model.models.pytorch.ConvNet import ConvNet
+from model.models.pytorch.CompactConvNet import CompactConvNet
+from model.models.pytorch.SimpleMLP import SimpleMLP
+from model.models.pytorch.RegularizedMLP import RegularizedMLP
+
+ARCHITECTURES = {
+	'ConvNet': ConvNet,
+	'CompactConvNet': CompactConvNet,
+	'GlobalPoolConvNet': lambda input_dim: CompactConvNet(input_dim, pool_size=1),
+	'SimpleMLP': SimpleMLP,
+	'RegularizedMLP': RegularizedMLP,
+}
+
+
+def count_parameters(model):
+	return sum(p.numel() for p in model.parameters())
+
+
+def benchmark(name, input_dim, batch_size, train_batches=20, latency_runs=50, device='cpu', num_classes=3):
+	"""
+	Benchmark one architecture at one (input_dim, batch_size) on synthetic data
+
+	Returns:
+		dict: params, train samples/sec, median single-sample and batch latency (ms),
+		peak memory (MB; CUDA allocator peak, or RSS growth over the process baseline on CPU)
+	"""
+	torch.manual_seed(0)
+	device = torch.device(device)
+	_warm_up(device)
+	_reset_peak_rss()
+	rss_before = _current_rss_mb()
+	if device.type == 'cuda':
+		torch.cuda.reset_peak_memory_stats(device)
+
+	model = ARCHITECTURES[name](input_dim).to(device)
+	criterion = nn.CrossEntropyLoss()
+	optimizer = optim.Adam(model.parameters(), lr=1e-3)
+	X = torch.randn(batch_size, input_dim, device=device)
+	y = torch.randint(0, num_classes, (batch_size,), device=device)
+
+	# Training throughput (one warm-up step, then timed steps)
+	model.train()
+	for step in range(train_batches + 1):
+		if step == 1:
+			_sync(device)
+			start = time.perf_counter()
+		optimizer.zero_grad()
+		loss = criterion(model(X), y)
+		loss.backward()
+		optimizer.step()
+	_sync(device)
+	train_time = time.perf_counter() - start
+
+	# Inference latency
+	model.eval()
+	with torch.no_grad():
+		single_ms = _median_latency(model, X[:1], latency_runs, device)
+		batch_ms = _median_latency(model, X, latency_runs, device)
+
+	if device.type == 'cuda':
+		peak_mb = torch.cuda.max_memory_allocated(device) / 2**20
+	else:
+		peak_mb = _peak_rss_mb() - rss_before
+	return {
+		'model': name,
+		'input_dim': input_dim,
+		'batch_size': batch_size,
+		'params': count_parameters(model),
+		'train_samples_per_sec': train_batches * batch_size / train_time,
+		'single_latency_ms': single_ms,
+		'batch_latency_ms': batch_ms,
+		'peak_memory_mb': peak_mb,
+	}
+
+
+def run_sweep(models, input_dims, batch_sizes, isolate=True, **kwargs):
+	"""
+	Benchmark every (model, input_dim, batch_size). With `isolate`, each run gets
+	a fresh process so CPU peak memory is not inflated by earlier runs.
+	"""
+	configs = [(name, dim, bs) for name in models for dim in input_dims for bs in batch_sizes]
+	results = []
+	for name, dim, bs in configs:
+		if isolate:
+			with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+				result = pool.submit(benchmark, name, dim, bs, **kwargs).result()
+		else:
+			result = benchmark(name, dim, bs, **kwargs)
+		print(_format_row(result))
+		results.append(result)
+	return results
+
+
+def _median_latency(model, X, runs, device):
+	model(X)
+	times = []
+	for _ in range(runs):
+		_sync(device)
+		start = time.perf_counter()
+		model(X)
+		_sync(device)
+		times.append((time.perf_counter() - start) * 1000)
+	return float(np.median(times))
+
+
+def _warm_up(device):
+	# Initialise the kernel libraries and thread pools up front so their one-off
+	# allocations are not charged to the first model measured
+	x = torch.randn(4, 1, 64, device=device, requires_grad=True)
+	w = torch.randn(2, 1, 3, device=device)
+	(torch.nn.functional.conv1d(x, w).flatten(1) @ torch.randn(124, 3, device=device)).sum().backward()
+
+
+def _sync(device):
+	if device.type == 'cuda':
+		torch.cuda.synchronize(device)
+
+
+def _current_rss_mb():
+	with open('/proc/self/statm') as f:
+		pages = int(f.read().split()[1])
+	return pages * resource.getpagesize() / 2**20
+
+
+def _reset_peak_rss():
+	# Linux: writing 5 to clear_refs resets the VmHWM high-water mark to the current RSS
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+	except OSError:
+		pass
+
+
+def _peak_rss_mb():
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1]) / 1024
+	except OSError:
+		pass
+	# ru_maxrss is in KiB on Linux (never reset, so includes the import peak)
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+HEADER = f"{'model':<18}{'input_dim':>10}{'batch':>7}{'params':>12}{'train smp/s':>13}{'1-smp ms':>10}{'batch ms':>10}{'peak MB':>9}"
+
+
+def _format_row(r):
+	return (f"{r['model']:<18}{r['input_dim']:>10}{r['batch_size']:>7}{r['params']:>12,}"
+			f"{r['train_samples_per_sec']:>13.0f}{r['single_latency_ms']:>10.2f}{r['batch_latency_ms']:>10.2f}{r['peak_memory_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark PyTorch architectures over input_dim and batch size.")
+	parser.add_argument('--models', nargs='+', default=list(ARCHITECTURES), choices=list(ARCHITECTURES))
+	parser.add_argument('--input-dims', nargs='+', type=int, default=[1000, 5000, 15000])
+	parser.add_argument('--batch-sizes', nargs='+', type=int, default=[32, 128])
+	parser.add_argument('--train-batches', type=int, default=20)
+	parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+	parser.add_argument('--no-isolate', action='store_true', help='Run every config in this process (faster, CPU peak memory is cumulative)')
+	parser.add_argument('--csv', default=None, help='Also write the results to this CSV file')
+	args = parser.parse_args()
+
+	print(HEADER)
+	results = run_sweep(args.models, args.input_dims, args.batch_sizes, isolate=not args.no_isolate,
+						train_batches=args.train_batches, device=args.device)
+	if args.csv:
+		with open(args.csv, 'w', newline='') as f:
+			writer = csv.DictWriter(f, fieldnames=list(results[0]))
+			writer.writeheader()
+			writer.writerows(results)
+		print(f"Results saved to {args.csv}")
@@ -1,21 +1,42 @@
 import torch
 import torch.optim as optim
 import torch.nn as nn
+import torch.multiprocessing as mp
 from torch.utils.data import DataLoader
+from concurrent.futures import ProcessPoolExecutor
 import os
 
 from model.utils.pytorch.train_loop import train_loop
 from model.utils.pytorch.test_loop import test_loop
+from model.utils.pytorch.early_stopping import train_with_early_stopping
 
 # Import custom Dataset
-from model.data.loaders.loader_pytorch import MethylationAlzheimerDataset
+from model.data.loaders.loader_pytorch import MethylationTensorDataset, MethylationMemmapDataset, batch_loader
 from model.models.pytorch.ConvNet  import ConvNet
-from torch.utils.data import Subset
+from model.utils.parallel import partition_threads
+from sklearn.base import clone
 import numpy as np
 
-def cross_validate_model(h5_path, mapping_csv_path, batch_size=32, epochs=20, lr=1e-3, k=5):
-
-	dataset = MethylationAlzheimerDataset(h5_path, mapping_csv_path)
+def cross_validate_model(h5_path, mapping_csv_path, batch_size=32, epochs=20, lr=1e-3, k=5,
+						 dataset_mode='tensor', num_workers=0, cache_dir=None, fold_workers=1, n_jobs=None,
+						 patience=None, val_fraction=0.1, selector=None):
+	"""
+	dataset_mode: 'tensor' holds the matrix in process memory, 'memmap' maps a
+	cached .npy file that folds and DataLoader workers (num_workers) share.
+	cache_dir: reuse parsed arrays from model.data.cache (tensor mode)
+	fold_workers: folds trained concurrently in worker processes; the `n_jobs`
+	core budget is split between them via torch.set_num_threads
+	patience: stop a fold once the loss on a `val_fraction` hold-out of its
+	training rows has not improved for this many epochs (None: run all epochs)
+	selector: optional CpGSelector refit on each fold's training rows; the fold's
+	model then only sees the selected columns
+	"""
+	if dataset_mode == 'memmap':
+		dataset = MethylationMemmapDataset.from_files(h5_path, mapping_csv_path)
+	elif dataset_mode == 'tensor':
+		dataset = MethylationTensorDataset.from_files(h5_path, mapping_csv_path, cache_dir=cache_dir)
+	else:
+		raise ValueError(f"Unknown dataset_mode: {dataset_mode}")
 	input_dim = dataset.data.shape[1]
 	indices = np.arange(len(dataset))
 	np.random.shuffle(indices)
@@ -28,49 +49,98 @@ def cross_validate_model(h5_path, mapping_csv_path, batch_size=32, epochs=20, lr
 	print(f"Starting {k}-Fold Cross Validation...")
 	print("=" * 50)
 	
+	folds = []
 	for fold in range(k):
-		print(f"\nFold {fold + 1}/{k}")
-		print("-" * 20)
-		
 		val_start = fold * fold_size
 		val_end = val_start + fold_size if fold < k-1 else len(dataset)
 		val_indices = indices[val_start:val_end]
 		train_indices = np.concatenate([indices[:val_start], indices[val_end:]])
+		folds.append((fold, train_indices, val_indices))
 
-		train_subset = Subset(dataset, train_indices)
-		val_subset = Subset(dataset, val_indices)
-
-		train_loader = DataLoader(train_subset, batch_size=batch_size, shuffle=True)
-		val_loader = DataLoader(val_subset, batch_size=batch_size, shuffle=False)
-
-		model = ConvNet(input_dim)
-		criterion = nn.CrossEntropyLoss()
-		optimizer = optim.Adam(model.parameters(), lr=lr)
+	fold_args = (dataset, input_dim, k, batch_size, epochs, lr, num_workers, patience, val_fraction, selector)
+	n_workers, n_threads = partition_threads(min(k, max(1, fold_workers)), n_jobs)
+	if n_workers == 1:
+		fold_metrics = [_run_fold(*fold, *fold_args) for fold in folds]
+	else:
+		if dataset_mode == 'tensor':
+			# Workers map the same shared-memory tensors instead of receiving copies
+			dataset.data.share_memory_()
+			dataset.labels.share_memory_()
+		with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('spawn')) as pool:
+			futures = [pool.submit(_run_fold, *fold, *fold_args, n_threads=n_threads) for fold in folds]
+			fold_metrics = [f.result() for f in futures]
 
-		# Train
-		print("Training...")
-		for epoch in range(epochs):
-			print(f"Epoch {epoch + 1}/{epochs}")
-			model = train_loop(train_loader, model, criterion, optimizer, batch_size)
-
-		# Validate
-		print("Validating...")
-		metrics = test_loop(val_loader, model, criterion, num_classes=3, 
-		                   class_names=['Control', 'MCI', 'Alzheimer'])
-		
+	for metrics in fold_metrics:
 		acc_list.append(metrics['accuracy'])
 		mse_list.append(metrics.get('mse', 0))  # MSE no longer computed, set to 0
 		loss_list.append(metrics['cross_entropy_loss'])
+	epochs_run = [metrics['epochs_run'] for metrics in fold_metrics]
 
 	print("\n" + "=" * 50)
 	print("Cross Validation Results:")
 	print(f"Mean Accuracy: {np.mean(acc_list):.4f} ± {np.std(acc_list):.4f}")
 	print(f"Mean Loss: {np.mean(loss_list):.6f} ± {np.std(loss_list):.6f}")
+	print(f"Epochs run: {epochs_run} ({k * epochs - sum(epochs_run)} of {k * epochs} saved)")
 	print("=" * 50)
 	
 	return {
 		'accuracy': acc_list,
 		'loss': loss_list,
 		'mean_accuracy': np.mean(acc_list),
-		'mean_loss': np.mean(loss_list)
-	}
\ No newline at end of file
+		'mean_loss': np.mean(loss_list),
+		'epochs_run': epochs_run,
+		'best_epochs': [metrics['best_epoch'] for metrics in fold_metrics]
+	}
+
+def _run_fold(fold, train_indices, val_indices, dataset, input_dim, k, batch_size, epochs, lr, num_workers,
+			  patience=None, val_fraction=0.1, selector=None, n_threads=None):
+	"""Train and validate one fold; runs in-process or inside a fold worker."""
+	if n_threads is not None:
+		torch.set_num_threads(n_threads)
+	print(f"\nFold {fold + 1}/{k}")
+	print("-" * 20)
+
+	# Early stopping monitors a hold-out of the training rows, never the fold's test rows
+	monitor_indices = None
+	if patience is not None:
+		n_monitor = max(1, int(len(train_indices) * val_fraction))
+		train_indices, monitor_indices = train_indices[n_monitor:], train_indices[:n_monitor]
+
+	# Rank CpGs on this fold's training rows only, then keep just those columns
+	if selector is not None:
+		X_fit, y_fit = dataset[np.asarray(train_indices)]
+		selector = clone(selector).fit(X_fit.numpy(), y_fit.numpy())
+		dataset = dataset.select_columns(selector.selected_)
+		input_dim = len(selector.selected_)
+		print(f"Selected {input_dim} CpGs ({selector.method})")
+
+	train_subset = dataset.subset(train_indices)
+	val_subset = dataset.subset(val_indices)
+
+	train_loader = batch_loader(train_subset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+	val_loader = batch_loader(val_subset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+	model = ConvNet(input_dim)
+	criterion = nn.CrossEntropyLoss()
+	optimizer = optim.Adam(model.parameters(), lr=lr)
+
+	# Train
+	print("Training...")
+	if patience is not None:
+		monitor_loader = batch_loader(dataset.subset(monitor_indices), batch_size=batch_size, num_workers=num_workers)
+		model, stopper = train_with_early_stopping(train_loader, monitor_loader, model, criterion, optimizer, batch_size,
+												   max_epochs=epochs, patience=patience)
+		epochs_run, best_epoch = stopper.epochs_run, stopper.best_epoch
+	else:
+		for epoch in range(epochs):
+			print(f"Epoch {epoch + 1}/{epochs}")
+			model = train_loop(train_loader, model, criterion, optimizer, batch_size)
+		epochs_run, best_epoch = epochs, epochs
+
+	# Validate
+	print("Validating...")
+	metrics = test_loop(val_loader, model, criterion, num_classes=3, 
+	                   class_names=['Control', 'MCI', 'Alzheimer'])
+	metrics['epochs_run'] = epochs_run
+	metrics['best_epoch'] = best_epoch
+	return metrics
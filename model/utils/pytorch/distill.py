@@ -0,0 +1,153 @@
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+from model.models.pytorch.DistilledStudent import DistilledStudent
+from model.models.xgboost.model import fit_pipeline
+from model.utils.pytorch.early_stopping import EarlyStopping
+
+
+def distillation_loss(logits, soft_targets, labels, alpha=0.7, temperature=2.0):
+    """
+    alpha * T^2 * KL(teacher_T || student_T) + (1 - alpha) * CE(student, labels),
+    where teacher probabilities are sharpened/softened as p^(1/T) renormalized
+    """
+    soft_t = soft_targets.clamp_min(1e-8) ** (1.0 / temperature)
+    soft_t = soft_t / soft_t.sum(dim=1, keepdim=True)
+    kd = F.kl_div(F.log_softmax(logits / temperature, dim=1), soft_t, reduction='batchmean')
+    return alpha * temperature ** 2 * kd + (1 - alpha) * F.cross_entropy(logits, labels)
+
+
+def distill(teacher, X, y, columns=None, selector=None, refit_teacher=True, hidden_dims=(64, 32), epochs=100,
+            batch_size=32, lr=1e-3, alpha=0.7, temperature=2.0, patience=10, test_fraction=0.2, random_state=42):
+    """
+    Train a DistilledStudent on the teacher's predict_proba over the training cohort
+
+    A stratified `test_fraction` of the rows is held out for the report; the
+    student never sees it. A teacher loaded from disk was trained on the whole
+    cohort, so with `refit_teacher` a clone of it is refit on the remaining
+    rows first: the report then compares teacher and student on rows neither
+    was trained on, and the student distills that refit teacher. Of the
+    remaining rows, 10% monitor the distillation loss for early stopping.
+
+    Args:
+        teacher: Fitted preprocessor -> classifier pipeline with predict_proba (e.g. XGBoostModel.model)
+        X, y: Raw training rows (teacher input format) and labels
+        columns: CpG columns the student reads (default: the teacher's selector, else `selector`, else all)
+        selector: Unfitted CpG selector fit on the student's training rows when columns is None
+                  and the teacher has no selector stage
+        refit_teacher: Refit the teacher without the hold-out rows; False reports in-sample teacher metrics
+
+    Returns:
+        tuple: (DistilledStudent in eval mode, report dict; report['evaluation'] is
+        'held_out' or 'teacher_in_sample')
+    """
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.int64)
+
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=test_fraction, stratify=y,
+                                           random_state=random_state)
+    if refit_teacher:
+        teacher = clone(teacher)
+        fit_pipeline(teacher, X[train_idx], y[train_idx], random_state=random_state)
+    fit_idx, monitor_idx = train_test_split(train_idx, test_size=0.1, stratify=y[train_idx],
+                                            random_state=random_state)
+    if columns is None:
+        columns = _teacher_columns(teacher)
+    if columns is None and selector is not None:
+        columns = clone(selector).fit(X[fit_idx], y[fit_idx]).selected_
+    columns = np.arange(X.shape[1]) if columns is None else np.asarray(columns, dtype=np.int64)
+    soft = teacher.predict_proba(X).astype(np.float32)
+
+    # Impute / scale statistics from the student's training rows only
+    sel = X[np.ix_(fit_idx, columns)]
+    with np.errstate(invalid='ignore'):
+        mean = np.nan_to_num(np.nanmean(sel, axis=0))
+        std = np.nan_to_num(np.nanstd(sel, axis=0))
+    scale = np.where(std > 0, std, 1.0)
+
+    torch.manual_seed(random_state)
+    student = DistilledStudent(columns, mean, scale, hidden_dims=hidden_dims, output_dim=soft.shape[1])
+    optimizer = optim.Adam(student.parameters(), lr=lr)
+    X_t, soft_t, y_t = torch.from_numpy(X), torch.from_numpy(soft), torch.from_numpy(y)
+    fit_t = torch.from_numpy(fit_idx)
+    monitor_t = torch.from_numpy(monitor_idx)
+
+    stopper = EarlyStopping(patience=patience)
+    for epoch in range(epochs):
+        student.train()
+        order = fit_t[torch.randperm(len(fit_t))]
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            if len(idx) < 2:
+                continue  # BatchNorm needs more than one row
+            loss = distillation_loss(student(X_t[idx]), soft_t[idx], y_t[idx], alpha, temperature)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            optimizer.step()
+        student.eval()
+        with torch.no_grad():
+            monitor_loss = distillation_loss(student(X_t[monitor_t]), soft_t[monitor_t], y_t[monitor_t],
+                                             alpha, temperature).item()
+        if stopper.step(monitor_loss, student):
+            break
+    stopper.restore(student)
+    student.eval()
+    print(f"Distillation: best epoch {stopper.best_epoch}, ran {stopper.epochs_run}/{epochs}")
+
+    report = evaluate_student(teacher, student, X[test_idx], y[test_idx])
+    report.update({'evaluation': 'held_out' if refit_teacher else 'teacher_in_sample',
+                   'n_features': int(len(columns)), 'epochs_run': stopper.epochs_run,
+                   'student_params': sum(p.numel() for p in student.parameters())})
+    return student, report
+
+
+def _teacher_columns(teacher):
+    # CpGs kept by the teacher's own selector stage, if it has one
+    preprocessor = getattr(teacher, 'named_steps', {}).get('preprocessor')
+    steps = getattr(preprocessor, 'named_steps', {})
+    return steps['selector'].selected_ if 'selector' in steps else None
+
+
+def evaluate_student(teacher, student, X, y, latency_runs=50):
+    """Accuracy of both models, their agreement, and single-sample latency (ms) on held-out rows."""
+    teacher_pred = teacher.predict(X)
+    with torch.no_grad():
+        student_pred = student.predict(torch.from_numpy(np.asarray(X, dtype=np.float32))).numpy()
+    teacher_acc = float((teacher_pred == y).mean())
+    student_acc = float((student_pred == y).mean())
+
+    row = X[:1]
+    with torch.no_grad():
+        row_t = torch.from_numpy(np.asarray(row, dtype=np.float32))
+        student_ms = _median_ms(lambda: student.predict_proba(row_t), latency_runs)
+    teacher_ms = _median_ms(lambda: teacher.predict_proba(row), latency_runs)
+    return {
+        'teacher_accuracy': teacher_acc,
+        'student_accuracy': student_acc,
+        'accuracy_delta': student_acc - teacher_acc,
+        'agreement': float((teacher_pred == student_pred).mean()),
+        'teacher_latency_ms': teacher_ms,
+        'student_latency_ms': student_ms,
+    }
+
+
+def export_student(student, path):
+    """Save the student as TorchScript (preprocessing included); load with torch.jit.load."""
+    scripted = torch.jit.script(student.eval())
+    scripted.save(path)
+    return path
+
+
+def _median_ms(fn, runs):
+    fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
@@ -0,0 +1,66 @@
+import torch
+
+from model.utils.pytorch.train_loop import train_loop
+from model.utils.pytorch.test_loop import validation_loss
+
+
+class EarlyStopping:
+    """
+    Tracks a validation loss and keeps an in-memory copy of the best weights
+
+    Args:
+        patience: Epochs without improvement before stopping
+        min_delta: Minimum decrease in loss that counts as an improvement
+    """
+    def __init__(self, patience=3, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = float('inf')
+        self.best_epoch = -1
+        self.best_state = None
+        self.epochs_run = 0
+        self._bad_epochs = 0
+
+    def step(self, val_loss, model):
+        """Record one epoch; returns True when training should stop."""
+        self.epochs_run += 1
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.best_epoch = self.epochs_run
+            self.best_state = {name: t.detach().clone() for name, t in model.state_dict().items()}
+            self._bad_epochs = 0
+        else:
+            self._bad_epochs += 1
+        return self._bad_epochs >= self.patience
+
+    def restore(self, model):
+        """Load the best weights seen so far back into the model."""
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
+        return model
+
+
+def train_with_early_stopping(train_loader, val_loader, model, loss_fn, optimizer, batch_size,
+                              max_epochs=20, patience=3, min_delta=0.0, telemetry=None):
+    """
+    Run train_loop epochs until the validation loss stops improving for
+    `patience` epochs (or `max_epochs` is reached), then restore the best weights.
+    `telemetry` (model.utils.telemetry.Telemetry) is passed to every train_loop epoch.
+
+    Returns:
+        tuple: (model with best weights, EarlyStopping with epochs_run / best_epoch)
+    """
+    stopper = EarlyStopping(patience=patience, min_delta=min_delta)
+    for epoch in range(max_epochs):
+        print(f"Epoch {epoch + 1}/{max_epochs}")
+        model = train_loop(train_loader, model, loss_fn, optimizer, batch_size, telemetry=telemetry)
+        val_loss = validation_loss(val_loader, model, loss_fn)
+        print(f"Validation - Loss: {val_loss:.6f}")
+        if telemetry is not None and telemetry.run_log is not None:
+            telemetry.run_log.log(stage='validation', epoch=telemetry.epoch, val_loss=val_loss)
+        if stopper.step(val_loss, model):
+            break
+    stopper.restore(model)
+    print(f"Early stopping: best epoch {stopper.best_epoch}, ran {stopper.epochs_run}/{max_epochs} "
+          f"({max_epochs - stopper.epochs_run} epochs saved)")
+    return model, stopper
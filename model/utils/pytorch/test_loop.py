@@ -3,7 +3,27 @@ import torch.nn as nn
 from torch import argmax
 from torch.nn.functional import softmax
 import numpy as np
-from sklearn.metrics import precision_recall_fscore_support, classification_report, confusion_matrix
+
+from model.utils.metrics import ConfusionAccumulator
+
+def validation_loss(dataloader, model, loss_fn):
+    """
+    Mean batch loss over a validation loader, without the full metric report
+
+    Args:
+        dataloader: Validation data loader
+        model: Model being trained
+        loss_fn: Loss function (CrossEntropyLoss)
+
+    Returns:
+        float: Average loss per batch
+    """
+    model.eval()
+    total_loss = torch.zeros(())
+    with torch.no_grad():
+        for X, y in dataloader:
+            total_loss += loss_fn(model(X), y)
+    return total_loss.item() / len(dataloader)
 
 def test_loop(dataloader, model, loss_fn, num_classes=3, class_names=None):
     """
@@ -28,14 +48,15 @@ def test_loop(dataloader, model, loss_fn, num_classes=3, class_names=None):
     size = len(dataloader.dataset)
     num_batches = len(dataloader)
     
-    # Initialize metrics
-    total_loss = 0.0
-    correct_predictions = 0
+    # Initialize metrics (kept as tensors, read out once after the loop)
+    total_loss = torch.zeros(())
+    confusion = ConfusionAccumulator(num_classes)
     
-    # Collect all predictions and targets for detailed metrics
-    all_predictions = []
-    all_targets = []
-    all_probabilities = []
+    # Preallocated buffers for predictions, targets and probabilities
+    all_predictions = torch.empty(size, dtype=torch.long)
+    all_targets = torch.empty(size, dtype=torch.long)
+    all_probabilities = torch.empty((size, num_classes))
+    offset = 0
 
     # Evaluating the model with torch.no_grad() ensures that no gradients are computed during test mode
     with torch.no_grad():
@@ -44,49 +65,33 @@ def test_loop(dataloader, model, loss_fn, num_classes=3, class_names=None):
             logits = model(X)
             
             # Compute cross-entropy loss
-            batch_loss = loss_fn(logits, y)
-            total_loss += batch_loss.item()
+            total_loss += loss_fn(logits, y)
             
             # Get predictions and probabilities
             probabilities = torch.softmax(logits, dim=1)
             predictions = torch.argmax(logits, dim=1)
             
-            # Count correct predictions
-            correct_predictions += (predictions == y).sum().item()
+            # Confusion counts give accuracy and every precision / recall / F1 below
+            confusion.update(y, predictions)
             
-            # Store for detailed metrics computation (convert to Python lists directly)
-            all_predictions.extend(predictions.tolist())
-            all_targets.extend(y.tolist())
-            all_probabilities.extend(probabilities.tolist())
-    
-    # Convert to numpy arrays for sklearn metrics
-    all_predictions = np.array(all_predictions)
-    all_targets = np.array(all_targets)
-    # Keep probabilities as list of lists for now
+            end = offset + len(y)
+            all_predictions[offset:end] = predictions
+            all_targets[offset:end] = y
+            all_probabilities[offset:end] = probabilities
+            offset = end
     
     # Compute primary metrics
-    avg_loss = total_loss / num_batches  # Average cross-entropy loss
-    accuracy = correct_predictions / size  # Overall accuracy
-    
-    # Compute precision, recall, and F1-score for each class and overall
-    precision, recall, f1, support = precision_recall_fscore_support(
-        all_targets, all_predictions, 
-        labels=list(range(num_classes)), 
-        average=None, 
-        zero_division=0
-    )
-    
-    # Compute macro and weighted averages
-    precision_macro, recall_macro, f1_macro, _ = precision_recall_fscore_support(
-        all_targets, all_predictions, average='macro', zero_division=0
-    )
-    
-    precision_weighted, recall_weighted, f1_weighted, _ = precision_recall_fscore_support(
-        all_targets, all_predictions, average='weighted', zero_division=0
-    )
-    
-    # Compute confusion matrix
-    conf_matrix = confusion_matrix(all_targets, all_predictions, labels=list(range(num_classes)))
+    avg_loss = total_loss.item() / num_batches  # Average cross-entropy loss
+    scores = confusion.compute()
+    accuracy = scores['accuracy']  # Overall accuracy
+    
+    # Per-class, macro and weighted precision, recall and F1-score from the confusion matrix
+    precision, recall, f1, support = (scores['precision_per_class'], scores['recall_per_class'],
+                                      scores['f1_per_class'], scores['support_per_class'])
+    precision_macro, recall_macro, f1_macro = scores['precision_macro'], scores['recall_macro'], scores['f1_macro']
+    precision_weighted, recall_weighted, f1_weighted = (scores['precision_weighted'], scores['recall_weighted'],
+                                                        scores['f1_weighted'])
+    conf_matrix = scores['confusion_matrix']
     
     # Print detailed results
     print(f"Test Results Summary:")
@@ -135,9 +140,9 @@ def test_loop(dataloader, model, loss_fn, num_classes=3, class_names=None):
         'recall_weighted': recall_weighted,
         'f1_weighted': f1_weighted,
         'confusion_matrix': conf_matrix.tolist(),
-        'predictions': all_predictions.tolist(),
-        'targets': all_targets.tolist(),
-        'probabilities': all_probabilities,  # Already a list
+        'predictions': all_predictions[:offset].tolist(),
+        'targets': all_targets[:offset].tolist(),
+        'probabilities': all_probabilities[:offset].tolist(),
         'class_names': class_names
     }
     
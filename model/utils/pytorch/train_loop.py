@@ -1,51 +1,170 @@
 import torch
 import torch.nn as nn
+from torch.utils.data import DataLoader
+from contextlib import nullcontext
 
-def train_loop(dataloader, model, loss_fn, optimizer, batch_size):
+from model.data.loaders.loader_pytorch import MethylationTensorDataset, BatchSliceSampler
+from model.utils.telemetry import NULL_TIMER
+
+def train_loop(dataloader, model, loss_fn, optimizer, batch_size, telemetry=None):
     """
     Simplified training loop - shows metrics for the entire epoch
     
     Args:
-        dataloader: Training data loader
+        dataloader: Training data loader, or an in-memory MethylationTensorDataset / (X, y) tensors
         model: PyTorch model
         loss_fn: Loss function (typically nn.CrossEntropyLoss())
         optimizer: Optimizer (e.g., Adam, SGD)
         batch_size: Batch size for training
+        telemetry: Optional model.utils.telemetry.Telemetry recording data / forward /
+                   backward time, samples/sec and peak RSS for this epoch
     
     Returns:
         model: Trained model
     """
+    # In-memory cohorts skip the DataLoader machinery entirely
+    in_memory = _in_memory_data(dataloader)
+    if in_memory is not None:
+        X, y, shuffle, drop_last = in_memory
+        return tensor_train_loop((X, y), model, loss_fn, optimizer, batch_size, shuffle=shuffle, drop_last=drop_last,
+                                 telemetry=telemetry)
+
     size = len(dataloader.dataset)
     num_batches = len(dataloader)
     model.train()  # Set model to training mode
+    timer = _start_epoch(telemetry)
     
     # Epoch-level metrics
     total_loss = 0.0
     correct_predictions = 0
     
-    for batch, (X, y) in enumerate(dataloader):
-        # Forward pass
-        logits = model(X)
-        
-        # Compute cross-entropy loss (PyTorch built-in)
-        loss = loss_fn(logits, y)
-        
-        # Backward pass and optimization
-        optimizer.zero_grad()  # Clear gradients
-        loss.backward()        # Compute gradients
-        optimizer.step()       # Update parameters
-        
-        # Accumulate metrics for the epoch (computed consistently)
-        with torch.no_grad():
-            # Use the same logits for both loss and accuracy
-            total_loss += loss.item()
-            predictions = torch.argmax(logits, dim=1)
-            correct_predictions += (predictions == y).sum().item()
+    with _profiler(telemetry):
+        batches = iter(dataloader)
+        while True:
+            # Data loading (includes waiting on DataLoader workers)
+            with timer.stage('data'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            X, y = batch
+            
+            # Forward pass
+            with timer.stage('forward'):
+                logits = model(X)
+                # Compute cross-entropy loss (PyTorch built-in)
+                loss = loss_fn(logits, y)
+            
+            # Backward pass and optimization
+            with timer.stage('backward'):
+                optimizer.zero_grad()  # Clear gradients
+                loss.backward()        # Compute gradients
+                optimizer.step()       # Update parameters
+            
+            # Accumulate metrics for the epoch (computed consistently)
+            with torch.no_grad():
+                # Use the same logits for both loss and accuracy
+                total_loss += loss.item()
+                predictions = torch.argmax(logits, dim=1)
+                correct_predictions += (predictions == y).sum().item()
     
     # Calculate epoch metrics
     avg_loss = total_loss / num_batches
     accuracy = (correct_predictions / size) * 100
     
     print(f"Training - Loss: {avg_loss:.6f}, Accuracy: {accuracy:.2f}%")
+    if telemetry is not None:
+        telemetry.end_epoch(size, loss=avg_loss, accuracy=accuracy)
     
-    return model
\ No newline at end of file
+    return model
+
+def tensor_train_loop(data, model, loss_fn, optimizer, batch_size, shuffle=True, drop_last=False, generator=None,
+                      telemetry=None):
+    """
+    Training loop for data that fits in memory - same epoch semantics as train_loop
+    
+    Shuffles with one tensor permutation, slices batches straight from the
+    tensors and keeps loss / correct counts as tensors, so values are only
+    read out (synchronized) once at the end of the epoch.
+    
+    Args:
+        data: MethylationTensorDataset or (X, y) tensors
+        model: PyTorch model
+        loss_fn: Loss function (typically nn.CrossEntropyLoss())
+        optimizer: Optimizer (e.g., Adam, SGD)
+        batch_size: Batch size for training
+        shuffle: Draw batches from a fresh permutation each epoch
+        drop_last: Skip the final incomplete batch
+        generator: Optional torch.Generator for the permutation
+        telemetry: Optional Telemetry (see train_loop)
+    
+    Returns:
+        model: Trained model
+    """
+    X, y = (data.data, data.labels) if isinstance(data, MethylationTensorDataset) else data
+    size = len(X)
+    stop = size - size % batch_size if drop_last else size
+    model.train()  # Set model to training mode
+    timer = _start_epoch(telemetry)
+    
+    # Epoch-level metrics, accumulated on-device
+    total_loss = torch.zeros((), device=X.device)
+    correct_predictions = torch.zeros((), dtype=torch.long, device=X.device)
+    num_batches = 0
+    
+    with _profiler(telemetry):
+        with timer.stage('data'):
+            order = torch.randperm(size, generator=generator) if shuffle else None
+        for start in range(0, stop, batch_size):
+            with timer.stage('data'):
+                if order is None:
+                    X_batch, y_batch = X[start:start + batch_size], y[start:start + batch_size]
+                else:
+                    idx = order[start:start + batch_size]
+                    X_batch, y_batch = X[idx], y[idx]
+            
+            with timer.stage('forward'):
+                logits = model(X_batch)
+                loss = loss_fn(logits, y_batch)
+            
+            with timer.stage('backward'):
+                optimizer.zero_grad(set_to_none=True)
+                loss.backward()
+                optimizer.step()
+            
+            with torch.no_grad():
+                total_loss += loss.detach()
+                correct_predictions += (torch.argmax(logits, dim=1) == y_batch).sum()
+            num_batches += 1
+    
+    # Single read-out per epoch
+    seen = min(stop, size)
+    avg_loss = total_loss.item() / max(num_batches, 1)
+    accuracy = (correct_predictions.item() / max(seen, 1)) * 100
+    
+    print(f"Training - Loss: {avg_loss:.6f}, Accuracy: {accuracy:.2f}%")
+    if telemetry is not None:
+        telemetry.end_epoch(seen, loss=avg_loss, accuracy=accuracy)
+    
+    return model
+
+def _start_epoch(telemetry):
+    """Stage timer for this epoch (a no-op without telemetry)."""
+    if telemetry is None:
+        return NULL_TIMER
+    telemetry.start_epoch()
+    return telemetry.timer
+
+def _profiler(telemetry):
+    return telemetry.profiler() if telemetry is not None else nullcontext()
+
+def _in_memory_data(dataloader):
+    """(X, y, shuffle, drop_last) when the loader only slices in-memory tensors, else None."""
+    if isinstance(dataloader, MethylationTensorDataset):
+        return dataloader.data, dataloader.labels, True, False
+    if isinstance(dataloader, tuple) and len(dataloader) == 2 and all(torch.is_tensor(t) for t in dataloader):
+        return dataloader[0], dataloader[1], True, False
+    if (isinstance(dataloader, DataLoader) and isinstance(dataloader.dataset, MethylationTensorDataset)
+            and isinstance(dataloader.sampler, BatchSliceSampler) and dataloader.num_workers == 0):
+        sampler = dataloader.sampler
+        return dataloader.dataset.data, dataloader.dataset.labels, sampler.shuffle, sampler.drop_last
+    return None
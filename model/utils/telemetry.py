@@ -0,0 +1,160 @@
+import os, csv, json, time, resource
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    """
+    Accumulates wall time per named stage, e.g. data / forward / backward
+
+    Args:
+        sync: Optional callable run before each clock read (e.g. torch.cuda.synchronize)
+              so asynchronous device work is charged to the right stage
+    """
+    def __init__(self, sync=None):
+        self.sync = sync
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        if self.sync is not None:
+            self.sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync is not None:
+                self.sync()
+            self.totals[name] += time.perf_counter() - start
+
+    def seconds(self):
+        return {f"{name}_s": round(total, 6) for name, total in self.totals.items()}
+
+    def reset(self):
+        self.totals.clear()
+
+
+class _NullTimer:
+    """Stand-in when no telemetry is requested: stages cost nothing."""
+    def stage(self, name):
+        return nullcontext()
+
+
+NULL_TIMER = _NullTimer()
+
+
+class RunLog:
+    """
+    Structured run log, one record per epoch / fold
+
+    Records go to `path` as JSON lines (.jsonl / .json) or CSV (.csv); every
+    record carries the run name and a timestamp. In CSV, a record missing some
+    columns leaves them empty, and a record with new fields (another stage,
+    or a run appending to an older log) widens the header: the file is
+    rewritten with the added columns, so no field is ever dropped.
+    """
+    def __init__(self, path, run=None):
+        self.path = path
+        self.run = run or time.strftime('%Y%m%d-%H%M%S')
+        self.records = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def log(self, **record):
+        record = {'run': self.run, 'time': round(time.time(), 3), **record}
+        self.records.append(record)
+        if self.path.endswith('.csv'):
+            self._append_csv(record)
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, default=float) + '\n')
+        return record
+
+    def _append_csv(self, record):
+        fieldnames = []
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, newline='') as f:
+                fieldnames = next(csv.reader(f))
+        new = [name for name in record if name not in fieldnames]
+        if fieldnames and new:
+            # A record with fields the header lacks (another stage, an older log): widen the header
+            # and rewrite the earlier rows with those cells empty, atomically
+            with open(self.path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            fieldnames += new
+            with open(self.path + '.tmp', 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+                writer.writerow(record)
+            os.replace(self.path + '.tmp', self.path)
+            return
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames or list(record))
+            if not fieldnames:
+                writer.writeheader()
+            writer.writerow(record)
+
+
+class Telemetry:
+    """
+    Per-epoch training telemetry for train_loop: data loading / forward /
+    backward+step time, samples/sec and peak RSS, appended to a RunLog.
+    Epochs listed in `profile_epochs` (1-based) are also captured with
+    torch.profiler and exported as Chrome traces to `profile_dir`.
+
+    Args:
+        run_log: RunLog (or path) receiving one record per epoch
+        profile_epochs: Epoch numbers to profile
+        profile_dir: Directory for the profiler traces
+        device: Training device; on CUDA stages are synchronized before timing
+    """
+    def __init__(self, run_log=None, profile_epochs=(), profile_dir='./model/models/pytorch/profiles', device='cpu'):
+        self.run_log = RunLog(run_log) if isinstance(run_log, str) else run_log
+        self.profile_epochs = set(profile_epochs)
+        self.profile_dir = profile_dir
+        sync = None
+        if str(device).startswith('cuda'):
+            import torch
+            sync = torch.cuda.synchronize
+        self.timer = StageTimer(sync=sync)
+        self.epoch = 0
+        self._start = None
+
+    def start_epoch(self):
+        self.epoch += 1
+        self.timer.reset()
+        self._start = time.perf_counter()
+
+    def profiler(self):
+        """torch.profiler context for the current epoch if it is selected, else a no-op."""
+        if self.epoch not in self.profile_epochs:
+            return nullcontext()
+        import torch.profiler as tp
+        os.makedirs(self.profile_dir, exist_ok=True)
+        trace = os.path.join(self.profile_dir, f"epoch{self.epoch}.json")
+        activities = [tp.ProfilerActivity.CPU] + ([tp.ProfilerActivity.CUDA] if self.timer.sync is not None else [])
+        return tp.profile(activities=activities, record_shapes=True, profile_memory=True,
+                          on_trace_ready=lambda prof: prof.export_chrome_trace(trace))
+
+    def end_epoch(self, samples, **metrics):
+        elapsed = time.perf_counter() - self._start
+        record = {
+            'stage': 'train_epoch',
+            'epoch': self.epoch,
+            'samples': samples,
+            'epoch_s': round(elapsed, 6),
+            **self.timer.seconds(),
+            'samples_per_sec': samples / elapsed if elapsed > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            **metrics,
+        }
+        if self.run_log is not None:
+            self.run_log.log(**record)
+        return record
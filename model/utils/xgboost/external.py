@@ -0,0 +1,141 @@
+import numpy as np
+import xgboost
+from xgboost import XGBClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.model_selection import train_test_split
+
+from model.data.convert import open_store
+from model.data.h5_reader import read_rows
+from model.data.stats import compute_column_stats, load_column_stats, subset_stats
+from model.models.xgboost.model import StatsStandardizer, early_stopping_info
+
+
+class H5BlockIter(xgboost.DataIter):
+    """
+    Feeds XGBoost `block_rows` samples at a time from a (samples x CpGs) store,
+    so building the DMatrix never holds more than one block of raw values.
+    Blocks go through a fitted StatsStandardizer, giving the booster the same
+    features the in-memory pipeline would.
+
+    Args:
+        store_path: HDF5 file or converted .zarr store
+        labels: Labels aligned to the store rows
+        rows: Store rows to iterate (sorted for contiguous reads)
+        columns: CpG column indices to read (default: all)
+        standardizer: Fitted StatsStandardizer for `columns`, or None to keep NaNs as missing
+        block_rows: Samples per block
+        cache_prefix: On-disk page prefix for external-memory matrices
+    """
+    def __init__(self, store_path, labels, rows, columns=None, standardizer=None, block_rows=512,
+                 dataset='data', cache_prefix=None):
+        self.store_path = store_path
+        self.labels = np.asarray(labels)
+        self.rows = np.sort(np.asarray(rows))
+        self.columns = columns
+        self.standardizer = standardizer
+        self.block_rows = block_rows
+        self.dataset = dataset
+        self._pos = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._pos >= len(self.rows):
+            return False
+        block = self.rows[self._pos:self._pos + self.block_rows]
+        with open_store(self.store_path) as store:
+            X = read_rows(store[self.dataset], block, self.columns)
+        if self.standardizer is not None:
+            X = self.standardizer.transform(X)
+        input_data(data=np.asarray(X, dtype=np.float32), label=self.labels[block])
+        self._pos += len(block)
+        return True
+
+    def reset(self):
+        self._pos = 0
+
+
+def train_external(params, store_path, labels, rows=None, columns=None, column_stats=None, block_rows=512,
+                   external_memory=False, cache_prefix='./model/data/cache/xgb_pages', max_bin=256,
+                   eval_fraction=0.1, random_state=42):
+    """
+    Train an XGBClassifier on a store without loading the matrix into RAM
+
+    Rows are streamed through H5BlockIter into a QuantileDMatrix (quantised
+    histogram bins, ~1 byte per value) or, with `external_memory`, an
+    ExtMemQuantileDMatrix whose pages are cached on disk under `cache_prefix`.
+    Training uses the `hist` tree method. With `early_stopping_rounds` in
+    params, a stratified `eval_fraction` of the rows is streamed into an eval
+    matrix that shares the training quantiles.
+
+    Args:
+        params: XGBClassifier parameters (as given to XGBoostModel)
+        store_path: HDF5 file or converted .zarr store
+        labels: Labels aligned to the store rows
+        rows: Store rows to train on (default: all)
+        columns: CpG column indices (default: all)
+        column_stats: Stats for `columns` over the training rows (default: computed over
+                      them, or the store's sidecar when they are the whole store)
+
+    Returns:
+        tuple: (fitted standardizer -> classifier Pipeline, early_stopping_info or None)
+    """
+    labels = np.asarray(labels)
+    rows = np.arange(len(labels)) if rows is None else np.asarray(rows)
+    classifier = XGBClassifier(**params)
+    early_stopping_rounds = classifier.get_params().get('early_stopping_rounds')
+    num_class = int(labels[rows].max()) + 1
+    booster_params = {k: v for k, v in classifier.get_xgb_params().items() if v is not None}
+    booster_params['tree_method'] = 'hist'
+    booster_params['max_bin'] = max_bin
+    if num_class > 2:
+        booster_params['num_class'] = num_class
+        if not str(booster_params.get('objective', '')).startswith('multi:'):
+            booster_params['objective'] = 'multi:softprob'
+
+    eval_rows = None
+    if early_stopping_rounds is not None:
+        rows, eval_rows = train_test_split(rows, test_size=eval_fraction, stratify=labels[rows],
+                                           random_state=random_state)
+    standardizer = StatsStandardizer(_training_stats(store_path, rows, columns, column_stats)).fit(None)
+
+    it = H5BlockIter(store_path, labels, rows, columns, standardizer, block_rows,
+                     cache_prefix=cache_prefix if external_memory else None)
+    if external_memory:
+        dtrain = xgboost.ExtMemQuantileDMatrix(it, max_bin=max_bin)
+    else:
+        dtrain = xgboost.QuantileDMatrix(it, max_bin=max_bin)
+    print(f"Built {'external-memory' if external_memory else 'quantile'} DMatrix: "
+          f"{dtrain.num_row()} samples x {dtrain.num_col()} CpGs")
+
+    evals = []
+    if eval_rows is not None:
+        deval = xgboost.QuantileDMatrix(H5BlockIter(store_path, labels, eval_rows, columns, standardizer, block_rows),
+                                        ref=dtrain, max_bin=max_bin)
+        evals = [(deval, 'eval')]
+
+    booster = xgboost.train(booster_params, dtrain, num_boost_round=classifier.get_params()['n_estimators'] or 100,
+                            evals=evals, early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+
+    # Wrap the booster so the result predicts and pickles like XGBoostModel.model
+    classifier.load_model(bytearray(booster.save_raw('ubj')))
+    pipeline = Pipeline(steps=[
+        ('preprocessor', Pipeline(steps=[('standardizer', standardizer)])),
+        ('classifier', classifier)
+    ])
+    return pipeline, early_stopping_info(classifier) if early_stopping_rounds is not None else None
+
+
+def _training_stats(store_path, rows, columns, column_stats):
+    # Standardize with stats of the training rows only: the sidecar also covers
+    # held-out and eval rows, so it is used only when it matches them exactly
+    if column_stats is not None:
+        if int(column_stats['n_rows']) != len(rows):
+            raise ValueError(f"column_stats cover {int(column_stats['n_rows'])} rows but training uses {len(rows)}; "
+                             f"leave column_stats unset to compute them over the training rows")
+        return column_stats
+    with open_store(store_path) as store:
+        n_store = store['data'].shape[0]
+    if len(np.unique(rows)) == n_store:
+        column_stats = load_column_stats(store_path)
+        return subset_stats(column_stats, columns) if columns is not None else column_stats
+    return compute_column_stats(store_path, rows=rows, columns=columns)
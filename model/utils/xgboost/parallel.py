@@ -0,0 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+
+from model.utils.parallel import partition_threads
+from model.models.xgboost.model import fit_pipeline
+from model.utils.xgboost.preprocess_cache import fit_cached, predict_cached
+from model.utils.telemetry import StageTimer, peak_rss_mb
+
+# Training matrix (and optional PreprocessCache over it) handed to each worker once by the pool initializer
+_X, _y, _cache = None, None, None
+
+
+def _init_worker(X, y, cache=None):
+    global _X, _y, _cache
+    _X, _y, _cache = X, y, cache
+
+
+def _fit_predict(pipeline, train_index, val_index, n_threads):
+    pipeline.set_params(classifier__n_jobs=n_threads)
+    timer = StageTimer()
+    if _cache is not None:
+        info = fit_cached(pipeline, _cache, _y, train_index, timer=timer)
+        with timer.stage('predict'):
+            y_pred = predict_cached(pipeline, _cache, val_index)
+    else:
+        with timer.stage('data'):
+            X_train, y_train = _X[train_index], _y[train_index]
+        info = fit_pipeline(pipeline, X_train, y_train, timer=timer)
+        with timer.stage('predict'):
+            y_pred = pipeline.predict(_X[val_index])
+    timings = {f"{name}_s": 0.0 for name in ('data', 'preprocess', 'fit', 'predict')}
+    timings.update(timer.seconds())
+    timings['train_samples_per_sec'] = len(train_index) / max(timer.totals['fit'], 1e-9)
+    timings['peak_rss_mb'] = peak_rss_mb()
+    return y_pred, info, timings
+
+
+def run_folds(pipeline, X, y, folds, n_jobs=None, cache=None):
+    """
+    Fit a fresh clone of `pipeline` on every (train_index, val_index) fold and
+    predict its validation rows. Folds run concurrently in a process pool with
+    the core budget partitioned by partition_threads; predictions are returned
+    in fold order so results do not depend on scheduling. With a
+    PreprocessCache over X, fitted preprocessors are reused from it.
+
+    Returns:
+        list: (y_pred, early_stopping_info, stage timings) per fold; timings hold
+        data / preprocess / fit / predict seconds, train samples/sec and the
+        peak RSS of the process that ran the fold
+    """
+    n_workers, n_threads = partition_threads(len(folds), n_jobs)
+    if n_workers == 1:
+        _init_worker(X, y, cache)
+        try:
+            return [_fit_predict(clone(pipeline), tr, va, n_threads) for tr, va in folds]
+        finally:
+            _init_worker(None, None, None)
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(X, y, cache)) as pool:
+        futures = [pool.submit(_fit_predict, clone(pipeline), tr, va, n_threads) for tr, va in folds]
+        return [f.result() for f in futures]
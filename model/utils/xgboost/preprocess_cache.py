@@ -0,0 +1,145 @@
+import os, hashlib
+import numpy as np
+import joblib
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+from model.models.xgboost.model import early_stopping_info
+from model.utils.telemetry import NULL_TIMER
+
+
+def array_key(a):
+    """Content digest of an array (dtype, shape and bytes)."""
+    a = np.ascontiguousarray(a)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{a.dtype.str}{a.shape}".encode())
+    digest.update(memoryview(a).cast('B'))
+    return digest.hexdigest()
+
+
+class PreprocessCache:
+    """
+    Memoizes fitted preprocessors and their outputs on one training matrix
+
+    Entries are keyed by the data hash, the preprocessor's parameters, the
+    row indices it was fit on and their labels, so every hyperparameter candidate that shares a
+    fold reuses the same fitted imputer/scaler and transformed matrices and only
+    the classifier is refit. Outputs are kept as float32, the precision XGBoost
+    trains on anyway. With `cache_dir`, entries are also written to disk and
+    shared between worker processes and later runs.
+
+    Args:
+        X: Full training matrix that fold indices refer to
+        cache_dir: Optional directory for on-disk entries
+        data_key: Precomputed array_key(X)
+    """
+    def __init__(self, X, cache_dir=None, data_key=None):
+        self.X = X
+        self.cache_dir = cache_dir
+        self.data_key = data_key or array_key(X)
+        self._fitted = {}
+        self._outputs = {}
+        self._origin = {}
+        self.hits = 0
+        self.misses = 0
+
+    def fitted(self, preprocessor, fit_index, y=None):
+        """Clone of `preprocessor` fit on X[fit_index], memoized."""
+        fit_index = np.asarray(fit_index, dtype=np.int64)
+        parts = [joblib.hash(clone(preprocessor)), array_key(fit_index)]
+        if y is not None:
+            # Supervised steps (e.g. the ewas CpGSelector) depend on the labels, which can change for the same X
+            parts.append(array_key(np.asarray(y)[fit_index]))
+        key = self._key(*parts)
+        if key in self._fitted:
+            self.hits += 1
+            return self._fitted[key]
+        path = self._path(key, '.pkl')
+        if path is not None and os.path.exists(path):
+            self.hits += 1
+            fitted = joblib.load(path)
+        else:
+            self.misses += 1
+            fitted = clone(preprocessor).fit(self.X[fit_index], None if y is None else y[fit_index])
+            if path is not None:
+                joblib.dump(fitted, path + '.tmp')
+                os.replace(path + '.tmp', path)
+        self._fitted[key] = fitted
+        self._origin[id(fitted)] = key
+        return fitted
+
+    def transform(self, preprocessor, fit_index, rows, y=None):
+        """X[rows] transformed by `preprocessor` fit on X[fit_index], memoized."""
+        return self.transform_fitted(self.fitted(preprocessor, fit_index, y), rows)
+
+    def transform_fitted(self, fitted, rows):
+        """X[rows] transformed by a preprocessor previously returned by fitted()."""
+        key = self._key(self._origin[id(fitted)], array_key(np.asarray(rows, dtype=np.int64)))
+        if key in self._outputs:
+            return self._outputs[key]
+        path = self._path(key, '.npy')
+        if path is not None and os.path.exists(path):
+            out = np.load(path, mmap_mode='r')
+        else:
+            out = np.asarray(fitted.transform(self.X[rows]), dtype=np.float32)
+            if path is not None:
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, out)
+                os.replace(path + '.tmp', path)
+        self._outputs[key] = out
+        return out
+
+    def clear(self):
+        self._fitted.clear()
+        self._outputs.clear()
+        self._origin.clear()
+
+    def _key(self, *parts):
+        return hashlib.blake2b('/'.join((self.data_key,) + parts).encode(), digest_size=16).hexdigest()
+
+    def _path(self, key, suffix):
+        if self.cache_dir is None:
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, key + suffix)
+
+
+def fit_cached(pipeline, cache, y, train_index, eval_fraction=0.1, random_state=42, timer=None):
+    """
+    fit_pipeline on cache.X[train_index] with the preprocessor taken from
+    `cache`; only the classifier is fit. The early-stopping hold-out is drawn
+    exactly as fit_pipeline draws it. The fitted preprocessor is placed back in
+    the pipeline, so pipeline.predict works as usual.
+
+    Returns:
+        dict: trees_built / best_iteration / trees_saved, or None without early stopping
+    """
+    timer = timer or NULL_TIMER
+    preprocessor = pipeline.named_steps['preprocessor']
+    classifier = pipeline.named_steps['classifier']
+    train_index = np.asarray(train_index)
+    early_stopping = classifier.get_params().get('early_stopping_rounds') is not None
+
+    if early_stopping:
+        fit_index, eval_index = train_test_split(
+            train_index, test_size=eval_fraction, stratify=y[train_index], random_state=random_state)
+    else:
+        fit_index = train_index
+
+    with timer.stage('preprocess'):
+        X_fit = cache.transform(preprocessor, fit_index, fit_index, y)
+        X_eval = cache.transform(preprocessor, fit_index, eval_index, y) if early_stopping else None
+    with timer.stage('fit'):
+        if early_stopping:
+            classifier.fit(X_fit, y[fit_index], eval_set=[(X_eval, y[eval_index])], verbose=False)
+        else:
+            classifier.fit(X_fit, y[fit_index])
+
+    pipeline.steps[0] = ('preprocessor', cache.fitted(preprocessor, fit_index, y))
+    return early_stopping_info(classifier) if early_stopping else None
+
+
+def predict_cached(pipeline, cache, rows):
+    """pipeline.predict(cache.X[rows]) for a pipeline fit by fit_cached, using the memoized transform."""
+    preprocessor = pipeline.named_steps['preprocessor']
+    return pipeline.named_steps['classifier'].predict(cache.transform_fitted(preprocessor, rows))
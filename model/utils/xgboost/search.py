@@ -0,0 +1,182 @@
+import os, json, math, hashlib
+import numpy as np
+import joblib
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+
+from model.utils.parallel import partition_threads
+from model.utils.metrics import confusion, classification_metrics
+from model.utils.xgboost.preprocess_cache import PreprocessCache, array_key, fit_cached, predict_cached
+
+# Training matrix and its PreprocessCache handed to each worker once by the pool initializer
+_X, _y, _cache = None, None, None
+
+
+def _init_worker(X, y, cache=None):
+    global _X, _y, _cache
+    _X, _y, _cache = X, y, cache
+
+
+def _run_trial(pipeline, params, rows, n_estimators, cv, scoring, n_threads, random_state):
+    """
+    Mean CV score of one configuration on a row subsample with a tree budget.
+    Folds are the same for every candidate, so the preprocessor fit per fold
+    comes from the worker's PreprocessCache and only the classifier is trained.
+    """
+    pipeline.set_params(**params, classifier__n_estimators=n_estimators, classifier__n_jobs=n_threads,
+                        classifier__early_stopping_rounds=None)
+    y = _y[rows]
+    num_classes = int(_y.max()) + 1
+    scores = []
+    for train_index, val_index in StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state).split(rows, y):
+        fit_cached(pipeline, _cache, _y, rows[train_index])
+        y_pred = predict_cached(pipeline, _cache, rows[val_index])
+        metrics = classification_metrics(confusion(y[val_index], y_pred, num_classes))
+        scores.append(metrics[scoring])
+    return float(np.mean(scores))
+
+
+class SuccessiveHalvingSearch:
+    """
+    Successive-halving hyperparameter search over an XGBoost pipeline
+
+    Every candidate starts on a small budget (few trees, a stratified fraction
+    of the rows); after each rung only the best 1/eta survive and the budget
+    grows by eta until the last rung trains `max_estimators` trees on all rows.
+    Trials of a rung run in parallel, and finished trials are appended to a
+    JSONL log so an interrupted search resumes where it stopped. Trial keys
+    include the data, the labels and the base pipeline, so a log shared with
+    a search on other inputs is never resumed from.
+
+    Args:
+        pipeline: Unfitted preprocessor -> classifier Pipeline
+        param_grid: Dict of pipeline parameter lists (e.g. 'classifier__max_depth')
+        max_estimators: Tree budget of the final rung (default: pipeline's n_estimators)
+        min_estimators: Tree budget of the first rung
+        min_samples_frac: Fraction of rows used in the first rung
+        eta: Halving rate
+        cv: Stratified folds per trial
+        scoring: Key of model.utils.metrics.classification_metrics to maximize
+        n_jobs: Cores shared between parallel trials and XGBoost threads
+        trial_log: Optional JSONL path used to record and resume trials
+        cache_dir: Optional directory for fitted preprocessors shared by trials
+    """
+    def __init__(self, pipeline, param_grid, max_estimators=None, min_estimators=10, min_samples_frac=0.25,
+                 eta=3, cv=3, scoring='recall_weighted', n_jobs=None, trial_log=None, cache_dir=None,
+                 random_state=42):
+        self.pipeline = pipeline
+        self.param_grid = param_grid
+        self.max_estimators = max_estimators or pipeline.get_params()['classifier__n_estimators']
+        self.min_estimators = min(min_estimators, self.max_estimators)
+        self.min_samples_frac = min_samples_frac
+        self.eta = eta
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.trial_log = trial_log
+        self.cache_dir = cache_dir
+        self.random_state = random_state
+        self._validate()
+
+    def _validate(self):
+        valid = set(self.pipeline.get_params())
+        unknown = sorted(name for name in self.param_grid if name not in valid)
+        if unknown:
+            classifier_params = sorted(name for name in valid if name.startswith('classifier__'))
+            raise ValueError(f"Unknown pipeline parameters {unknown}. Valid classifier parameters: {classifier_params}")
+        if 'classifier__n_estimators' in self.param_grid:
+            raise ValueError("classifier__n_estimators is the halving budget; set max_estimators instead")
+
+    def budgets(self):
+        """(n_estimators, sample_fraction) per rung."""
+        n_rungs = int(math.floor(math.log(self.max_estimators / self.min_estimators, self.eta))) + 1
+        rungs = []
+        for rung in range(n_rungs):
+            last = rung == n_rungs - 1
+            n_estimators = self.max_estimators if last else int(self.min_estimators * self.eta ** rung)
+            frac = 1.0 if last else min(1.0, self.min_samples_frac * self.eta ** rung)
+            rungs.append((n_estimators, frac))
+        return rungs
+
+    def fit(self, X, y):
+        candidates = list(ParameterGrid(self.param_grid))
+        # Scores only carry over to a search on the same matrix, labels and base pipeline (selector, stats, params)
+        self._inputs_key = '/'.join((array_key(X), array_key(y), joblib.hash(clone(self.pipeline))))
+        done = self._load_log()
+        self.results_ = []
+        survivors = list(range(len(candidates)))
+        cache = PreprocessCache(X, cache_dir=self.cache_dir)
+
+        for rung, (n_estimators, frac) in enumerate(self.budgets()):
+            rows = self._subsample(y, frac)
+            print(f"Rung {rung}: {len(survivors)} candidates, {n_estimators} trees, {len(rows)} samples")
+            pending = {}
+            scores = {}
+            for idx in survivors:
+                key = self._trial_key(candidates[idx], n_estimators, frac)
+                if key in done:
+                    scores[idx] = done[key]
+                else:
+                    pending[idx] = key
+
+            n_workers, n_threads = partition_threads(len(pending), self.n_jobs) if pending else (1, 1)
+            args = [(idx, (clone(self.pipeline), candidates[idx], rows, n_estimators, self.cv, self.scoring,
+                           n_threads, self.random_state)) for idx in pending]
+            if n_workers == 1:
+                _init_worker(X, y, cache)
+                try:
+                    for idx, trial in args:
+                        scores[idx] = self._record(pending[idx], candidates[idx], rung, n_estimators, frac, _run_trial(*trial))
+                finally:
+                    _init_worker(None, None, None)
+            elif args:
+                with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(X, y, cache)) as pool:
+                    futures = {idx: pool.submit(_run_trial, *trial) for idx, trial in args}
+                    for idx, future in futures.items():
+                        scores[idx] = self._record(pending[idx], candidates[idx], rung, n_estimators, frac, future.result())
+
+            for idx in survivors:
+                self.results_.append({'params': candidates[idx], 'rung': rung, 'n_estimators': n_estimators,
+                                      'sample_frac': frac, 'score': scores[idx]})
+            # Prune: keep the best 1/eta of this rung (stable on ties by candidate order)
+            ranked = sorted(survivors, key=lambda i: -scores[i])
+            survivors = ranked[:max(1, math.ceil(len(ranked) / self.eta))]
+
+        best = survivors[0]
+        self.best_params_ = candidates[best]
+        self.best_score_ = scores[best]
+        print(f"Best {self.scoring}: {self.best_score_:.4f} with {self.best_params_}")
+        return self
+
+    def _subsample(self, y, frac):
+        rows = np.arange(len(y))
+        if frac >= 1.0:
+            return rows
+        rows, _ = train_test_split(rows, train_size=frac, stratify=y, random_state=self.random_state)
+        return np.sort(rows)
+
+    def _trial_key(self, params, n_estimators, frac):
+        payload = json.dumps({'params': params, 'n_estimators': n_estimators, 'frac': frac, 'cv': self.cv,
+                              'scoring': self.scoring, 'seed': self.random_state, 'inputs': self._inputs_key},
+                             sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _load_log(self):
+        # Trials of other inputs stay in the log but never match a key of this search
+        done = {}
+        if self.trial_log and os.path.exists(self.trial_log):
+            with open(self.trial_log) as f:
+                for line in f:
+                    if line.strip():
+                        trial = json.loads(line)
+                        done[trial['key']] = trial['score']
+            print(f"Trial log {self.trial_log}: {len(done)} trials, reused where data, labels and pipeline match")
+        return done
+
+    def _record(self, key, params, rung, n_estimators, frac, score):
+        if self.trial_log:
+            with open(self.trial_log, 'a') as f:
+                f.write(json.dumps({'key': key, 'params': params, 'rung': rung, 'n_estimators': n_estimators,
+                                    'sample_frac': frac, 'score': score}, default=str) + '\n')
+        return score
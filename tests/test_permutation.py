@@ -0,0 +1,99 @@
+# Brute-force checks of the vectorized permutation null and the max-T / empirical FDR (run from the repo root: python -m pytest tests)
+import numpy as np
+import pytest
+from scipy.stats import rankdata
+
+from model.ewas.mannwhitney import mannwhitneyu_columns
+from model.ewas.permutation import (Z_BIN_WIDTH, Z_MAX, empirical_qvalues, mannwhitney_permutation_test, maxt_pvalues,
+                                    permutation_matrix)
+
+
+def _matrix(n_samples=40, n_cols=25, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n_samples, n_cols))
+    X[:, :5] += np.arange(n_samples)[:, None] % 2    # a few CpGs with a real group difference
+    X[:, 5] = np.round(X[:, 5], 1)                   # heavy ties
+    X[:, 6] = 0.5                                    # constant column
+    X[rng.random((n_samples, n_cols)) < 0.05] = np.nan
+    return X
+
+
+def _z_loop(X, group, alternative, use_continuity, nan_policy):
+    # One column at a time: rank the observed values, then the tie-corrected normal approximation
+    z = np.full(X.shape[1], np.nan)
+    for j in range(X.shape[1]):
+        observed = ~np.isnan(X[:, j])
+        if nan_policy == 'propagate' and not observed.all():
+            continue
+        x, g = X[observed, j], group[observed]
+        n1, n2 = g.sum(), (~g).sum()
+        if n1 == 0 or n2 == 0:
+            continue
+        n = n1 + n2
+        U1 = rankdata(x)[g].sum() - n1 * (n1 + 1) / 2
+        U = {'greater': U1, 'less': n1 * n2 - U1, 'two-sided': max(U1, n1 * n2 - U1)}[alternative]
+        _, t = np.unique(x, return_counts=True)
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - (t ** 3 - t).sum() / (n * (n - 1))))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z[j] = (U - n1 * n2 / 2 - (0.5 if use_continuity else 0.0)) / sigma
+    return z
+
+
+@pytest.mark.parametrize('alternative', ['two-sided', 'greater'])
+@pytest.mark.parametrize('nan_policy', ['propagate', 'omit'])
+def test_null_matches_permutation_loop(alternative, nan_policy):
+    X = _matrix()
+    group = np.arange(len(X)) % 2 == 0
+    permutations = permutation_matrix(group, n_perm=50, seed=1)
+    result = mannwhitney_permutation_test(X, group, permutations, alternative=alternative, nan_policy=nan_policy,
+                                          perm_batch=16)
+
+    U, p = mannwhitneyu_columns(X, group, alternative=alternative, nan_policy=nan_policy)
+    np.testing.assert_array_equal(result['statistic'], U)
+    np.testing.assert_array_equal(result['p_value'], p)
+    np.testing.assert_allclose(result['z'], _z_loop(X, group, alternative, True, nan_policy), rtol=1e-12,
+                               equal_nan=True)
+
+    null_z = np.stack([_z_loop(X, permutations[:, k].astype(bool), alternative, True, nan_policy)
+                       for k in range(permutations.shape[1])])
+    np.testing.assert_allclose(result['null_max'], np.nanmax(null_z, axis=1), rtol=1e-12)
+    finite = null_z[np.isfinite(null_z)]
+    bins = np.clip(np.floor(finite / Z_BIN_WIDTH), 0, Z_MAX / Z_BIN_WIDTH).astype(np.int64)
+    np.testing.assert_array_equal(result['null_hist'], np.bincount(bins, minlength=len(result['null_hist'])))
+
+
+def test_null_merges_across_blocks():
+    X = _matrix()
+    group = np.arange(len(X)) % 3 == 0
+    permutations = permutation_matrix(group, n_perm=30, seed=2)
+    full = mannwhitney_permutation_test(X, group, permutations, nan_policy='omit')
+    parts = [mannwhitney_permutation_test(X[:, columns], group, permutations, nan_policy='omit')
+             for columns in (slice(0, 10), slice(10, None))]
+    np.testing.assert_array_equal(full['null_max'], np.fmax(parts[0]['null_max'], parts[1]['null_max']))
+    np.testing.assert_array_equal(full['null_hist'], parts[0]['null_hist'] + parts[1]['null_hist'])
+
+
+def test_maxt_and_qvalues_match_loops():
+    X = _matrix(n_cols=40, seed=3)
+    group = np.arange(len(X)) % 2 == 0
+    n_perm = 40
+    result = mannwhitney_permutation_test(X, group, permutation_matrix(group, n_perm=n_perm, seed=3),
+                                          nan_policy='omit')
+    z, null_max, null_hist = result['z'], result['null_max'], result['null_hist']
+
+    p_maxt = maxt_pvalues(z, null_max)
+    q = empirical_qvalues(z, null_hist, n_perm)
+    finite = np.isfinite(z)
+    expected_p = np.full(len(z), np.nan)
+    fdr = np.full(len(z), np.nan)
+    for i in np.flatnonzero(finite):
+        expected_p[i] = (1 + (null_max >= z[i]).sum()) / (n_perm + 1)
+        null_above = null_hist[int(max(0, np.floor(z[i] / Z_BIN_WIDTH))):].sum() / n_perm
+        fdr[i] = min(null_above / (z[finite] >= z[i]).sum(), 1.0)
+    expected_q = np.full(len(z), np.nan)
+    for i in np.flatnonzero(finite):
+        expected_q[i] = fdr[finite & (z <= z[i])].min()
+
+    np.testing.assert_allclose(p_maxt, expected_p, rtol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(q, expected_q, rtol=1e-12, equal_nan=True)
+    assert np.nanmin(q[:5]) < np.nanmin(q[5:])       # the shifted CpGs rank first
@@ -0,0 +1,103 @@
+# statsmodels OLS parity of the block-solved regression EWAS (run from the repo root: python -m pytest tests)
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from model.ewas.regression import (LinearModel, contrast_matrix, design_matrix, linear_contrasts_test, linear_test,
+                                   state_design_matrix)
+
+
+def _samples(n_samples=80, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'disease_state': rng.choice(['control', 'mci', 'ad'], n_samples),
+        'age': rng.normal(70, 8, n_samples),
+        'sex': rng.choice(['F', 'M'], n_samples),
+        'series_id': rng.choice(['GSE1', 'GSE2', 'GSE3'], n_samples),
+    })
+
+
+def _matrix(n_samples=80, n_cols=30, seed=0):
+    rng = np.random.default_rng(seed)
+    Y = rng.random((n_samples, n_cols))
+    Y[rng.random((n_samples, n_cols)) < 0.05] = np.nan
+    Y[:10, 5] = np.nan                  # two columns sharing one missingness pattern
+    Y[:10, 6] = np.nan
+    Y[:, 7] = np.nan                    # all-NaN column
+    Y[3:, 8] = np.nan                   # fewer observed samples than terms
+    return Y
+
+
+def _statsmodels(design, Y, L=None):
+    # Per-column reference fit on the observed samples of each CpG
+    out = np.full((4, design.shape[1] if L is None else len(L), Y.shape[1]), np.nan)
+    for j in range(Y.shape[1]):
+        observed = ~np.isnan(Y[:, j])
+        if observed.sum() <= design.shape[1]:
+            continue
+        fit = sm.OLS(Y[observed, j], design[observed]).fit()
+        if L is None:
+            out[:, :, j] = fit.params, fit.bse, fit.tvalues, fit.pvalues
+        else:
+            test = fit.t_test(L)
+            out[:, :, j] = (test.effect, np.ravel(test.sd), np.ravel(test.tvalue), np.ravel(test.pvalue))
+    return out
+
+
+def test_fit_matches_statsmodels():
+    samples = _samples()
+    design, names = design_matrix(samples, samples['disease_state'] != 'control')
+    Y = _matrix()
+    result = LinearModel(design, names).fit(Y)
+    expected = _statsmodels(design, Y)
+    for values, reference in zip(result, expected):
+        np.testing.assert_array_equal(np.isnan(values), np.isnan(reference))
+        np.testing.assert_allclose(values, reference, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def test_contrasts_match_statsmodels():
+    samples = _samples(n_samples=90, seed=1)
+    design, names = state_design_matrix(samples)
+    pairs = [('mci', 'control'), ('ad', 'control'), ('ad', 'mci')]
+    L = contrast_matrix(names, pairs)
+    Y = _matrix(n_samples=90, seed=1)
+    result = LinearModel(design, names).fit(Y, contrasts=L)
+    expected = _statsmodels(design, Y, L)
+    for values, reference in zip(result, expected):
+        np.testing.assert_allclose(values, reference, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+    block = linear_contrasts_test(Y, LinearModel(design, names), L, ['mci_vs_control', 'ad_vs_control', 'ad_vs_mci'])
+    np.testing.assert_allclose(block['ad_vs_mci::p_value'], expected[3, 2], rtol=1e-9, equal_nan=True)
+
+
+def test_linear_test_reports_the_status_term():
+    samples = _samples()
+    design, names = design_matrix(samples, samples['disease_state'] == 'ad')
+    Y = _matrix()
+    result = linear_test(Y, LinearModel(design, names), all_terms=True)
+    expected = _statsmodels(design, Y)
+    np.testing.assert_allclose(result['coef'], expected[0, 1], rtol=1e-9, atol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(result['p_value'], expected[3, 1], rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(result['p_age'], expected[3, names.index('age')], rtol=1e-9, equal_nan=True)
+
+
+def test_design_matrix_terms():
+    samples = _samples()
+    samples['series_id'] = 'GSE1'
+    design, names = design_matrix(samples, samples['disease_state'] != 'control')
+    assert names == ['intercept', 'status', 'age', 'sex_M']       # constant batch dummies dropped
+    assert design.shape == (len(samples), 4)
+    with pytest.raises(ValueError):
+        design_matrix(samples, samples['disease_state'] != 'control', covariates=('bmi',))
+    samples.loc[0, 'age'] = np.nan
+    with pytest.raises(ValueError):
+        design_matrix(samples, samples['disease_state'] != 'control')
+
+
+def test_rank_deficient_design():
+    design = np.column_stack([np.ones(10), np.arange(10.0), 2 * np.arange(10.0)])
+    with pytest.raises(ValueError):
+        LinearModel(design)
+    with pytest.raises(ValueError):
+        contrast_matrix(['intercept', 'state_ad'], [('mci', 'control')])
@@ -0,0 +1,95 @@
+# ResultStore queries against pandas filtering of the same table, HDF5 and Zarr (run from the repo root: python -m pytest tests)
+import numpy as np
+import pandas as pd
+import pytest
+
+from model.ewas.store import ResultStore, annotate_results, write_result_store
+
+
+def _results(n_cpgs=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"cg{i:08d}" for i in range(n_cpgs)])
+    p = rng.random(n_cpgs) ** 3
+    p[rng.random(n_cpgs) < 0.02] = np.nan
+    p[:3] = 0.0                                             # underflowed p-values
+    results = pd.DataFrame({'CpG_Index': np.arange(n_cpgs), 'IlmnID': ids, 'statistic': rng.normal(size=n_cpgs),
+                            'p_value': p})
+    # Annotation CHR columns mix ints and strings; positions repeat so bounds hit ties
+    chromosomes = rng.choice(np.array([1, '1', 2, '10', 'X', 'Y'], dtype=object), n_cpgs)
+    annotation = pd.DataFrame({'IlmnID': ids, 'CHR': chromosomes, 'MAPINFO': rng.integers(0, 500, n_cpgs) * 1000})
+    annotation.loc[::97, 'MAPINFO'] = np.nan                # unmapped CpGs are dropped
+    return annotate_results(results, annotation)
+
+
+@pytest.fixture(params=['h5', 'zarr'])
+def store(request, tmp_path):
+    if request.param == 'zarr':
+        pytest.importorskip('zarr')
+    table = _results()
+    path = str(tmp_path / f"results.{request.param}")
+    # Small chunks so queries cross chunk boundaries
+    assert write_result_store(path, table, chunk_rows=128) == len(table)
+    return ResultStore(path), table
+
+
+def _by_p(table):
+    return table.sort_values('p_value', kind='stable')
+
+
+def _assert_rows(result, expected):
+    expected = expected.rename_axis('row')
+    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+
+
+def test_table_is_position_sorted(store):
+    store, table = store
+    assert len(store) == len(table)
+    assert store.chromosomes == ['1', '2', '10', 'X', 'Y']
+    _assert_rows(store.table(), table)
+
+
+@pytest.mark.parametrize('k', [0, 1, 3, 130, 10_000])
+def test_top_k(store, k):
+    store, table = store
+    _assert_rows(store.top_k(k), _by_p(table).head(k))
+
+
+@pytest.mark.parametrize('max_p', [0.0, 1e-6, 0.01, 0.3, 1.0])
+def test_threshold_max_p(store, max_p):
+    store, table = store
+    _assert_rows(store.threshold(max_p=max_p), _by_p(table[table['p_value'] <= max_p]))
+
+
+@pytest.mark.parametrize('min_log10_p', [0.0, 2.0, 6.0, 400.0])
+def test_threshold_min_log10_p(store, min_log10_p):
+    store, table = store
+    _assert_rows(store.threshold(min_log10_p=min_log10_p), _by_p(table[table['-log10_p'] >= min_log10_p]))
+
+
+def test_threshold_arguments(store):
+    store, _ = store
+    with pytest.raises(ValueError):
+        store.threshold()
+    with pytest.raises(ValueError):
+        store.threshold(max_p=0.01, min_log10_p=2)
+
+
+@pytest.mark.parametrize('chrom, start, end', [
+    ('1', None, None), (1, 100_000, 200_000), ('10', 0, 0), ('X', 250_000, None), ('Y', None, 3000),
+    ('2', 499_000, 10**9), ('2', 300_000, 200_000), ('MT', None, None),
+])
+def test_region(store, chrom, start, end):
+    store, table = store
+    mask = table['CHR'] == str(chrom)
+    if start is not None:
+        mask &= table['MAPINFO'] >= start
+    if end is not None:
+        mask &= table['MAPINFO'] <= end
+    _assert_rows(store.region(chrom, start, end), table[mask])
+
+
+def test_column_selection(store):
+    store, table = store
+    result = store.top_k(20, columns=['IlmnID', 'p_value'])
+    assert list(result.columns) == ['IlmnID', 'p_value']
+    _assert_rows(result, _by_p(table).head(20))